@@ -1,8 +1,11 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from networkx import DiGraph
+from networkx.readwrite import json_graph
+import numpy as np
 from typing import List, Optional, Tuple
 
 PARALLEL_MACHINES = 'parallel_machines'
+MACHINE = "machine"
 NODES = "nodes"
 LINKS = "links"
 START_NODE = "start"
@@ -15,21 +18,187 @@ class Operation:
 
 
 @dataclass
+class JobLinks:
+    """
+    Links of a scheduled job as typed arrays, one entry per operation slice: the nodes it runs between, its
+    duration, its machine and its parallel group within the job.  It holds everything the DiGraph of the job is
+    made of, so the graph is only built when it is needed.
+    """
+    nodes: List[str]
+    sources: List[str]
+    targets: List[str]
+    weights: np.ndarray
+    machine_ids: np.ndarray
+    group_ids: np.ndarray
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, JobLinks):
+            return NotImplemented
+
+        return (self.nodes == other.nodes
+                and self.sources == other.sources
+                and self.targets == other.targets
+                and np.array_equal(self.weights, other.weights)
+                and np.array_equal(self.machine_ids, other.machine_ids)
+                and np.array_equal(self.group_ids, other.group_ids))
+
+    def to_graph(self) -> DiGraph:
+        links = []
+
+        for group_id in np.unique(self.group_ids).tolist():
+            slices = np.flatnonzero(self.group_ids == group_id).tolist()
+            parallel_machines = [(self.sources[i], self.targets[i]) for i in slices]
+
+            for i in slices:
+                links.append({"source": self.sources[i],
+                              "target": self.targets[i],
+                              "weight": int(self.weights[i]),
+                              MACHINE: int(self.machine_ids[i]),
+                              PARALLEL_MACHINES: parallel_machines})
+
+        return json_graph.node_link_graph({"directed": True,
+                                           NODES: [{"id": node} for node in self.nodes],
+                                           LINKS: links},
+                                          directed=True)
+
+
+@dataclass(init=False)
 class Job:
+    """
+    A scheduled job.  A job scheduled without graphs only holds its links, and its operations DiGraph is built from
+    them the first time it is read.
+    """
     id: int
-    operations: DiGraph
+    links: Optional[JobLinks] = None
+    _operations: Optional[DiGraph] = field(default=None, repr=False)
+
+    def __init__(self, id: int, operations: Optional[DiGraph] = None, links: Optional[JobLinks] = None):
+        self.id = id
+        self.links = links
+        self.operations = operations
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Job):
+            return NotImplemented
+
+        if self.links is not None or other.links is not None:
+            # the operations of a job with links are built from them, whether they were read yet or not
+            return self.id == other.id and self.links == other.links
+
+        return self.id == other.id and self._operations == other._operations
+
+    @property
+    def operations(self) -> Optional[DiGraph]:
+        if self._operations is None and self.links is not None:
+            self._operations = self.links.to_graph()
+
+        return self._operations
+
+    @operations.setter
+    def operations(self, operations: Optional[DiGraph]) -> None:
+        self._operations = operations
+
+    def get_operations(self) -> DiGraph:
+        return self.operations
+
+
+@dataclass
+class CompiledSchedule:
+    """
+    Flat arrays of a schedule, one entry per operation slice: its duration, the machine it runs on (-1 if unknown)
+    and its parallel group.  The slices of a group run side by side on the machines, and the groups run one after
+    the other, so the makespan is the sum over the groups of their longest slice.  group_offsets holds the index of
+    the first slice of each group, and job_positions the position in the schedule of the job of each slice.
+    """
+    durations: np.ndarray
+    machine_ids: np.ndarray
+    group_ids: np.ndarray
+    group_offsets: np.ndarray
+    job_positions: np.ndarray
+    number_of_jobs: int
+
+    def compute_makespan(self) -> int:
+        if len(self.durations) == 0:
+            return 0
+
+        return int(np.maximum.reduceat(self.durations, self.group_offsets).sum())
+
+    @staticmethod
+    def compile_jobs(jobs: List[Job]) -> "CompiledSchedule":
+        durations = []
+        machine_ids = []
+        group_ids = []
+        job_positions = []
+        number_of_groups = 0
+
+        for job_position, job in enumerate(jobs):
+            if job.links is not None:
+                # Graph-free jobs already hold one entry per slice, with their groups numbered from 0
+                durations.extend(job.links.weights.tolist())
+                machine_ids.extend(job.links.machine_ids.tolist())
+                group_ids.extend((job.links.group_ids + number_of_groups).tolist())
+                job_positions.extend([job_position] * len(job.links.weights))
+                number_of_groups += len(np.unique(job.links.group_ids))
+                continue
+
+            operations = job.operations
+            nodes_counted = set()
+
+            # Each parallel group is counted once, at the first link that carries it
+            for _, _, machine in operations.edges(data=True):
+                if PARALLEL_MACHINES in machine.keys():
+                    number_of_slices = len(durations)
+
+                    for parallel_op in machine[PARALLEL_MACHINES]:
+                        if parallel_op not in nodes_counted:
+                            nodes_counted.add(parallel_op)
+                            operation = Schedule.get_operation_data(operations, parallel_op)
+
+                            durations.append(operation['weight'])
+                            machine_ids.append(operation.get(MACHINE, -1))
+                            group_ids.append(number_of_groups)
+                            job_positions.append(job_position)
+
+                    if len(durations) > number_of_slices:
+                        number_of_groups += 1
+
+        group_ids = np.array(group_ids, dtype=np.int64)
+
+        return CompiledSchedule(durations=np.array(durations, dtype=np.int64),
+                                machine_ids=np.array(machine_ids, dtype=np.int64),
+                                group_ids=group_ids,
+                                group_offsets=np.flatnonzero(np.diff(group_ids, prepend=-1)),
+                                job_positions=np.array(job_positions, dtype=np.int64),
+                                number_of_jobs=len(jobs))
 
 
 @dataclass
 class Schedule:
     jobs: Optional[List[Job]]
     debug: bool = False
+    _compiled_schedule: Optional[CompiledSchedule] = field(default=None, init=False, repr=False, compare=False)
+
+    def compile(self) -> CompiledSchedule:
+        """
+        Compiles the schedule into flat arrays once, so its makespan is a single reduction instead of a walk over
+        the links of every job.  The jobs must not change after the schedule is compiled.
+
+        Returns:
+        compiled_schedule: Duration, machine and parallel group of each operation slice
+        """
+        if self._compiled_schedule is None:
+            self._compiled_schedule = CompiledSchedule.compile_jobs(self.jobs)
+
+        return self._compiled_schedule
 
     def compute_makespan(self) -> int:
+        if not self.debug:
+            return self.compile().compute_makespan()
+
         make_span = 0
 
         for job in self.jobs:
-            operations = job.operations
+            operations = job.get_operations()
             nodes_counted: Tuple[str, str] = []
 
             for source_operation, destination_operation, machine in operations.edges(data=True):
@@ -54,15 +223,22 @@ class Schedule:
 
         for parallel_op in parallel_machines:
             if parallel_op not in nodes_counted:
-                operation = operations.get_edge_data(parallel_op[0], parallel_op[1])
+                operation = Schedule.get_operation_data(operations, parallel_op)
                 nodes_counted.append(parallel_op)
-                ops_times.append(operation[0]['weight'])
+                ops_times.append(operation['weight'])
 
         if len(ops_times) > 0:
             return max(ops_times)
         else:
             return 0
 
+    @staticmethod
+    def get_operation_data(operations: DiGraph, parallel_op: Tuple[str, str]) -> dict:
+        operation = operations.get_edge_data(parallel_op[0], parallel_op[1])
+
+        # Schedules loaded from node-link data are multigraphs, whose edge data is keyed by edge
+        return operation[0] if operations.is_multigraph() else operation
+
 
 @dataclass
 class Machine:
@@ -76,9 +252,38 @@ class ScheduledJob:
     operations: List[Operation]
 
 
+class JobPermutation:
+    """
+    Order of the scheduled jobs as an array of indices into the job list, so a neighbor move swaps two entries in
+    place and a rejected move is rolled back by swapping them again, without copying any job.
+    """
+    __slots__ = ("scheduled_jobs", "order")
+
+    def __init__(self, scheduled_jobs: List[ScheduledJob]):
+        self.scheduled_jobs = scheduled_jobs
+        self.order = np.arange(len(scheduled_jobs))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, position: int) -> ScheduledJob:
+        return self.scheduled_jobs[self.order[position]]
+
+    def apply_move(self, current_position: int, next_position: int) -> None:
+        self.order[current_position], self.order[next_position] = self.order[next_position], self.order[current_position]
+
+    def undo_move(self, current_position: int, next_position: int) -> None:
+        # A swap is its own inverse
+        self.apply_move(current_position, next_position)
+
+    def to_list(self) -> List[ScheduledJob]:
+        return [self.scheduled_jobs[index] for index in self.order.tolist()]
+
+
 @dataclass(frozen=True)
 class Link:
     source: str
     target: str
     weight: int
+    machine_id: int = -1
 
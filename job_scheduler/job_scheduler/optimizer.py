@@ -1,13 +1,15 @@
-import copy
+import logging
 import math
 import matplotlib.pyplot as plt
 import numpy as np
 import random
-from typing import List
+from typing import List, Optional, Tuple
 
-from job_scheduler.model import Schedule, ScheduledJob
+from job_scheduler.model import JobPermutation, Schedule, ScheduledJob
 from job_scheduler.scheduler import JobScheduler
 
+logger = logging.getLogger(__name__)
+
 
 class ScheduleOptimizer:
     def __init__(self,
@@ -15,17 +17,22 @@ class ScheduleOptimizer:
                  num_of_machines: int,
                  num_ops_per_machine: int,
                  temperature: int = 1000,
-                 schedule_iterations: int = 400):
+                 schedule_iterations: int = 400,
+                 delta_evaluation: bool = False,
+                 consistency_check_interval: int = 0):
         self.num_of_machines = num_of_machines
         self.num_ops_per_machine = num_ops_per_machine
         self.scheduled_jobs = scheduled_jobs
         self.schedule = self._generate_schedule(self.scheduled_jobs)
-        self._current_schedule = copy.deepcopy(self.schedule)
-        self._next_schedule = copy.deepcopy(self.scheduled_jobs)
-        self._current_scheduled_jobs = copy.deepcopy(self.scheduled_jobs)
-        self._next_scheduled_jobs = copy.deepcopy(self.scheduled_jobs)
+
+        # Schedules are never changed once generated, so the current and next schedules can share them
+        self._current_schedule = self.schedule
+        self._next_schedule = self.schedule
+        self._current_scheduled_jobs = JobPermutation(self.scheduled_jobs)
         self.schedule_iterations = schedule_iterations
         self.temperature = temperature
+        self.delta_evaluation = delta_evaluation
+        self.consistency_check_interval = consistency_check_interval
         self._probability_time_series = []
         self._makespan_time_series = []
 
@@ -34,9 +41,12 @@ class ScheduleOptimizer:
                                      num_ops_per_machine=self.num_ops_per_machine,
                                      scheduled_jobs=scheduled_jobs)
 
-        return job_scheduler.generate_schedule()
+        return job_scheduler.generate_schedule(materialize_graphs=False)
 
     def optimize(self) -> int:
+        if self.delta_evaluation:
+            return self._optimize_with_deltas()
+
         self._probability_time_series = []
         self._makespan_time_series = []
 
@@ -64,43 +74,103 @@ class ScheduleOptimizer:
 
         return self._current_schedule.compute_makespan()
 
-    def _successor(self) -> None:
-        # Get Random job
+    def _optimize_with_deltas(self) -> int:
+        """
+        Runs the same annealing as optimize without generating the next schedule of each move.  The slices and
+        parallel groups of a job only depend on its own operations, so swapping two jobs, the only move _successor
+        makes, moves their makespans with them, and every next schedule has the makespan of the initial one.  As in
+        optimize, every move is made from the initial order of the jobs, so the current schedule is the initial one
+        with the last accepted move made.  Every consistency_check_interval iterations the current schedule is
+        generated and evaluated in full, and the makespan is reset from it if it drifted.
+
+        Returns:
+        makespan: Makespan of the optimized schedule
+        """
+        self._probability_time_series = []
+        self._makespan_time_series = []
+
+        initial_makespan = self._current_schedule.compute_makespan()
+        makespan = initial_makespan
+        accepted_move: Optional[Tuple[int, int]] = None
+        self._makespan_time_series.append(makespan)
+
+        for i in range(1, self.schedule_iterations):
+            move = self._get_random_move()
+            delta_E = makespan - initial_makespan
+
+            self._makespan_time_series.append(makespan)
+
+            if delta_E > 0:
+                makespan -= delta_E
+                accepted_move = move
+                boltzmann_distributon = 0
+            else:
+                r = random.random()
+                boltzmann_distributon = math.exp(delta_E/self.temperature)
+
+                if boltzmann_distributon <= r:
+                    makespan -= delta_E
+                    accepted_move = move
+                    self._makespan_time_series[i] = makespan
+
+            self._probability_time_series.append(boltzmann_distributon)
+            self.temperature *= 0.99
+
+            if self.consistency_check_interval and i % self.consistency_check_interval == 0:
+                makespan = self._check_makespan(makespan, accepted_move)
+
+        self._current_schedule = self._generate_schedule(self._get_moved_scheduled_jobs(accepted_move))
+
+        return makespan
+
+    def _get_moved_scheduled_jobs(self, move: Optional[Tuple[int, int]]) -> List[ScheduledJob]:
+        # Jobs in their initial order with the move made, leaving the permutation in the initial order
+        if move is None:
+            return self._current_scheduled_jobs.to_list()
+
+        self._current_scheduled_jobs.apply_move(*move)
+        scheduled_jobs = self._current_scheduled_jobs.to_list()
+        self._current_scheduled_jobs.undo_move(*move)
+
+        return scheduled_jobs
+
+    def _check_makespan(self, makespan: int, accepted_move: Optional[Tuple[int, int]]) -> int:
+        full_makespan = self._generate_schedule(self._get_moved_scheduled_jobs(accepted_move)).compute_makespan()
+
+        if makespan != full_makespan:
+            logger.warning(f"Makespan drifted from the full evaluation: {makespan} != {full_makespan}")
+
+        return full_makespan
+
+    def _get_random_move(self) -> Tuple[int, int]:
         current_job_scheduled = self._get_random_job()
         next_job_scheduled = self._get_random_job()
 
         while next_job_scheduled == current_job_scheduled:
             next_job_scheduled = self._get_random_job()
 
-        current_job = self._current_scheduled_jobs[current_job_scheduled]
-        next_job = self._current_scheduled_jobs[next_job_scheduled]
+        # Two different operations of the first job are drawn but not moved, so a seed gives the same sequence of
+        # moves as before.  A job with fewer than two operations has no pair to draw
+        current_job = self.scheduled_jobs[current_job_scheduled]
 
-        self._next_scheduled_jobs = copy.deepcopy(self._current_scheduled_jobs)
+        if len(current_job.operations) > 1:
+            current_operation_scheduled = self._get_random_operation(current_job)
+            next_operation_scheduled = self._get_random_operation(current_job)
 
-        # Get Random operation
-        job_id_index = current_job.job_id - 1
-        current_operation_scheduled = self._get_random_operation(job_id_index)
-        next_operation_scheduled = self._get_random_operation(job_id_index)
+            while next_operation_scheduled == current_operation_scheduled:
+                next_operation_scheduled = self._get_random_operation(current_job)
 
-        while next_operation_scheduled == current_operation_scheduled:
-            next_operation_scheduled = self._get_random_operation(job_id_index)
+        return current_job_scheduled, next_job_scheduled
 
-        current_operation = self._current_scheduled_jobs[job_id_index].operations[current_operation_scheduled]
-        next_operation = self._current_scheduled_jobs[job_id_index].operations[next_operation_scheduled]
-
-        self._next_scheduled_jobs[next_job_scheduled].operations[next_operation_scheduled] = next_operation
-        self._next_scheduled_jobs[current_job_scheduled].operations[next_operation_scheduled] = current_operation
-
-        self._next_scheduled_jobs[current_job_scheduled] = next_job
-        self._next_scheduled_jobs[next_job_scheduled] = current_job
-
-        self._next_schedule = self._generate_schedule(self._next_scheduled_jobs)
+    def _successor(self) -> None:
+        # The next schedule swaps two random jobs of the initial order, whether or not earlier moves were accepted
+        self._next_schedule = self._generate_schedule(self._get_moved_scheduled_jobs(self._get_random_move()))
 
     def _get_random_job(self):
         return random.randint(0, len(self._current_scheduled_jobs) - 1)
 
-    def _get_random_operation(self, job_id_index: int):
-        return random.randint(0, len(self._current_scheduled_jobs[job_id_index].operations) - 1)
+    def _get_random_operation(self, scheduled_job: ScheduledJob):
+        return random.randint(0, len(scheduled_job.operations) - 1)
 
     def compute_makespan(self):
         return self._current_schedule.compute_makespan() - self._next_schedule.compute_makespan()
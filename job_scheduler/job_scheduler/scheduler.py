@@ -1,14 +1,16 @@
+from collections import deque
 import logging
 import random
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 from networkx import DiGraph
 from networkx.readwrite import json_graph
 import sys
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Deque, Dict, List, Set, Tuple, Union
 
-from job_scheduler.model import Job, Link, LINKS, NODES, PARALLEL_MACHINES, Operation, Schedule, ScheduledJob, START_NODE
+from job_scheduler.model import Job, JobLinks, Link, LINKS, MACHINE, NODES, PARALLEL_MACHINES, Operation, Schedule, ScheduledJob, START_NODE
 
 logger = logging.getLogger(__name__)
 FORMAT = "%(asctime)s %(levelname)s %(message)s"
@@ -38,7 +40,6 @@ class JobScheduler:
         for job_id in range(1, num_of_jobs + 2):
             operations = []
             for operation_num in range(1, num_of_operations_per_job + 1):
-                Operation(id=1, time=3)
                 operations.append(Operation(id=operation_num, time=random.choice(range(5, 51))))
 
             job = ScheduledJob(job_id=job_id, operations=operations)
@@ -47,36 +48,59 @@ class JobScheduler:
         return scheduled_jobs
 
     def _init_job_allocations(self):
-        self.job_allocations = {}
+        # Remaining time of each operation, one row per job and one column per operation id, with 0 for the
+        # operations a job does not have, and the remaining time of each job kept alongside
+        self._job_rows = {scheduled_job.job_id: row for row, scheduled_job in enumerate(self.scheduled_jobs)}
+        number_of_operation_ids = max((operation.id for scheduled_job in self.scheduled_jobs
+                                       for operation in scheduled_job.operations), default=0) + 1
+        self.job_allocations = np.zeros((len(self.scheduled_jobs), number_of_operation_ids), dtype=np.int64)
 
         for scheduled_job in self.scheduled_jobs:
             for operation in scheduled_job.operations:
-                if scheduled_job.job_id not in self.job_allocations.keys():
-                    self.job_allocations[scheduled_job.job_id] = {}
+                self.job_allocations[self._job_rows[scheduled_job.job_id], operation.id] = operation.time
 
-                self.job_allocations[scheduled_job.job_id][operation.id] = operation.time
+        self._remaining_times = self.job_allocations.sum(axis=1)
 
-    def generate_schedule(self) -> Schedule:
+    def generate_schedule(self, materialize_graphs: bool = True) -> Schedule:
+        """
+        Schedules every job in order on the machines.
+
+        Parameters:
+        materialize_graphs: Build the DiGraph of each job, otherwise each job only holds its links as arrays and
+                            its graph is built the first time Job.operations is read
+
+        Returns:
+        schedule: Scheduled jobs
+        """
         logging.debug("\nProcessing schedule")
         jobs = []
 
         for scheduled_job in self.scheduled_jobs:
-            jobs.append(Job(id=scheduled_job.job_id, operations=self._schedule_job(scheduled_job)))
+            if materialize_graphs:
+                jobs.append(Job(id=scheduled_job.job_id, operations=self._schedule_job(scheduled_job)))
+            else:
+                jobs.append(Job(id=scheduled_job.job_id,
+                                operations=None,
+                                links=self._schedule_job(scheduled_job, materialize_graph=False)))
 
         return Schedule(jobs=jobs)
 
     def _schedule_job(self,
-                      scheduled_job: ScheduledJob) -> Dict[str, Any]:
+                      scheduled_job: ScheduledJob,
+                      materialize_graph: bool = True) -> Union[DiGraph, JobLinks]:
         job = {"directed": True}
 
         temp_nodes: Set[str] = set()
         links = []
         nodes = []
-        j = 0
+        job_links = {"sources": [], "targets": [], "weights": [], "machine_ids": [], "group_ids": []}
+        number_of_groups = 0
+        is_debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
         operation_job_id = 1
         machine_source: Dict[int, str] = {}
         last_node_processed = None
-        operation_ids = [operation_id for operation_id in range(1, len(scheduled_job.operations) + 1)]
+        job_row = self._job_rows[scheduled_job.job_id]
+        operation_ids = deque(range(1, len(scheduled_job.operations) + 1))
 
         while not self._is_job_fully_executed(scheduled_job.job_id):
             temp_links: Set[Link] = set()
@@ -104,7 +128,9 @@ class JobScheduler:
                                 break  # No more operations to process
 
                         if not self._is_job_fully_executed(scheduled_job.job_id):
-                            logging.debug(f"Processing -> machine: {machine_id}, Job: {scheduled_job.job_id}, Operation: {operation_id}, Elapsed time before processing: {self.job_allocations[scheduled_job.job_id][operation_id]}")
+                            if is_debug_enabled:
+                                logging.debug("Processing -> machine: %s, Job: %s, Operation: %s, Elapsed time before processing: %s",
+                                              machine_id, scheduled_job.job_id, operation_id, self.job_allocations[job_row, operation_id])
 
                             machine_source[machine_id] = self.source_job
                             node_id = self.get_node_id(scheduled_job.job_id, machine_id, operation_job_id)
@@ -121,17 +147,40 @@ class JobScheduler:
                             operation_ids.append(operation_id)
                             operation_job_id += 1
 
-                            logging.debug(f"Parallel Job: {operation} -> {parallel_machines}")
-                            logging.debug(f"Temp Link: {temp_links}")
-                            logging.debug(f"Processing -> machine: {machine_id}, Job: {scheduled_job.job_id}, Operation: {operation_id}, Elapsed time after processing: {self.job_allocations[scheduled_job.job_id][operation_id]}")
+                            if is_debug_enabled:
+                                logging.debug("Parallel Job: %s -> %s", operation, parallel_machines)
+                                logging.debug("Temp Link: %s", temp_links)
+                                logging.debug("Processing -> machine: %s, Job: %s, Operation: %s, Elapsed time after processing: %s",
+                                              machine_id, scheduled_job.job_id, operation_id, self.job_allocations[job_row, operation_id])
 
             self.source_job = last_node_processed
 
-            for link in temp_links:
-                links.append({"source": link.source,
-                              "target": link.target,
-                              "weight": link.weight,
-                              PARALLEL_MACHINES: parallel_machines})
+            if materialize_graph:
+                for link in temp_links:
+                    links.append({"source": link.source,
+                                  "target": link.target,
+                                  "weight": link.weight,
+                                  MACHINE: link.machine_id,
+                                  PARALLEL_MACHINES: parallel_machines})
+            else:
+                for link in temp_links:
+                    job_links["sources"].append(link.source)
+                    job_links["targets"].append(link.target)
+                    job_links["weights"].append(link.weight)
+                    job_links["machine_ids"].append(link.machine_id)
+                    job_links["group_ids"].append(number_of_groups)
+
+                # Rounds without links make no parallel group, as in the graph
+                if len(temp_links) > 0:
+                    number_of_groups += 1
+
+        if not materialize_graph:
+            return JobLinks(nodes=list(temp_nodes),
+                            sources=job_links["sources"],
+                            targets=job_links["targets"],
+                            weights=np.array(job_links["weights"], dtype=np.int64),
+                            machine_ids=np.array(job_links["machine_ids"], dtype=np.int64),
+                            group_ids=np.array(job_links["group_ids"], dtype=np.int64))
 
         for node in temp_nodes:
             nodes.append({"id": node})
@@ -142,19 +191,22 @@ class JobScheduler:
         return JobScheduler.load_graph(job)
 
     @staticmethod
-    def get_next_operation(operation_ids: List[int]) -> int:
+    def get_next_operation(operation_ids: Deque[int]) -> int:
         if len(operation_ids) > 0:
-            return operation_ids.pop(0)
+            return operation_ids.popleft()
         else:
             return -1  # No more operations to process
 
     def remove_operation(self, scheduled_job:ScheduledJob, operation_id: int) -> None:
-        if operation_id in self.job_allocations[scheduled_job.job_id].keys():
-            del self.job_allocations[scheduled_job.job_id][operation_id]
+        job_row = self._job_rows[scheduled_job.job_id]
+
+        if operation_id < self.job_allocations.shape[1]:
+            self._remaining_times[job_row] -= self.job_allocations[job_row, operation_id]
+            self.job_allocations[job_row, operation_id] = 0
 
     def is_operation_fully_executed(self, scheduled_job: ScheduledJob, operation_id: int) -> bool:
-        return operation_id not in self.job_allocations[scheduled_job.job_id].keys() or \
-               self.job_allocations[scheduled_job.job_id][operation_id] < 1
+        return operation_id >= self.job_allocations.shape[1] or \
+               self.job_allocations[self._job_rows[scheduled_job.job_id], operation_id] < 1
 
     def schedule_machine(self) -> int:
         self.starting_machine_id += 1
@@ -173,15 +225,19 @@ class JobScheduler:
                           temp_links: Set[Link],
                           parallel_machines: List[Tuple[str, str]],
                           node_id: int) -> None:
-        time = min(self.num_of_operations_per_machine, self.job_allocations[scheduled_job.job_id][operation_id])
-        self.idle_time += self.num_of_operations_per_machine - self.job_allocations[scheduled_job.job_id][operation_id]
+        job_row = self._job_rows[scheduled_job.job_id]
+        allocation = int(self.job_allocations[job_row, operation_id])
+        time = min(self.num_of_operations_per_machine, allocation)
+        self.idle_time += self.num_of_operations_per_machine - allocation
         temp_nodes.add(node_id)
         link = Link(source=machine_source[machine_id],
                     target=node_id,
-                    weight=time)
+                    weight=time,
+                    machine_id=machine_id)
         temp_links.add(link)
         parallel_machines.append((machine_source[machine_id], node_id))
-        self.job_allocations[scheduled_job.job_id][operation_id] -= time
+        self.job_allocations[job_row, operation_id] -= time
+        self._remaining_times[job_row] -= time
 
         machine_source[machine_id] = node_id
 
@@ -189,12 +245,7 @@ class JobScheduler:
         return f"J{job_id}{machine_id}{operation_id}"
 
     def _is_job_fully_executed(self, job_id):
-        time = 0
-
-        for operation_id in self.job_allocations[job_id].keys():
-            time += self.job_allocations[job_id][operation_id]
-
-        return time < 1
+        return self._remaining_times[self._job_rows[job_id]] < 1
 
     @staticmethod
     def load_graph(schedule: str):
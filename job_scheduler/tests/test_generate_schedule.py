@@ -1,3 +1,5 @@
+import random
+
 from job_scheduler.scheduler import JobScheduler
 
 
@@ -41,3 +43,46 @@ def test_generate_random_schedules():
 
 
 
+
+
+def test_generate_schedule_without_graphs(job_scheduler: JobScheduler):
+    schedule = job_scheduler.generate_schedule(materialize_graphs=False)
+
+    assert all(job._operations is None for job in schedule.jobs)
+    assert 27 == schedule.compute_makespan()
+
+    # The graphs built on demand give the same makespan when walked link by link
+    schedule.debug = True
+
+    assert 27 == schedule.compute_makespan()
+    assert all(job.operations is not None for job in schedule.jobs)
+
+
+def test_generate_random_schedules_without_graphs():
+    random.seed(1000)
+
+    for num_of_operations_per_job, num_of_machines, num_ops_per_machine in [(3, 5, 3), (5, 3, 5), (8, 4, 6)]:
+        scheduled_jobs = JobScheduler.generate_scheduled_jobs(num_of_jobs=30,
+                                                              num_of_operations_per_job=num_of_operations_per_job)
+
+        schedules = [JobScheduler(scheduled_jobs=scheduled_jobs,
+                                  num_of_machines=num_of_machines,
+                                  num_ops_per_machine=num_ops_per_machine).generate_schedule(materialize_graphs)
+                     for materialize_graphs in (True, False)]
+
+        assert schedules[0].compute_makespan() == schedules[1].compute_makespan()
+        assert sorted(schedules[0].jobs[0].operations.edges) == sorted(schedules[1].jobs[0].operations.edges)
+
+
+def test_job_allocations(job_scheduler: JobScheduler):
+    assert job_scheduler.job_allocations.shape == (len(job_scheduler.scheduled_jobs), 3)
+    assert not job_scheduler._is_job_fully_executed(2)
+    assert not job_scheduler.is_operation_fully_executed(job_scheduler.scheduled_jobs[1], 1)
+    assert job_scheduler.is_operation_fully_executed(job_scheduler.scheduled_jobs[1], 3)
+
+    job_scheduler.generate_schedule()
+
+    # Every operation is executed, and the remaining time of each job was kept in step with its operations
+    assert not job_scheduler.job_allocations.any()
+    assert all(job_scheduler._is_job_fully_executed(scheduled_job.job_id)
+               for scheduled_job in job_scheduler.scheduled_jobs)
@@ -1,6 +1,9 @@
+import numpy as np
+import pytest
+import random
 from typing import List
 
-from job_scheduler.model import ScheduledJob
+from job_scheduler.model import JobPermutation, Operation, ScheduledJob
 from job_scheduler.optimizer import ScheduleOptimizer
 from job_scheduler.scheduler import JobScheduler
 
@@ -20,3 +23,102 @@ def test_optimzer(scheduled_jobs: List[ScheduledJob],
     print(f"New Schedule makespan: {schedule_optimzer._current_schedule.compute_makespan()}")
 
     schedule_optimzer.get_boltzmann_distributon()
+
+
+def test_optimizer_delta_evaluation() -> None:
+    random.seed(1000)
+    scheduled_jobs = JobScheduler.generate_scheduled_jobs(num_of_jobs=10, num_of_operations_per_job=4)
+
+    random.seed(1000)
+    schedule_optimizer = ScheduleOptimizer(scheduled_jobs=scheduled_jobs,
+                                           num_of_machines=3,
+                                           num_ops_per_machine=4,
+                                           schedule_iterations=50)
+    expect_make_span = schedule_optimizer.optimize()
+
+    random.seed(1000)
+    delta_schedule_optimizer = ScheduleOptimizer(scheduled_jobs=scheduled_jobs,
+                                                 num_of_machines=3,
+                                                 num_ops_per_machine=4,
+                                                 schedule_iterations=50,
+                                                 delta_evaluation=True,
+                                                 consistency_check_interval=10)
+    actual_make_span = delta_schedule_optimizer.optimize()
+
+    assert expect_make_span == actual_make_span
+    assert actual_make_span == delta_schedule_optimizer._current_schedule.compute_makespan()
+    assert np.array_equal(schedule_optimizer.get_makespan_time_series(), delta_schedule_optimizer.get_makespan_time_series())
+    assert np.array_equal(schedule_optimizer.get_boltzmann_distributon(), delta_schedule_optimizer.get_boltzmann_distributon())
+
+
+def test_optimizer_uneven_operations() -> None:
+    scheduled_jobs = [ScheduledJob(job_id=job_id, operations=[Operation(id=i, time=5 * job_id + i) for i in range(1, n + 1)])
+                      for job_id, n in enumerate([1, 3, 2, 1, 4], start=1)]
+
+    for delta_evaluation in [False, True]:
+        random.seed(1000)
+        schedule_optimizer = ScheduleOptimizer(scheduled_jobs=scheduled_jobs,
+                                               num_of_machines=2,
+                                               num_ops_per_machine=2,
+                                               schedule_iterations=30,
+                                               delta_evaluation=delta_evaluation)
+        make_span = schedule_optimizer.optimize()
+
+        assert make_span == schedule_optimizer.schedule.compute_makespan()
+        assert np.all(schedule_optimizer.get_makespan_time_series() == make_span)
+        assert all(job.operations is not None for job in schedule_optimizer._current_schedule.jobs)
+
+
+@pytest.mark.parametrize("delta_evaluation", [False, True])
+def test_optimizer_accepted_moves(scheduled_jobs: List[ScheduledJob], monkeypatch, delta_evaluation: bool) -> None:
+    # Every move is accepted, and each next schedule is still a move away from the initial order of the jobs
+    random.seed(1000)
+    monkeypatch.setattr(random, "random", lambda: 1.0)
+
+    schedule_optimizer = ScheduleOptimizer(scheduled_jobs=scheduled_jobs,
+                                           num_of_machines=2,
+                                           num_ops_per_machine=2,
+                                           schedule_iterations=10,
+                                           delta_evaluation=delta_evaluation)
+    moves = []
+    get_random_move = schedule_optimizer._get_random_move
+    monkeypatch.setattr(schedule_optimizer, "_get_random_move", lambda: moves.append(get_random_move()) or moves[-1])
+
+    schedule_optimizer.optimize()
+
+    job_ids = [scheduled_job.job_id for scheduled_job in scheduled_jobs]
+    job_ids[moves[-1][0]], job_ids[moves[-1][1]] = job_ids[moves[-1][1]], job_ids[moves[-1][0]]
+
+    assert 9 == len(moves)
+    assert job_ids == [job.id for job in schedule_optimizer._current_schedule.jobs]
+    assert scheduled_jobs == schedule_optimizer._current_scheduled_jobs.to_list()
+
+
+def test_optimizer_swap_keeps_makespan() -> None:
+    random.seed(1000)
+    scheduled_jobs = [ScheduledJob(job_id=job_id,
+                                   operations=[Operation(id=i, time=random.randint(5, 50))
+                                               for i in range(1, random.randint(1, 6) + 1)])
+                      for job_id in range(1, 13)]
+    schedule_optimizer = ScheduleOptimizer(scheduled_jobs=scheduled_jobs, num_of_machines=3, num_ops_per_machine=4)
+    make_span = schedule_optimizer.schedule.compute_makespan()
+
+    for _ in range(20):
+        move = schedule_optimizer._get_random_move()
+        next_schedule = schedule_optimizer._generate_schedule(schedule_optimizer._get_moved_scheduled_jobs(move))
+
+        assert make_span == next_schedule.compute_makespan()
+
+
+def test_job_permutation(scheduled_jobs: List[ScheduledJob]) -> None:
+    job_permutation = JobPermutation(scheduled_jobs)
+
+    job_permutation.apply_move(0, 3)
+
+    assert [4, 2, 3, 1, 5] == [scheduled_job.job_id for scheduled_job in job_permutation.to_list()]
+    assert 4 == job_permutation[0].job_id
+
+    job_permutation.undo_move(0, 3)
+
+    assert scheduled_jobs == job_permutation.to_list()
+    assert [1, 2, 3, 4, 5] == [scheduled_job.job_id for scheduled_job in scheduled_jobs]
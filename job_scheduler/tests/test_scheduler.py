@@ -1,4 +1,7 @@
+import random
+
 from job_scheduler.model import Schedule
+from job_scheduler.scheduler import JobScheduler
 
 
 def test_compute_makespan(schedule: Schedule) -> None:
@@ -6,3 +9,34 @@ def test_compute_makespan(schedule: Schedule) -> None:
     actual_make_span = schedule.compute_makespan()
 
     assert actual_make_span == expect_make_span
+
+
+def test_compile_schedule(schedule: Schedule) -> None:
+    compiled_schedule = schedule.compile()
+
+    assert 14 == len(compiled_schedule.group_offsets)
+    assert 27 == compiled_schedule.compute_makespan()
+    assert compiled_schedule is schedule.compile()
+
+
+def test_compute_makespan_compiled_matches_links() -> None:
+    random.seed(1000)
+    scheduled_jobs = JobScheduler.generate_scheduled_jobs(num_of_jobs=20, num_of_operations_per_job=4)
+
+    schedule = JobScheduler(scheduled_jobs=scheduled_jobs, num_of_machines=3, num_ops_per_machine=4).generate_schedule()
+    compiled_schedule = schedule.compile()
+
+    assert Schedule(jobs=schedule.jobs, debug=True).compute_makespan() == schedule.compute_makespan()
+    assert set(compiled_schedule.machine_ids.tolist()) == {1, 2, 3}
+
+
+def test_jobs_compare_by_links() -> None:
+    random.seed(1000)
+    scheduled_jobs = JobScheduler.generate_scheduled_jobs(num_of_jobs=5, num_of_operations_per_job=4)
+
+    jobs, other_jobs = [JobScheduler(scheduled_jobs=scheduled_jobs, num_of_machines=3, num_ops_per_machine=4)
+                        .generate_schedule(materialize_graphs=False).jobs for _ in range(2)]
+    jobs[0].get_operations()
+
+    assert jobs == other_jobs
+    assert jobs[0] != jobs[1]
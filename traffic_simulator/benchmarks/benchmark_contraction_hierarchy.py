@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from traffic_simulator.city_map import CityMap
+from traffic_simulator.model import GraphBackend, ShortestPathAlgo
+from traffic_simulator.traffic_simulation import Simulator
+
+
+def main(rows: int = 100, columns: int = 100, number_of_queries: int = 200, seed: int = 1000) -> None:
+    city_map = Simulator.generate_grid_map(rows, columns, seed)
+    queries = np.random.default_rng(seed).integers(0, city_map.number_of_nodes(), (number_of_queries, 2)).tolist()
+
+    print(f"City map: {city_map.number_of_nodes()} locations, {city_map.number_of_edges()} roads, {number_of_queries} queries")
+
+    contraction_hierarchy = CityMap.get_contraction_hierarchy(city_map)
+    stats = contraction_hierarchy.get_stats()
+    print(f"Preprocessing: {stats.preprocessing_seconds:.3f}s, {stats.number_of_shortcuts} shortcuts, "
+          f"{stats.nbytes / 2 ** 20:.1f} MiB")
+
+    start = time.perf_counter()
+    networkx_lengths = [nx.dijkstra_path_length(city_map, source, destination) for source, destination in queries]
+    networkx_time = time.perf_counter() - start
+    print(f"networkx dijkstra: {1000 * networkx_time / number_of_queries:.3f}ms per query")
+
+    start = time.perf_counter()
+    csr_lengths = [CityMap.get_shortest_path_length(city_map, source, destination, ShortestPathAlgo.DIJKSTRA, GraphBackend.CSR)
+                   for source, destination in queries]
+    csr_time = time.perf_counter() - start
+    print(f"csr dijkstra: {1000 * csr_time / number_of_queries:.3f}ms per query")
+
+    contraction_hierarchy_lengths = [CityMap.get_shortest_path_length(city_map,
+                                                                      source,
+                                                                      destination,
+                                                                      ShortestPathAlgo.CONTRACTION_HIERARCHY)
+                                     for source, destination in queries]
+    stats = contraction_hierarchy.get_stats()
+
+    assert np.allclose(networkx_lengths, csr_lengths)
+    assert np.allclose(networkx_lengths, contraction_hierarchy_lengths)
+
+    print(f"contraction hierarchy: {1000 * stats.mean_query_seconds:.3f}ms per query "
+          f"({networkx_time / number_of_queries / stats.mean_query_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from traffic_simulator.city_map import CityMap
+from traffic_simulator.model import GraphBackend, ShortestPathAlgo
+from traffic_simulator.traffic_simulation import Simulator
+
+
+def time_queries(get_shortest_path_length: Callable[[int, int], float], queries: List[Tuple[int, int]]) -> Tuple[float, List[float]]:
+    start = time.perf_counter()
+    lengths = [get_shortest_path_length(source, destination) for source, destination in queries]
+
+    return time.perf_counter() - start, lengths
+
+
+def main(locations: int = 20000, roads_per_location: float = 1.5, number_of_queries: int = 200, seed: int = 1000) -> None:
+    city_map = Simulator.generate_connected_map(locations, 2 * roads_per_location / (locations - 1), seed)
+    queries = np.random.default_rng(seed).integers(0, locations, (number_of_queries, 2)).tolist()
+
+    print(f"City map: {city_map.number_of_nodes()} locations, {city_map.number_of_edges()} roads, {number_of_queries} queries")
+
+    start = time.perf_counter()
+    csr_graph = CityMap.get_csr_graph(city_map)
+    print(f"CSR graph build: {time.perf_counter() - start:.3f}s, {csr_graph.nbytes / 2 ** 20:.1f} MiB")
+
+    networkx_time, networkx_lengths = time_queries(lambda source, destination: nx.dijkstra_path_length(city_map, source, destination),
+                                                   queries)
+    print(f"networkx dijkstra: {networkx_time:.3f}s")
+
+    for shortest_path_algo in [ShortestPathAlgo.A_STAR, ShortestPathAlgo.DIJKSTRA]:
+        csr_time, csr_lengths = time_queries(lambda source, destination: CityMap.get_shortest_path_length(city_map,
+                                                                                                          source,
+                                                                                                          destination,
+                                                                                                          shortest_path_algo,
+                                                                                                          GraphBackend.CSR),
+                                             queries)
+
+        assert np.allclose(networkx_lengths, csr_lengths)
+
+        print(f"csr {shortest_path_algo.value}: {csr_time:.3f}s ({networkx_time / csr_time:.2f}x)")
+
+    start = time.perf_counter()
+    landmark_index = CityMap.create_landmark_index(city_map)
+    print(f"Landmark index: {time.perf_counter() - start:.3f}s, {landmark_index.nbytes / 2 ** 20:.1f} MiB")
+
+    alt_time, alt_lengths = time_queries(lambda source, destination: CityMap.get_shortest_path_length(city_map,
+                                                                                                      source,
+                                                                                                      destination,
+                                                                                                      ShortestPathAlgo.A_STAR,
+                                                                                                      GraphBackend.CSR),
+                                         queries)
+
+    assert np.allclose(networkx_lengths, alt_lengths)
+
+    print(f"csr astar with landmarks: {alt_time:.3f}s ({networkx_time / alt_time:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from traffic_simulator.model import ShortestPathAlgo, TimeDeltaDiff
+from traffic_simulator.traffic_simulation import Simulator
+
+
+def main(locations: int = 5000, roads_per_location: float = 1.5, number_of_sampled_trips: int = 1000, seed: int = 1000) -> None:
+    city_map = Simulator.generate_connected_map(locations, 2 * roads_per_location / (locations - 1), seed)
+
+    start = time.perf_counter()
+    trip_matrix = Simulator.generate_trip_matrix(city_map,
+                                                 datetime(2024, 1, 1),
+                                                 datetime(2025, 1, 1),
+                                                 TimeDeltaDiff.SECONDS,
+                                                 seed=seed)
+    number_of_trips = int(trip_matrix.trip_counts.sum())
+    print(f"City map: {city_map.number_of_nodes()} locations, {city_map.number_of_edges()} roads, "
+          f"{number_of_trips} trips generated in {time.perf_counter() - start:.3f}s")
+
+    sampled_trips = np.random.default_rng(seed).integers(0, locations, (number_of_sampled_trips, 2)).tolist()
+    start = time.perf_counter()
+
+    for source, destination in sampled_trips:
+        Simulator.generate_traffic(city_map, source, destination, ShortestPathAlgo.DIJKSTRA)
+
+    per_trip_time = (time.perf_counter() - start) / number_of_sampled_trips
+    print(f"generate_traffic: {1000 * per_trip_time:.3f}ms per trip, "
+          f"{per_trip_time * number_of_trips / 3600:.1f}h estimated for all trips")
+
+    start = time.perf_counter()
+    traffic_assignment = Simulator.assign_traffic(city_map, trip_matrix)
+    assignment_time = time.perf_counter() - start
+
+    print(f"assign_traffic: {assignment_time:.3f}s, {traffic_assignment.total_volume:.0f} road trips, "
+          f"{traffic_assignment.unassigned_trips} unassigned ({per_trip_time * number_of_trips / assignment_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from traffic_simulator.model import EquilibriumMethod, TimeDeltaDiff
+from traffic_simulator.traffic_simulation import Simulator
+
+
+def main(locations: int = 5000,
+         roads_per_location: float = 1.5,
+         road_capacity: float = 20000,
+         max_iterations: int = 10,
+         seed: int = 1000) -> None:
+    city_map = Simulator.generate_connected_map(locations, 2 * roads_per_location / (locations - 1), seed)
+
+    # About a million trips, one every second for 12 days
+    trip_matrix = Simulator.generate_trip_matrix(city_map,
+                                                 datetime(2024, 1, 1),
+                                                 datetime(2024, 1, 13),
+                                                 TimeDeltaDiff.SECONDS,
+                                                 seed=seed)
+    print(f"City map: {city_map.number_of_nodes()} locations, {city_map.number_of_edges()} roads, "
+          f"{int(trip_matrix.trip_counts.sum())} trips")
+
+    for method in EquilibriumMethod:
+        start = time.perf_counter()
+        traffic_equilibrium = Simulator.assign_equilibrium_traffic(city_map,
+                                                                   trip_matrix,
+                                                                   road_capacity=road_capacity,
+                                                                   method=method,
+                                                                   max_iterations=max_iterations)
+        equilibrium_time = time.perf_counter() - start
+
+        print(f"{method.value}: {equilibrium_time:.1f}s, {traffic_equilibrium.iterations} iterations, "
+              f"relative gaps {', '.join(f'{relative_gap:.4f}' for relative_gap in traffic_equilibrium.relative_gaps)}")
+
+
+if __name__ == "__main__":
+    main()
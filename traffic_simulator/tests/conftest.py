@@ -2,6 +2,7 @@ import networkx as nx
 from pandas import DataFrame
 from networkx.classes.graph import Graph
 import pytest
+from random import Random
 from typing import Dict
 
 from traffic_simulator.city_map import CityMap
@@ -81,11 +82,33 @@ def static_benefit_matrix() -> DataFrame:
     return get_benefit_matrix
 
 
+def generate_random_city_map(locations: int = 40, seed: int = 1000) -> Graph:
+    random = Random(seed)
+    graph = nx.connected_watts_strogatz_graph(locations, 4, 0.3, seed=seed)
 
+    for source, destination in graph.edges():
+        graph[source][destination]['weight'] = random.randint(5, 25)
 
+    return graph
+
+
+@pytest.fixture
+def random_city_map() -> Graph:
+    return generate_random_city_map()
 
 
+def generate_random_trips(city_map: Graph, seed: int = 1000) -> Dict[Trip, Trip]:
+    random = Random(seed)
+    trips = {}
 
+    # The counts are drawn in the order of the set of trips
+    for source, destination in CityMap.get_possible_trips(city_map):
+        trip = TripFactory.create_trip(source, destination, random.randint(0, 3))
+        trips[trip] = trip
 
+    return trips
 
 
+@pytest.fixture
+def random_city_trips(random_city_map: Graph) -> Dict[Trip, Trip]:
+    return generate_random_trips(random_city_map)
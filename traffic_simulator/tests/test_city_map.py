@@ -1,10 +1,19 @@
+from conftest import generate_random_city_map
 from hypothesis import given
 from hypothesis.strategies import composite
+from itertools import permutations
+import json
+import networkx as nx
+import numpy as np
+from networkx.classes.graph import Graph
+import pytest
 from random import randint
 from typing import List, Tuple
 
-from traffic_simulator.city_map import TripLinkedList
-from traffic_simulator.model import Trip, TripFactory
+from traffic_simulator.city_map import CityMap, TripLinkedList
+from traffic_simulator.model import GraphBackend, ShortestPathAlgo, Trip, TripFactory
+from traffic_simulator.traffic_simulation import Simulator
+from traffic_simulator.trip_linked_list import TripLinkedListFactory
 
 
 def generate_road_ids(size: int, min_value: int, max_value: int) -> List[int]:
@@ -42,6 +51,64 @@ def test_insert_linked_list_roads(roads_with_ids: Tuple[TripLinkedList, List[int
         road_id += 1
 
 
+def test_trip_linked_list_metadata() -> None:
+    trip = TripLinkedList(capacity=1)
+
+    for road_id in range(100):
+        trip.insert({"id": road_id, "weight": road_id})
+
+    trip.insert({"id": 100, "weight": 0.5, "name": "bridge"})
+
+    assert 101 == len(trip)
+    assert list(range(101)) == trip.node_ids.tolist()
+    assert {"id": 3, "weight": 3} == trip.head.next.next.next.metadata
+    assert {"id": 100, "weight": 0.5, "name": "bridge"} == list(trip)[-1].metadata
+    assert trip.get_column("name")[1].tolist() == [False] * 100 + [True]
+
+
+def test_trip_linked_list_metadata_write_through() -> None:
+    trip = TripLinkedList()
+    trip.insert({"weight": 1})
+    trip.insert({"id": "a", "name": "bridge"})
+    trip.insert({"id": 2})
+
+    assert {"weight": 1} == trip.head.metadata
+    assert [-1, "a", 2] == trip.node_ids.tolist()
+
+    trip.head.metadata["weight"] = 1.5
+    trip.head.next.metadata["name"] = "tunnel"
+    del trip.head.next.next.metadata["id"]
+    trip.head.next.next.metadata["lanes"] = 2
+
+    assert [{"weight": 1.5}, {"id": "a", "name": "tunnel"}, {"lanes": 2}] == [road.metadata for road in trip]
+    assert -1 == trip.head.next.next.node_id
+
+
+def test_trip_linked_list_sequence_metadata() -> None:
+    trip = TripLinkedList()
+    trip.insert({"id": 1, "pos": (0.5, 1.5)})
+    trip.insert({"id": 2, "path": [1, 2]})
+    trip.insert({"id": 3, "pos": 2.5, "path": []})
+    trip.extend([4, 5], pos=[(1.0, 2.0), (3.0, 4.0)], path=[[1], [2, 3]])
+
+    assert {"id": 1, "pos": (0.5, 1.5)} == trip.head.metadata
+    assert {"id": 2, "path": [1, 2]} == trip.get_metadata(1)
+    assert {"id": 3, "pos": 2.5, "path": []} == trip.get_metadata(2)
+    assert [(1.0, 2.0), (3.0, 4.0)] == [road.metadata["pos"] for road in list(trip)[3:]]
+    assert [[1], [2, 3]] == [road.metadata["path"] for road in list(trip)[3:]]
+
+
+def test_create_trip_linked_list() -> None:
+    node_ids = np.arange(1_000_000)
+
+    trip = TripLinkedListFactory.create_trip_linked_list(node_ids, weight=node_ids * 2.0)
+    trip.append(-1)
+
+    assert np.array_equal(node_ids, trip.node_ids[:-1])
+    assert {"id": 10, "weight": 20.0} == trip.get_metadata(10)
+    assert {"id": -1} == trip.get_metadata(len(trip) - 1)
+
+
 def test_trip_equality_equal():
     trip_a = TripFactory.create_trip(0, 2, 1)
     trip_b = TripFactory.create_trip(0, 2, 10)
@@ -54,3 +121,325 @@ def test_trip_equality_not_equal():
     trip_b = TripFactory.create_trip(2, 0, 11)
 
     assert trip_a != trip_b
+
+
+def test_get_distance_matrix(static_city_map: Graph) -> None:
+    distance_matrix = CityMap.get_distance_matrix(static_city_map)
+
+    for source, destination in CityMap.get_possible_trips(static_city_map):
+        expect_distance = nx.dijkstra_path_length(static_city_map, source, destination)
+
+        assert expect_distance == distance_matrix.get_distance(source, destination)
+
+    assert distance_matrix is CityMap.get_distance_matrix(static_city_map)
+
+
+def test_get_distance_matrix_after_add_road_segment(static_city_map: Graph) -> None:
+    source = 2
+    destination = 0
+    shrinkage_factor = 0.60
+    expect_distance = 19 * shrinkage_factor
+
+    distance_matrix = CityMap.get_distance_matrix(static_city_map)
+    CityMap.add_road_segment(static_city_map, source, destination, shrinkage_factor)
+    actual_distance_matrix = CityMap.get_distance_matrix(static_city_map)
+
+    assert distance_matrix is not actual_distance_matrix
+    assert distance_matrix.version < actual_distance_matrix.version
+    assert expect_distance == actual_distance_matrix.get_distance(source, destination)
+
+
+def test_get_distance_matrix_rolled_forward(random_city_map: Graph) -> None:
+    CityMap.get_distance_matrix(random_city_map)
+
+    CityMap.add_road_segment(random_city_map, 0, 20)
+    CityMap.add_road_segment(random_city_map, 5, 30)
+    actual_distance_matrix = CityMap.get_distance_matrix(random_city_map)
+
+    random_city_map.graph.clear()
+    expect_distance_matrix = CityMap.get_distance_matrix(random_city_map)
+
+    assert actual_distance_matrix.changed.any()
+    assert expect_distance_matrix.distances == pytest.approx(actual_distance_matrix.distances)
+
+
+@pytest.mark.parametrize("shortest_path_algo", list(ShortestPathAlgo))
+def test_get_shortest_path_csr_backend(random_city_map: Graph, shortest_path_algo: ShortestPathAlgo) -> None:
+    for source, destination in [(0, 20), (5, 30), (39, 1), (12, 12)]:
+        expect_length = nx.dijkstra_path_length(random_city_map, source, destination)
+
+        actual_length = CityMap.get_shortest_path_length(random_city_map,
+                                                         source,
+                                                         destination,
+                                                         shortest_path_algo,
+                                                         GraphBackend.CSR)
+        actual_path = CityMap.get_shortest_path(random_city_map,
+                                                source,
+                                                destination,
+                                                shortest_path_algo,
+                                                GraphBackend.CSR)
+
+        assert expect_length == pytest.approx(actual_length)
+        assert source == actual_path[0] and destination == actual_path[-1]
+        assert expect_length == pytest.approx(nx.path_weight(random_city_map, actual_path, "weight"))
+
+
+@pytest.mark.parametrize("shortest_path_algo", list(ShortestPathAlgo))
+@pytest.mark.parametrize("backend", list(GraphBackend))
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_get_shortest_path_unreachable(shortest_path_algo: ShortestPathAlgo, backend: GraphBackend, use_cache: bool) -> None:
+    city_map = nx.Graph()
+    city_map.add_weighted_edges_from([(0, 1, 5), (1, 2, 5), (3, 4, 5)])
+
+    if use_cache:
+        CityMap.enable_shortest_path_cache(city_map)
+
+    with pytest.raises(nx.NetworkXNoPath):
+        CityMap.get_shortest_path(city_map, 0, 4, shortest_path_algo, backend)
+
+    with pytest.raises(nx.NetworkXNoPath):
+        CityMap.get_shortest_path_length(city_map, 0, 4, shortest_path_algo, backend)
+
+
+def test_get_csr_graph(static_city_map: Graph) -> None:
+    csr_graph = CityMap.get_csr_graph(static_city_map)
+
+    assert 2 * static_city_map.number_of_edges() == len(csr_graph.indices)
+    assert static_city_map.number_of_edges() == len(set(csr_graph.road_ids.tolist()))
+    assert csr_graph is CityMap.get_csr_graph(static_city_map)
+
+    CityMap.add_road_segment(static_city_map, 2, 0)
+
+    assert csr_graph is not CityMap.get_csr_graph(static_city_map)
+
+
+def test_shortest_path_cache(random_city_map: Graph) -> None:
+    CityMap.enable_shortest_path_cache(random_city_map, capacity=2)
+
+    for destination in range(1, 40):
+        expect_length = nx.dijkstra_path_length(random_city_map, 0, destination)
+
+        assert expect_length == pytest.approx(CityMap.get_shortest_path_length(random_city_map, 0, destination))
+        assert expect_length == pytest.approx(nx.path_weight(random_city_map,
+                                                             CityMap.get_shortest_path(random_city_map, 0, destination),
+                                                             "weight"))
+
+    stats = CityMap.get_shortest_path_cache_stats(random_city_map)
+
+    assert 1 == stats.misses
+    assert 77 == stats.hits
+
+    for source in [1, 2, 3, 1]:
+        CityMap.get_shortest_path_length(random_city_map, source, 0)
+
+    stats = CityMap.get_shortest_path_cache_stats(random_city_map)
+
+    assert 2 == stats.size
+    assert 5 == stats.misses
+    assert 3 == stats.evictions
+
+
+def test_shortest_path_cache_after_add_road_segment(random_city_map: Graph) -> None:
+    CityMap.enable_shortest_path_cache(random_city_map)
+    CityMap.get_shortest_path_length(random_city_map, 0, 20)
+
+    CityMap.add_road_segment(random_city_map, 0, 20)
+
+    expect_length = nx.dijkstra_path_length(random_city_map, 0, 20)
+
+    assert expect_length == pytest.approx(CityMap.get_shortest_path_length(random_city_map, 0, 20))
+    assert 2 == CityMap.get_shortest_path_cache_stats(random_city_map).misses
+
+
+def test_shortest_path_cache_algorithms_and_copies(random_city_map: Graph) -> None:
+    CityMap.enable_shortest_path_cache(random_city_map)
+
+    for shortest_path_algo in (ShortestPathAlgo.DIJKSTRA, ShortestPathAlgo.A_STAR):
+        CityMap.get_shortest_path_length(random_city_map, 0, 20, shortest_path_algo)
+
+    assert 1 == CityMap.get_shortest_path_cache_stats(random_city_map).size
+
+    # The copy gets a cache of its own, so adding a road to it neither clears nor corrupts the trees of the map
+    city_map_copy = random_city_map.copy()
+    CityMap.add_road_segment(city_map_copy, 0, 20)
+
+    for _ in range(2):
+        CityMap.get_shortest_path_length(random_city_map, 0, 20)
+        CityMap.get_shortest_path_length(city_map_copy, 0, 20)
+
+    stats = CityMap.get_shortest_path_cache_stats(random_city_map)
+
+    assert 1 == stats.misses
+    assert 3 == stats.hits
+    assert nx.dijkstra_path_length(city_map_copy, 0, 20) == pytest.approx(CityMap.get_shortest_path_length(city_map_copy, 0, 20))
+    assert CityMap.get_shortest_path_cache(city_map_copy) is not CityMap.get_shortest_path_cache(random_city_map)
+
+
+@pytest.mark.parametrize("backend", list(GraphBackend))
+def test_get_shortest_path_astar_heuristic(backend: GraphBackend) -> None:
+    city_map = Simulator.generate_grid_map(20, 20)
+
+    for source, destination in [(0, 399), (25, 370), (210, 19)]:
+        expect_length = nx.dijkstra_path_length(city_map, source, destination)
+
+        assert expect_length == pytest.approx(CityMap.get_shortest_path_length(city_map,
+                                                                               source,
+                                                                               destination,
+                                                                               ShortestPathAlgo.A_STAR,
+                                                                               backend))
+        assert expect_length == pytest.approx(CityMap.get_shortest_path_length(city_map,
+                                                                               source,
+                                                                               destination,
+                                                                               ShortestPathAlgo.A_STAR.value,
+                                                                               backend))
+
+
+def test_search_astar_expands_fewer_nodes() -> None:
+    city_map = Simulator.generate_grid_map(30, 30)
+
+    astar_tree = CityMap.search(city_map, 15, 885, ShortestPathAlgo.A_STAR)
+    dijkstra_tree = CityMap.search(city_map, 15, 885, ShortestPathAlgo.DIJKSTRA)
+
+    assert astar_tree.distances[885] == dijkstra_tree.distances[885]
+    assert astar_tree.expanded_nodes < dijkstra_tree.expanded_nodes / 2
+
+
+def test_get_road_permutations(static_city_map: Graph) -> None:
+    for shortest_path_algo in [ShortestPathAlgo.DIJKSTRA, ShortestPathAlgo.A_STAR, ShortestPathAlgo.A_STAR.value]:
+        road_permutations = CityMap.get_road_permutations(static_city_map, 2, 0, shortest_path_algo)
+
+        assert 6 == len(road_permutations)
+        assert (2, 4, 0) in road_permutations
+        assert road_permutations == list(CityMap.get_road_permutations(static_city_map, 2, 0, shortest_path_algo,
+                                                                                eager=False))
+
+
+def test_get_possible_trips(random_city_map: Graph) -> None:
+    expect_trips = CityMap.get_possible_trips(random_city_map)
+
+    possible_trips = CityMap.get_possible_trips(random_city_map, eager=False)
+    sources, destinations = possible_trips.get_positions()
+    sampled_sources, sampled_destinations = possible_trips.sample(np.random.default_rng(1000), 1000)
+
+    assert len(expect_trips) == len(possible_trips)
+    assert expect_trips == set(possible_trips)
+    assert all(trip in possible_trips for trip in expect_trips)
+    assert (3, 3) not in possible_trips
+    assert expect_trips == {(possible_trips.locations[source], possible_trips.locations[destination])
+                            for source, destination in zip(sources.tolist(), destinations.tolist())}
+    assert np.array_equal(sources, np.concatenate([chunk[0] for chunk in possible_trips.iterate_positions(chunk_size=100)]))
+    assert np.all(sampled_sources != sampled_destinations)
+
+
+def test_create_landmark_index(random_city_map: Graph) -> None:
+    landmark_index = CityMap.create_landmark_index(random_city_map, number_of_landmarks=4)
+
+    assert 4 == len(set(landmark_index.landmarks.tolist()))
+
+    for source, destination in [(0, 20), (5, 30), (39, 1)]:
+        expect_length = nx.dijkstra_path_length(random_city_map, source, destination)
+
+        for backend in GraphBackend:
+            assert expect_length == pytest.approx(CityMap.get_shortest_path_length(random_city_map,
+                                                                                   source,
+                                                                                   destination,
+                                                                                   ShortestPathAlgo.A_STAR,
+                                                                                   backend))
+
+        assert CityMap.search(random_city_map, source, destination, ShortestPathAlgo.A_STAR).expanded_nodes <= \
+               CityMap.search(random_city_map, source, destination, ShortestPathAlgo.DIJKSTRA).expanded_nodes
+
+    CityMap.add_road_segment(random_city_map, 0, 20)
+
+    assert CityMap.get_landmark_index(random_city_map) is None
+
+
+def test_caches_after_road_changes(static_city_map: Graph) -> None:
+    CityMap.enable_shortest_path_cache(static_city_map)
+    CityMap.create_landmark_index(static_city_map, number_of_landmarks=2)
+
+    assert 25 == CityMap.get_shortest_path_length(static_city_map, 1, 2, backend=GraphBackend.CSR)
+    assert 25 == CityMap.get_distance_matrix(static_city_map).get_distance(1, 2)
+
+    for _, _, road in static_city_map.edges(data=True):
+        road['weight'] = 1
+
+    for shortest_path_algo in ShortestPathAlgo:
+        assert 3 == CityMap.get_shortest_path_length(static_city_map, 1, 2, shortest_path_algo, GraphBackend.CSR)
+
+    assert 3 == CityMap.get_distance_matrix(static_city_map).get_distance(1, 2)
+
+    static_city_map.add_edge(1, 2, weight=1)
+
+    assert 1 == CityMap.get_shortest_path_length(static_city_map, 1, 2, backend=GraphBackend.CSR)
+    assert 1 == CityMap.get_distance_matrix(static_city_map).get_distance(1, 2)
+    assert json.loads(json.dumps(CityMap.get_city_map_data(static_city_map)))['graph'] == {}
+
+
+def test_save_and_load_city_map(tmp_path, random_city_map: Graph) -> None:
+    path = str(tmp_path / "city_map.json")
+    expect_landmark_index = CityMap.create_landmark_index(random_city_map, number_of_landmarks=4)
+
+    CityMap.save_city_map(random_city_map, path)
+    actual_city_map = CityMap.load_city_map(path)
+    actual_landmark_index = CityMap.get_landmark_index(actual_city_map)
+
+    assert list(random_city_map.nodes()) == list(actual_city_map.nodes())
+    assert list(random_city_map.edges(data='weight')) == list(actual_city_map.edges(data='weight'))
+    assert expect_landmark_index.landmarks.tolist() == actual_landmark_index.landmarks.tolist()
+    assert expect_landmark_index.distances == pytest.approx(actual_landmark_index.distances)
+
+    CityMap.add_road_segment(random_city_map, 0, 20)
+
+    with pytest.raises(ValueError):
+        CityMap.set_landmark_index(random_city_map, actual_landmark_index)
+
+
+def test_set_landmark_index_other_roads() -> None:
+    # Same locations, number of roads and total road length, but different roads
+    city_map = nx.Graph()
+    city_map.add_weighted_edges_from([(0, 1, 5), (1, 2, 10), (2, 3, 5)])
+    other_city_map = nx.Graph()
+    other_city_map.add_weighted_edges_from([(0, 1, 10), (1, 2, 5), (2, 3, 5)])
+    other_roads_city_map = nx.Graph()
+    other_roads_city_map.add_nodes_from(range(4))
+    other_roads_city_map.add_weighted_edges_from([(0, 1, 5), (1, 3, 10), (3, 2, 5)])
+
+    landmark_index = CityMap.create_landmark_index(city_map, number_of_landmarks=2)
+
+    for invalid_city_map in (other_city_map, other_roads_city_map):
+        with pytest.raises(ValueError):
+            CityMap.set_landmark_index(invalid_city_map, landmark_index)
+
+    CityMap.set_landmark_index(city_map.copy(), landmark_index)
+
+
+@pytest.mark.parametrize("city_map", [generate_random_city_map(locations=120, seed=7), Simulator.generate_grid_map(12, 12)])
+def test_get_shortest_path_contraction_hierarchy(city_map: Graph) -> None:
+    for source, destination in permutations(range(0, city_map.number_of_nodes(), 7), 2):
+        expect_length = nx.dijkstra_path_length(city_map, source, destination)
+
+        actual_path = CityMap.get_shortest_path(city_map, source, destination, ShortestPathAlgo.CONTRACTION_HIERARCHY)
+        actual_length = CityMap.get_shortest_path_length(city_map,
+                                                         source,
+                                                         destination,
+                                                         ShortestPathAlgo.CONTRACTION_HIERARCHY)
+
+        assert expect_length == pytest.approx(actual_length)
+        assert source == actual_path[0] and destination == actual_path[-1]
+        assert expect_length == pytest.approx(nx.path_weight(city_map, actual_path, "weight"))
+
+    stats = CityMap.get_contraction_hierarchy(city_map).get_stats()
+
+    assert stats.queries > 0
+    assert stats.nbytes > 0
+
+
+def test_get_contraction_hierarchy_after_add_road_segment(random_city_map: Graph) -> None:
+    contraction_hierarchy = CityMap.get_contraction_hierarchy(random_city_map)
+
+    CityMap.add_road_segment(random_city_map, 0, 20, 0.1)
+
+    assert contraction_hierarchy is not CityMap.get_contraction_hierarchy(random_city_map)
+    assert nx.dijkstra_path_length(random_city_map, 0, 20) == \
+           pytest.approx(CityMap.get_shortest_path_length(random_city_map, 0, 20, ShortestPathAlgo.CONTRACTION_HIERARCHY))
@@ -1,7 +1,16 @@
+from datetime import datetime
 from itertools import permutations
-from typing import List
+import networkx as nx
+from networkx.classes.graph import Graph
+import numpy as np
+import pytest
+import random
+from typing import Dict, List
 
+from conftest import generate_static_city_map
+from traffic_simulator.model import EquilibriumMethod, ShortestPathAlgo, TimeDeltaDiff, Trip
 from traffic_simulator.traffic_simulation import Simulator
+from traffic_simulator.trip_matrix import TripMatrixFactory
 
 
 def test_get_random_locations(static_city_map) -> None:
@@ -17,3 +26,263 @@ def test_get_shortest_dijkstra_path(static_city_map) -> None:
 
 def test_get_shortest_astar_path(static_city_map) -> None:
     pass
+
+
+def test_generate_trip_matrix(random_city_map: Graph) -> None:
+    traffic_start_date = datetime(2024, 1, 1, 8)
+    traffic_end_date = datetime(2024, 1, 1, 18)
+    expect_number_of_trips = 10 * 60 * 60
+
+    trip_matrix = Simulator.generate_trip_matrix(random_city_map,
+                                                 traffic_start_date,
+                                                 traffic_end_date,
+                                                 TimeDeltaDiff.SECONDS,
+                                                 seed=1000,
+                                                 chunk_size=1000)
+    same_trip_matrix = Simulator.generate_trip_matrix(random_city_map,
+                                                      traffic_start_date,
+                                                      traffic_end_date,
+                                                      TimeDeltaDiff.SECONDS,
+                                                      seed=1000,
+                                                      chunk_size=1000,
+                                                      sparse=True)
+
+    assert expect_number_of_trips == trip_matrix.trip_counts.sum()
+    assert 0 == np.trace(trip_matrix.trip_counts)
+    assert np.array_equal(trip_matrix.trip_counts, same_trip_matrix.to_dense())
+
+
+def test_generate_trips(static_city_map: Graph) -> None:
+    trips = Simulator.generate_trips(static_city_map,
+                                     datetime(2024, 1, 1, 8),
+                                     datetime(2024, 1, 1, 9),
+                                     TimeDeltaDiff.SECONDS,
+                                     seed=1000)
+
+    assert 60 * 60 == sum(trip.numer_of_trips for trip in trips.values())
+    assert all(trip.source != trip.destination for trip in trips.values())
+
+
+def test_generate_trips_random_seed(static_city_map: Graph) -> None:
+    traffic_start_date = datetime(2024, 1, 1, 8)
+    traffic_end_date = datetime(2024, 1, 1, 9)
+
+    random.seed(1000)
+    trips = Simulator.generate_trips(static_city_map, traffic_start_date, traffic_end_date, TimeDeltaDiff.SECONDS)
+    random.seed(1000)
+    same_trips = Simulator.generate_trips(static_city_map, traffic_start_date, traffic_end_date, TimeDeltaDiff.SECONDS)
+
+    assert {trip: trip.numer_of_trips for trip in trips} == {trip: trip.numer_of_trips for trip in same_trips}
+
+    trip_matrix = Simulator.generate_trip_matrix(static_city_map,
+                                                 traffic_start_date,
+                                                 traffic_end_date,
+                                                 TimeDeltaDiff.SECONDS,
+                                                 random_generator=np.random.default_rng(7))
+
+    assert np.array_equal(trip_matrix.trip_counts,
+                          Simulator.generate_trip_matrix(static_city_map,
+                                                         traffic_start_date,
+                                                         traffic_end_date,
+                                                         TimeDeltaDiff.SECONDS,
+                                                         seed=7).trip_counts)
+
+
+def test_generate_connected_map() -> None:
+    locations = 500
+    connectedness = 0.01
+    expect_number_of_roads = round(connectedness * locations * (locations - 1) / 2)
+
+    city_map = Simulator.generate_connected_map(locations, connectedness, seed=1000)
+
+    assert nx.is_connected(city_map)
+    assert locations == city_map.number_of_nodes()
+    assert expect_number_of_roads == city_map.number_of_edges()
+    assert all(5 <= weight <= 25 for _, _, weight in city_map.edges(data='weight'))
+    assert nx.utils.graphs_equal(city_map, Simulator.generate_connected_map(locations, connectedness, seed=1000))
+
+
+def test_generate_connected_map_spanning_tree() -> None:
+    locations = 100
+
+    city_map = Simulator.generate_connected_map(locations, connectedness=0)
+
+    assert nx.is_tree(city_map)
+    assert locations == city_map.number_of_nodes()
+
+
+def test_generate_map_step_connectedness() -> None:
+    with pytest.warns(DeprecationWarning):
+        city_map = Simulator.generate_map(50, 0.05, 0.01, seed=7)
+
+    assert nx.utils.graphs_equal(city_map, Simulator.generate_map(50, 0.05, seed=7))
+
+
+def test_generate_city_map_deprecated() -> None:
+    with pytest.warns(DeprecationWarning):
+        city_map = Simulator.generate_city_map(50, 0.05, 7)
+
+    with pytest.warns(DeprecationWarning):
+        assert Simulator.is_connected(city_map)
+
+    assert nx.utils.graphs_equal(city_map, Simulator.generate_connected_map(50, 0.05, seed=7))
+
+
+def test_generate_grid_map() -> None:
+    city_map = Simulator.generate_grid_map(10, 12, seed=7)
+
+    assert 120 == city_map.number_of_nodes()
+    assert 10 * 11 + 9 * 12 == city_map.number_of_edges()
+    assert nx.is_connected(city_map)
+    assert all(len(city_map.nodes[location]['pos']) == 2 for location in city_map.nodes())
+    assert all(5 <= weight <= 25 for _, _, weight in city_map.edges(data='weight'))
+    assert nx.utils.graphs_equal(city_map, Simulator.generate_grid_map(10, 12, seed=7))
+
+
+def test_generate_traffic(static_city_map: Graph) -> None:
+    Simulator.generate_traffic(static_city_map, 0, 2, ShortestPathAlgo.DIJKSTRA)
+    Simulator.generate_traffic(static_city_map, 1, 2, ShortestPathAlgo.DIJKSTRA)
+
+    assert 2 == static_city_map.edges[0, 4]['traffic_volume']
+    assert 2 == static_city_map.edges[2, 4]['traffic_volume']
+    assert 1 == static_city_map.edges[0, 1]['traffic_volume']
+    assert 'traffic_volume' not in static_city_map.edges[3, 4]
+
+
+def test_assign_traffic(static_city_map: Graph, static_city_trips: Dict[Trip, Trip]) -> None:
+    expect_city_map = generate_static_city_map()
+
+    for trip in static_city_trips.values():
+        for _ in range(trip.numer_of_trips):
+            Simulator.generate_traffic(expect_city_map, trip.source, trip.destination, ShortestPathAlgo.DIJKSTRA)
+
+    traffic_assignment = Simulator.assign_traffic(static_city_map, static_city_trips)
+
+    assert 0 == traffic_assignment.unassigned_trips
+    assert all(traffic_volume == static_city_map.edges[source, destination].get('traffic_volume', 0)
+               for source, destination, traffic_volume in expect_city_map.edges(data='traffic_volume', default=0))
+
+
+def test_assign_traffic_random_map() -> None:
+    city_map = Simulator.generate_map(200, 0.03, seed=7)
+    trip_matrix = Simulator.generate_trip_matrix(city_map,
+                                                 datetime(2024, 1, 1),
+                                                 datetime(2024, 1, 2),
+                                                 TimeDeltaDiff.SECONDS,
+                                                 seed=1000)
+    distances = dict(nx.all_pairs_dijkstra_path_length(city_map))
+    locations = list(city_map.nodes())
+    expect_trip_length = sum(trip_matrix.trip_counts[i, j] * distances[source][destination]
+                             for i, source in enumerate(locations)
+                             for j, destination in enumerate(locations))
+
+    traffic_assignment = Simulator.assign_traffic(city_map, trip_matrix, chunk_size=64)
+
+    # However ties between shortest paths are broken, the trips travel the sum of their shortest path lengths
+    assert 0 == traffic_assignment.unassigned_trips
+    assert expect_trip_length == sum(metadata.get('traffic_volume', 0) * metadata['weight']
+                                     for _, _, metadata in city_map.edges(data=True))
+
+
+def test_generate_trip_batches(random_city_map: Graph) -> None:
+    traffic_start_date = datetime(2024, 1, 1, 8, 30)
+    traffic_end_date = datetime(2024, 1, 1, 18)
+
+    trip_batches = list(Simulator.generate_trip_batches(random_city_map,
+                                                        traffic_start_date,
+                                                        traffic_end_date,
+                                                        TimeDeltaDiff.MINUTES,
+                                                        TimeDeltaDiff.HOURS,
+                                                        seed=1000))
+    timestamps = np.concatenate([trip_batch.timestamps for trip_batch in trip_batches])
+
+    assert 10 == len(trip_batches)
+    assert traffic_start_date == trip_batches[0].start_date
+    assert traffic_end_date == trip_batches[-1].end_date
+    assert [60] * 9 + [30] == [trip_batch.number_of_trips for trip_batch in trip_batches]
+    assert np.array_equal(np.arange(np.datetime64(traffic_start_date), np.datetime64(traffic_end_date), np.timedelta64(1, 'm')),
+                          timestamps)
+    assert all(np.datetime64(trip_batch.start_date) <= trip_batch.timestamps.min() and
+               trip_batch.timestamps.max() < np.datetime64(trip_batch.end_date) for trip_batch in trip_batches)
+    assert all(np.all(trip_batch.sources != trip_batch.destinations) for trip_batch in trip_batches)
+
+    trip_matrix = TripMatrixFactory.create_trip_matrix_from_batches(list(random_city_map.nodes()),
+                                                                    Simulator.generate_trip_batches(random_city_map,
+                                                                                                    traffic_start_date,
+                                                                                                    traffic_end_date,
+                                                                                                    TimeDeltaDiff.MINUTES,
+                                                                                                    TimeDeltaDiff.HOURS,
+                                                                                                    seed=1000))
+
+    assert 570 == trip_matrix.trip_counts.sum()
+    assert np.array_equal(sum(trip_batch.to_trip_matrix().trip_counts for trip_batch in trip_batches), trip_matrix.trip_counts)
+
+
+def test_generate_trip_batches_by_month(static_city_map: Graph) -> None:
+    trip_batches = list(Simulator.generate_trip_batches(static_city_map,
+                                                        datetime(2024, 1, 1),
+                                                        datetime(2025, 1, 1),
+                                                        TimeDeltaDiff.DAYS,
+                                                        TimeDeltaDiff.MONTHS))
+
+    assert 12 == len(trip_batches)
+    assert 366 == sum(trip_batch.number_of_trips for trip_batch in trip_batches)
+    assert 29 == trip_batches[1].number_of_trips
+
+    with pytest.raises(ValueError):
+        next(Simulator.generate_trip_batches(static_city_map,
+                                             datetime(2024, 1, 1),
+                                             datetime(2025, 1, 1),
+                                             TimeDeltaDiff.HOURS,
+                                             TimeDeltaDiff.SECONDS))
+
+
+@pytest.mark.parametrize("traffic_time_delta_difference", [TimeDeltaDiff.MINUTES, TimeDeltaDiff.HOURS, TimeDeltaDiff.DAYS])
+def test_generate_trip_batches_match_trip_matrix(static_city_map: Graph, traffic_time_delta_difference: TimeDeltaDiff) -> None:
+    # The window is not a whole number of days, hours or minutes
+    traffic_start_date = datetime(2024, 1, 1, 8, 15, 30)
+    traffic_end_date = datetime(2024, 1, 3, 11, 40)
+
+    trip_matrix = Simulator.generate_trip_matrix(static_city_map,
+                                                 traffic_start_date,
+                                                 traffic_end_date,
+                                                 traffic_time_delta_difference,
+                                                 seed=1000)
+    trip_batches = Simulator.generate_trip_batches(static_city_map,
+                                                   traffic_start_date,
+                                                   traffic_end_date,
+                                                   traffic_time_delta_difference,
+                                                   TimeDeltaDiff.DAYS,
+                                                   seed=1000)
+
+    assert trip_matrix.trip_counts.sum() == sum(trip_batch.number_of_trips for trip_batch in trip_batches)
+
+
+@pytest.mark.parametrize("method", list(EquilibriumMethod))
+def test_assign_equilibrium_traffic(method: EquilibriumMethod) -> None:
+    city_map = Simulator.generate_grid_map(8, 8, seed=3)
+    trip_matrix = Simulator.generate_trip_matrix(city_map,
+                                                 datetime(2024, 1, 1, 8),
+                                                 datetime(2024, 1, 1, 12),
+                                                 TimeDeltaDiff.SECONDS,
+                                                 seed=1000)
+
+    traffic_equilibrium = Simulator.assign_equilibrium_traffic(city_map,
+                                                               trip_matrix,
+                                                               road_capacity=1000,
+                                                               method=method,
+                                                               max_iterations=40)
+
+    assert traffic_equilibrium.relative_gaps[-1] < traffic_equilibrium.relative_gaps[0] / 10
+    assert all(metadata['travel_time'] >= metadata['weight'] for _, _, metadata in city_map.edges(data=True))
+    assert any(metadata['travel_time'] > 1.5 * metadata['weight'] for _, _, metadata in city_map.edges(data=True))
+
+
+def test_assign_equilibrium_traffic_without_congestion(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    traffic_assignment = Simulator.assign_traffic(random_city_map, random_city_trips)
+
+    traffic_equilibrium = Simulator.assign_equilibrium_traffic(random_city_map, random_city_trips, road_capacity=1e9)
+
+    assert traffic_equilibrium.converged
+    assert 1 == traffic_equilibrium.iterations
+    assert np.array_equal(traffic_assignment.road_volumes, traffic_equilibrium.traffic_assignment.road_volumes)
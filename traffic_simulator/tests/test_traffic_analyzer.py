@@ -1,9 +1,16 @@
+from conftest import generate_random_city_map, generate_random_trips, generate_static_city_map
+import networkx as nx
 from pandas import DataFrame
+from pandas.testing import assert_frame_equal
 from networkx.classes.graph import Graph
+import numpy as np
+import pytest
 from typing import Dict
 
-from traffic_simulator.model import Trip
+from traffic_simulator.city_map import CityMap
+from traffic_simulator.model import BENEFIT_MATRIX_COLUMNS, CITY_MAP_VERSION, Trip
 from traffic_simulator.traffic_analysis import TrafficAnalyzer
+from traffic_simulator.trip_matrix import TripMatrixFactory
 
 
 def test_calculate_direct_road_benefit(static_city_map: Graph, static_city_trips: Dict[Trip, Trip]) -> None:
@@ -49,3 +56,215 @@ def test_get_road_recommendations(static_city_map: Graph, static_city_trips: Dic
     assert expect_benefit == actual_benefit
 
 
+def test_get_road_recommendations_batched(static_city_map: Graph, static_city_trips: Dict[Trip, Trip], static_benefit_matrix: DataFrame) -> None:
+    source = 2
+    destination = 0
+    expect_benefit = TrafficAnalyzer.get_benefit(static_benefit_matrix(0), source, destination)["benefit"].iloc[0]
+
+    actual_benefit_matrix = TrafficAnalyzer.get_road_recommendations(static_city_map, static_city_trips, batched=True)
+    actual_benefit = TrafficAnalyzer.get_benefit(actual_benefit_matrix, source, destination)["benefit"].iloc[0]
+
+    assert expect_benefit == pytest.approx(actual_benefit)
+
+
+def test_get_road_recommendations_batched_matches_scalar(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    expect_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips)
+    actual_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=True)
+
+    assert len(expect_benefit_matrix) == len(actual_benefit_matrix)
+
+    for source, destination, expect_benefit in expect_benefit_matrix.itertuples(index=False):
+        actual_benefit = TrafficAnalyzer.get_benefit(actual_benefit_matrix, source, destination)["benefit"].iloc[0]
+
+        assert expect_benefit == pytest.approx(actual_benefit)
+
+
+def test_update_road_recommendations(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=True)
+
+    for _ in range(3):
+        max_road_benefit = TrafficAnalyzer.get_max_road_benefit(benefit_matrix)
+        source = int(max_road_benefit["source"].iloc[0])
+        destination = int(max_road_benefit["destination"].iloc[0])
+
+        CityMap.add_road_segment(random_city_map, source, destination)
+        benefit_matrix = TrafficAnalyzer.update_road_recommendations(random_city_map,
+                                                                     random_city_trips,
+                                                                     benefit_matrix,
+                                                                     source,
+                                                                     destination)
+
+        # Full recompute on a copy of the city map without its cached distance matrix
+        expect_city_map = random_city_map.copy()
+        expect_city_map.graph.clear()
+        expect_benefit_matrix = TrafficAnalyzer.get_road_recommendations(expect_city_map, random_city_trips, batched=True)
+
+        assert len(expect_benefit_matrix) == len(benefit_matrix)
+
+        for expect_source, expect_destination, expect_benefit in expect_benefit_matrix.itertuples(index=False):
+            actual_benefit = TrafficAnalyzer.get_benefit(benefit_matrix, expect_source, expect_destination)["benefit"].iloc[0]
+
+            assert expect_benefit == pytest.approx(actual_benefit)
+
+
+def test_update_road_recommendations_after_two_roads(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=True)
+
+    for source, destination, _ in benefit_matrix.head(2).itertuples(index=False):
+        CityMap.add_road_segment(random_city_map, int(source), int(destination))
+
+    # The distances only record what changed with the second road, so the first one forces a full recompute
+    benefit_matrix = TrafficAnalyzer.update_road_recommendations(random_city_map,
+                                                                 random_city_trips,
+                                                                 benefit_matrix,
+                                                                 int(source),
+                                                                 int(destination))
+
+    expect_city_map = random_city_map.copy()
+    expect_city_map.graph.clear()
+    expect_benefit_matrix = TrafficAnalyzer.get_road_recommendations(expect_city_map, random_city_trips, batched=True)
+
+    assert len(expect_benefit_matrix) == len(benefit_matrix)
+
+    for expect_source, expect_destination, expect_benefit in expect_benefit_matrix.itertuples(index=False):
+        actual_benefit = TrafficAnalyzer.get_benefit(benefit_matrix, expect_source, expect_destination)["benefit"].iloc[0]
+
+        assert expect_benefit == pytest.approx(actual_benefit)
+
+
+def test_plan_roads(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    k = 3
+    number_of_roads = random_city_map.number_of_edges()
+    expect_city_map = random_city_map.copy()
+    expect_planned_roads = []
+
+    for _ in range(k):
+        benefit_matrix = TrafficAnalyzer.get_road_recommendations(expect_city_map, random_city_trips, batched=True)
+        source, destination, benefit = TrafficAnalyzer.get_max_road_benefit(benefit_matrix).iloc[0]
+        CityMap.add_road_segment(expect_city_map, int(source), int(destination))
+        expect_planned_roads.append((int(source), int(destination), benefit))
+
+    for lazy in (True, False):
+        actual_planned_roads = TrafficAnalyzer.plan_roads(random_city_map, random_city_trips, k, lazy=lazy)
+
+        assert len(actual_planned_roads) == k
+
+        for expect_road, actual_road in zip(expect_planned_roads, actual_planned_roads.itertuples(index=False)):
+            assert expect_road[:2] == (actual_road.source, actual_road.destination)
+            assert expect_road[2] == pytest.approx(actual_road.benefit)
+
+    assert number_of_roads == random_city_map.number_of_edges()
+
+
+@pytest.mark.parametrize("seed", [5, 13])
+def test_plan_roads_lazy_matches_eager(seed: int) -> None:
+    # Adding a road raises the benefit of some candidates on these maps, which a CELF heap would not rescore
+    city_map = generate_random_city_map(seed=seed)
+    trips = generate_random_trips(city_map, seed=seed)
+
+    expect_planned_roads = TrafficAnalyzer.plan_roads(city_map, trips, k=8, lazy=False)
+    actual_planned_roads = TrafficAnalyzer.plan_roads(city_map, trips, k=8, lazy=True)
+
+    assert expect_planned_roads[["source", "destination"]].values.tolist() == \
+        actual_planned_roads[["source", "destination"]].values.tolist()
+    assert expect_planned_roads["benefit"].tolist() == pytest.approx(actual_planned_roads["benefit"].tolist())
+
+
+def test_get_road_recommendations_workers(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    expect_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips)
+    actual_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, workers=2)
+
+    assert_frame_equal(expect_benefit_matrix, actual_benefit_matrix)
+
+
+def test_get_road_recommendations_trip_matrix(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    trip_matrix = TripMatrixFactory.create_trip_matrix_from_trips(random_city_map, random_city_trips, sparse=True)
+
+    expect_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips)
+    actual_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, trip_matrix)
+
+    assert_frame_equal(expect_benefit_matrix, actual_benefit_matrix)
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 40])
+def test_get_top_road_recommendations(random_city_map: Graph, random_city_trips: Dict[Trip, Trip], top_k: int) -> None:
+    benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=True)
+
+    top_benefit_matrix = TrafficAnalyzer.get_top_road_recommendations(random_city_map, random_city_trips, top_k, chunk_size=100)
+
+    assert top_k == len(top_benefit_matrix)
+    assert np.allclose(benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy()[:top_k],
+                       top_benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy())
+
+    for source, destination, benefit in top_benefit_matrix.itertuples(index=False):
+        assert np.isclose(benefit, TrafficAnalyzer.get_benefit(benefit_matrix, source, destination)[BENEFIT_MATRIX_COLUMNS[2]].iloc[0])
+
+
+def test_get_top_road_recommendations_filtered(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=True)
+    hops = dict(nx.all_pairs_shortest_path_length(random_city_map))
+    distances = dict(nx.all_pairs_dijkstra_path_length(random_city_map))
+    is_kept = [hops[source][destination] <= 2 and distances[source][destination] > 20
+               for source, destination in zip(benefit_matrix[BENEFIT_MATRIX_COLUMNS[0]], benefit_matrix[BENEFIT_MATRIX_COLUMNS[1]])]
+
+    top_benefit_matrix = TrafficAnalyzer.get_top_road_recommendations(random_city_map,
+                                                                      random_city_trips,
+                                                                      top_k=3,
+                                                                      max_hops=2,
+                                                                      min_distance=20)
+
+    assert np.allclose(benefit_matrix[is_kept][BENEFIT_MATRIX_COLUMNS[2]].to_numpy()[:3],
+                       top_benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy())
+
+
+@pytest.mark.parametrize("batched, workers", [(False, 1), (False, 2), (True, 1)])
+def test_get_road_recommendations_top_k(random_city_map: Graph,
+                                        random_city_trips: Dict[Trip, Trip],
+                                        batched: bool,
+                                        workers: int) -> None:
+    benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map, random_city_trips, batched=batched)
+
+    top_benefit_matrix = TrafficAnalyzer.get_road_recommendations(random_city_map,
+                                                                  random_city_trips,
+                                                                  batched=batched,
+                                                                  workers=workers,
+                                                                  top_k=5,
+                                                                  chunk_size=7)
+
+    assert 5 == len(top_benefit_matrix)
+    assert CityMap.get_version(random_city_map) == top_benefit_matrix.attrs[CITY_MAP_VERSION]
+    assert np.allclose(benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy()[:5],
+                       top_benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy())
+    assert_frame_equal(TrafficAnalyzer.get_max_road_benefit(benefit_matrix).reset_index(drop=True),
+                       TrafficAnalyzer.get_max_road_benefit(top_benefit_matrix).reset_index(drop=True),
+                       check_dtype=False)
+
+
+def test_get_benefit_matrix_top_k(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    distances = CityMap.get_distance_matrix(random_city_map).distances
+    trip_counts = TrafficAnalyzer.get_trip_count_matrix(random_city_map, random_city_trips)
+    benefit_matrix = TrafficAnalyzer.get_benefit_matrix(random_city_map, distances, trip_counts)
+
+    top_benefit_matrix = TrafficAnalyzer.get_benefit_matrix(random_city_map, distances, trip_counts, top_k=len(benefit_matrix) + 10)
+
+    assert len(benefit_matrix) == len(top_benefit_matrix)
+    assert np.array_equal(benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy(),
+                          top_benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy())
+
+    top_benefit_matrix = TrafficAnalyzer.get_benefit_matrix(random_city_map, distances, trip_counts, chunk_size=7, top_k=5)
+
+    assert np.array_equal(benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy()[:5],
+                          top_benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy())
+
+
+def test_get_road_recommendations_after_add_edge(static_city_map: Graph, static_city_trips: Dict[Trip, Trip]) -> None:
+    TrafficAnalyzer.get_road_recommendations(static_city_map, static_city_trips)
+    static_city_map.add_edge(1, 2, weight=1)
+
+    expect_city_map = generate_static_city_map()
+    expect_city_map.add_edge(1, 2, weight=1)
+
+    for batched in [False, True]:
+        assert_frame_equal(TrafficAnalyzer.get_road_recommendations(expect_city_map, static_city_trips, batched=batched),
+                           TrafficAnalyzer.get_road_recommendations(static_city_map, static_city_trips, batched=batched),
+                           check_like=True)
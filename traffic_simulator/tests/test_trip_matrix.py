@@ -0,0 +1,56 @@
+from networkx.classes.graph import Graph
+import numpy as np
+import pytest
+from typing import Dict
+
+from traffic_simulator.model import Trip
+from traffic_simulator.trip_matrix import TripMatrix, TripMatrixFactory
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_create_trip_matrix_from_trips(static_city_map: Graph, static_city_trips: Dict[Trip, Trip], sparse: bool) -> None:
+    trip_matrix = TripMatrixFactory.create_trip_matrix_from_trips(static_city_map, static_city_trips, sparse)
+
+    for trip in static_city_trips.values():
+        assert trip.numer_of_trips == trip_matrix.get_trips(trip.source, trip.destination)
+
+    assert 3 == trip_matrix.get_round_trips(2, 1)
+    assert 3 == trip_matrix.get_round_trips(1, 2)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_trip_matrix_to_trips(static_city_map: Graph, static_city_trips: Dict[Trip, Trip], sparse: bool) -> None:
+    trip_matrix = TripMatrixFactory.create_trip_matrix_from_trips(static_city_map, static_city_trips, sparse)
+    expect_trips = {trip: trip for trip in static_city_trips.values() if trip.numer_of_trips > 0}
+
+    actual_trips = trip_matrix.to_trips()
+
+    assert expect_trips.keys() == actual_trips.keys()
+
+    for trip in expect_trips.values():
+        assert trip.numer_of_trips == actual_trips[trip].numer_of_trips
+
+
+def test_trip_matrix_sparse_to_dense(random_city_map: Graph, random_city_trips: Dict[Trip, Trip]) -> None:
+    dense_trip_matrix = TripMatrixFactory.create_trip_matrix_from_trips(random_city_map, random_city_trips)
+    sparse_trip_matrix = TripMatrixFactory.create_trip_matrix_from_trips(random_city_map, random_city_trips, sparse=True)
+
+    assert dense_trip_matrix.trip_counts.dtype == np.int32
+    assert dense_trip_matrix.nbytes == 4 * random_city_map.number_of_nodes() ** 2
+    assert np.array_equal(dense_trip_matrix.to_dense(), sparse_trip_matrix.to_dense())
+    assert np.array_equal(dense_trip_matrix.get_symmetric_trip_counts(), sparse_trip_matrix.get_symmetric_trip_counts())
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_symmetric_trip_counts_do_not_overflow(sparse: bool) -> None:
+    max_trips = np.iinfo(np.int32).max
+    trip_matrix = TripMatrixFactory.create_trip_matrix([0, 1],
+                                                       np.array([0, 1]),
+                                                       np.array([1, 0]),
+                                                       np.array([max_trips, max_trips]),
+                                                       sparse)
+
+    symmetric_trip_counts = trip_matrix.get_symmetric_trip_counts()
+
+    assert symmetric_trip_counts[0, 1] == 2 * max_trips
+    assert np.array_equal(TripMatrix.sum_round_trips(trip_matrix.to_dense()), symmetric_trip_counts)
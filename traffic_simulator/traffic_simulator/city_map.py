@@ -1,49 +1,73 @@
 
 from itertools import permutations
+import json
 import matplotlib.pyplot as plt
 import networkx as nx
 from networkx.classes.graph import Graph
-from typing import Any, Dict, List, Set, Tuple
+from networkx.readwrite import json_graph
+import numpy as np
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 
-from traffic_simulator.model import Road, ShortestPathAlgo
+from traffic_simulator.contraction_hierarchy import ContractionHierarchy, ContractionHierarchyFactory
+from traffic_simulator.csr_graph import CSRGraph, CSRGraphFactory, ShortestPathTree
+from traffic_simulator.distance_matrix import DistanceMatrix, DistanceMatrixFactory
+from traffic_simulator.landmark_index import LandmarkIndex, LandmarkIndexFactory
+from traffic_simulator.model import CITY_MAP_CACHES, CITY_MAP_FINGERPRINT, CITY_MAP_VERSION, CONTRACTION_HIERARCHY, CSR_GRAPH, \
+    DISTANCE_MATRIX, LANDMARK_INDEX, SHORTEST_PATH_CACHE, GraphBackend, ShortestPathAlgo
+from traffic_simulator.possible_trips import PossibleTrips, PossibleTripsFactory
+from traffic_simulator.shortest_path_cache import ShortestPathCache, ShortestPathCacheFactory, ShortestPathCacheStats
+from traffic_simulator.trip_linked_list import TripLinkedList
+from traffic_simulator.trip_matrix import TripMatrix
 
 
-class TripLinkedList:
-    def __init__(self):
-        self.head = None
-
-    def insert(self, metadata: Dict) -> None:
-        new_road = Road(metadata=metadata)
-
-        if self.head is None:
-            self.head = new_road
-            return
+class CityMap:
+    @staticmethod
+    def get_road_permutations(city_map: Graph,
+                              source: int,
+                              destination: int,
+                              shortest_path_algo: ShortestPathAlgo,
+                              eager: bool = True) -> Union[Iterator[Tuple[int, ...]], List[Tuple[int, ...]]]:
+        """
+        Orderings of the locations on the shortest path between two locations.  There are n! of them for a path
+        of n locations, so unset eager to generate them one at a time instead of in a list.
 
-        current_road = self.head
+        Parameters:
+        city_map:           Network Graph representation of the city map
+        source:             Source location
+        destination:        Destination location
+        shortest_path_algo: Algorithm finding the shortest path
+        eager:              Return every ordering in a list, or an iterator generating them one at a time if unset
 
-        while current_road.next:
-            current_road = current_road.next
+        Returns:
+        road_permutations: Orderings of the locations on the shortest path
+        """
+        shortest_path = CityMap.get_shortest_path(city_map, source, destination, shortest_path_algo)
 
-        current_road.next = new_road
+        if eager:
+            return list(permutations(shortest_path))
 
+        return permutations(shortest_path)
 
-class CityMap:
     @staticmethod
-    def get_road_permutations(city_map: Graph,
-                              source: int,
-                              destination: int, shortest_path_algo: ShortestPathAlgo) -> List[Tuple[int, int]]:
-        if shortest_path_algo == ShortestPathAlgo.A_STAR.value:
-            shortest_path = nx.astar_path(city_map, source, destination)
-        elif shortest_path_algo == ShortestPathAlgo.DIJKSTRA.value:
-            shortest_path = nx.dijkstra_path(city_map, source, destination)
+    def get_possible_trips(city_map: Graph, eager: bool = True) -> Union[PossibleTrips, Set[Tuple[int, int]]]:
+        """
+        Every trip between two different locations of the city map.  With eager unset, the n * (n - 1) trips are
+        not stored but represented by their index range, which can be iterated, chunked into position arrays, or
+        sampled.
 
-        return list(permutations(shortest_path))
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        eager:      Return every trip in a set, or their index range if unset
 
-    @staticmethod
-    def get_possible_trips(city_map: Graph) -> Set[Tuple[int, int]]:
+        Returns:
+        possible_trips: Source and destination locations of every trip
+        """
         locations = list(city_map.nodes())
 
+        if not eager:
+            return PossibleTripsFactory.create_possible_trips(locations)
+
         trips = set()
 
         for source, destination in permutations(locations, 2):
@@ -59,28 +83,451 @@ class CityMap:
     def get_new_road_candidates(city_map: Graph):
         return set(nx.non_edges(city_map))
 
+    @staticmethod
+    def get_new_road_candidate_chunks(city_map: Graph,
+                                      max_hops: Optional[int] = None,
+                                      min_distance: Optional[float] = None,
+                                      trip_counts: Optional[np.ndarray] = None,
+                                      chunk_size: int = 1_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Streams the pairs of locations without a road between them, each once as (x, y) with x before y in the
+        city map, in chunks of positions.  Unlike get_new_road_candidates the pairs are filtered a block of rows at
+        a time, so only the candidates kept are ever materialized.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        max_hops:       Only keep pairs at most this many roads apart
+        min_distance:   Only keep pairs whose shortest path is longer than this
+        trip_counts:    Only keep pairs with trips between them in either direction, indexed by position
+        chunk_size:     Number of pairs of locations filtered at once
+
+        Returns:
+        road_candidates: Positions of the x and y locations of each chunk of candidates
+        """
+        csr_graph = CityMap.get_csr_graph(city_map)
+        number_of_locations = csr_graph.number_of_locations
+        degrees = np.diff(csr_graph.offsets)
+        distances = None if min_distance is None else CityMap.get_distance_matrix(city_map).distances
+        symmetric_trip_counts = None if trip_counts is None else TripMatrix.sum_round_trips(trip_counts)
+        rows_per_chunk = max(1, chunk_size // max(number_of_locations, 1))
+
+        for start in range(0, number_of_locations, rows_per_chunk):
+            rows = np.arange(start, min(start + rows_per_chunk, number_of_locations))
+            is_candidate = rows[:, None] < np.arange(number_of_locations)
+            is_candidate[np.repeat(rows - start, degrees[rows]),
+                         csr_graph.indices[csr_graph.offsets[start]:csr_graph.offsets[rows[-1] + 1]]] = False
+
+            if max_hops is not None:
+                is_candidate &= CityMap.get_within_hops(csr_graph, rows, max_hops)
+
+            if distances is not None:
+                is_candidate &= distances[rows] > min_distance
+
+            if symmetric_trip_counts is not None:
+                is_candidate &= symmetric_trip_counts[rows] > 0
+
+            x, y = np.nonzero(is_candidate)
+
+            if len(x):
+                yield x + start, y
+
+    @staticmethod
+    def get_within_hops(csr_graph: CSRGraph, rows: np.ndarray, max_hops: int) -> np.ndarray:
+        # Breadth first search from every row at once, one road further per hop
+        degrees = np.diff(csr_graph.offsets)
+        has_roads = degrees > 0
+        first_roads = np.minimum(csr_graph.offsets[:-1], max(len(csr_graph.indices) - 1, 0))
+
+        is_reached = np.zeros((len(rows), csr_graph.number_of_locations), dtype=bool)
+        is_reached[np.arange(len(rows)), rows] = True
+
+        for _ in range(max_hops):
+            if not len(csr_graph.indices):
+                break
+
+            is_reached |= np.logical_or.reduceat(is_reached[:, csr_graph.indices], first_roads, axis=1) & has_roads
+
+        return is_reached
+
     @staticmethod
     def get_road_segment(city_map: Graph, source: int, destination: int) -> Dict[str, Any]:
         return city_map.get_edge_data(source, destination)
 
     @staticmethod
-    def get_shortest_path(city_map: Graph, source: int, destination: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA) -> List[int]:
-        if shortest_path_algo == ShortestPathAlgo.A_STAR:
-            return nx.astar_path(city_map, source, destination)
-        elif shortest_path_algo == ShortestPathAlgo.DIJKSTRA:
-            return nx.dijkstra_path(city_map, source, destination)
+    def get_shortest_path(city_map: Graph, source: int, destination: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA, backend=GraphBackend.NETWORKX) -> List[int]:
+        return CityMap.find_shortest_path(city_map, source, destination, shortest_path_algo, backend)[0]
+
+    @staticmethod
+    def get_shortest_path_length(city_map: Graph, source: int, destination: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA, backend=GraphBackend.NETWORKX) -> float:
+        return CityMap.find_shortest_path(city_map, source, destination, shortest_path_algo, backend)[1]
 
     @staticmethod
-    def get_shortest_path_length(city_map: Graph, source: int, destination: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA) -> List[int]:
+    def find_shortest_path(city_map: Graph,
+                           source: int,
+                           destination: int,
+                           shortest_path_algo=ShortestPathAlgo.DIJKSTRA,
+                           backend=GraphBackend.NETWORKX) -> Tuple[List[int], float]:
+        """
+        Finds the shortest path between two locations.  Every path method of the city map is routed through here, so
+        the algorithm is honored the same way everywhere.  A* is directed by the scaled straight line distance when
+        the locations of the city map have coordinates, and degrades to Dijkstra's search otherwise.
+
+        Parameters:
+        city_map:           Network Graph representation of the city map
+        source:             Location the path starts at
+        destination:        Location the path ends at
+        shortest_path_algo: ShortestPathAlgo or its value
+        backend:            Graph library the search runs on, ignored by contraction hierarchies and when the
+                            shortest path cache is enabled
+
+        Returns:
+        shortest_path: Locations on the shortest path and its length
+
+        Raises:
+        NetworkXNoPath: If the destination cannot be reached from the source, whatever the algorithm and backend
+        """
+        shortest_path_algo = ShortestPathAlgo(shortest_path_algo)
+
+        if shortest_path_algo == ShortestPathAlgo.CONTRACTION_HIERARCHY:
+            contraction_hierarchy = CityMap.get_contraction_hierarchy(city_map)
+            contraction_hierarchy_path = contraction_hierarchy.query(contraction_hierarchy.location_index[source],
+                                                                     contraction_hierarchy.location_index[destination])
+
+            if not np.isfinite(contraction_hierarchy_path.distance):
+                raise nx.NetworkXNoPath(f"Node {destination} not reachable from {source}")
+
+            return ([contraction_hierarchy.locations[position] for position in contraction_hierarchy_path.path],
+                    contraction_hierarchy_path.distance)
+
+        use_cache = CityMap.get_shortest_path_cache(city_map) is not None
+
+        if use_cache or GraphBackend(backend) == GraphBackend.CSR:
+            csr_graph = CityMap.get_csr_graph(city_map)
+            destination_index = csr_graph.location_index[destination]
+
+            if use_cache:
+                tree = CityMap.get_shortest_path_tree(city_map, source, shortest_path_algo)
+            else:
+                tree = CityMap.search(city_map, source, destination, shortest_path_algo)
+
+            if not np.isfinite(tree.distances[destination_index]):
+                raise nx.NetworkXNoPath(f"Node {destination} not reachable from {source}")
+
+            return ([csr_graph.locations[position] for position in tree.get_path(destination_index)],
+                    float(tree.distances[destination_index]))
+
         if shortest_path_algo == ShortestPathAlgo.A_STAR:
-            return nx.astar_path_length(city_map, source, destination)
+            shortest_path = nx.astar_path(city_map, source, destination, CityMap.get_heuristic(city_map, destination))
         elif shortest_path_algo == ShortestPathAlgo.DIJKSTRA:
-            return nx.dijkstra_path_length(city_map, source, destination)
+            shortest_path = nx.dijkstra_path(city_map, source, destination)
+
+        return shortest_path, nx.path_weight(city_map, shortest_path, 'weight')
+
+    @staticmethod
+    def search(city_map: Graph, source: int, destination: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA) -> ShortestPathTree:
+        csr_graph = CityMap.get_csr_graph(city_map)
+        destination_index = csr_graph.location_index[destination]
+        heuristic = None
+
+        if ShortestPathAlgo(shortest_path_algo) == ShortestPathAlgo.A_STAR:
+            heuristic = CityMap.get_position_heuristic(city_map, destination_index)
+
+        return csr_graph.search(csr_graph.location_index[source], destination_index, shortest_path_algo, heuristic)
+
+    @staticmethod
+    def get_heuristic(city_map: Graph, destination: int) -> Optional[Callable[[int, int], float]]:
+        csr_graph = CityMap.get_csr_graph(city_map)
+        heuristic = CityMap.get_position_heuristic(city_map, csr_graph.location_index[destination])
+
+        if heuristic is None:
+            return None
+
+        location_index = csr_graph.location_index
+
+        return lambda location, _: heuristic(location_index[location])
+
+    @staticmethod
+    def get_position_heuristic(city_map: Graph, destination: int) -> Optional[Callable[[int], float]]:
+        """
+        A* heuristic towards the destination over the positions of the locations.  The bound is the largest of the
+        scaled straight line distance, when the locations have coordinates, and the landmark bound, when a landmark
+        index of the current version is set.  Both bounds are consistent, so their maximum is as well.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        destination:    Position of the destination location
+
+        Returns:
+        heuristic: Lower bound of the distance from a position to the destination, or None without any bound
+        """
+        csr_graph = CityMap.get_csr_graph(city_map)
+        landmark_index = CityMap.get_landmark_index(city_map)
+        lower_bounds = csr_graph.get_euclidean_lower_bounds(destination)
+
+        if landmark_index is not None:
+            landmark_lower_bounds = landmark_index.get_lower_bounds(destination)
+            lower_bounds = landmark_lower_bounds if lower_bounds is None else np.maximum(lower_bounds, landmark_lower_bounds)
+
+        return None if lower_bounds is None else lower_bounds.tolist().__getitem__
 
     @staticmethod
     def add_road_segment(city_map: Graph, source: int, destination: int, shrinkage_factor=0.6, shortest_path_algo=ShortestPathAlgo.DIJKSTRA) -> None:
-        road_length = nx.astar_path_length(city_map, source, destination) * shrinkage_factor
+        road_length = CityMap.get_shortest_path_length(city_map, source, destination, shortest_path_algo) * shrinkage_factor
+        version = CityMap.get_version(city_map)
+        distance_matrix = city_map.graph.get(DISTANCE_MATRIX)
+
         city_map.add_edge(source, destination, weight=road_length)
+        CityMap._increment_version(city_map)
+
+        # Roll a cached distance matrix of the previous version forward instead of dropping it
+        if distance_matrix is not None and distance_matrix.version == version:
+            city_map.graph[DISTANCE_MATRIX] = DistanceMatrixFactory.add_road_segment(distance_matrix,
+                                                                                     source,
+                                                                                     destination,
+                                                                                     road_length,
+                                                                                     CityMap.get_version(city_map))
+
+    @staticmethod
+    def get_version(city_map: Graph, check_roads: bool = True) -> int:
+        """
+        Version of the roads of the city map, which every cache of the city map is checked against.  add_road_segment
+        moves the city map to the next version, and so does any other change of its roads, such as add_edge or a
+        new road length, which is found by a fingerprint of the roads taken on every call.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        check_roads:    Check the roads against the fingerprint, which takes a pass over the roads.  Loops that do
+                        not change the roads check them once and skip it for every following call
+
+        Returns:
+        version: Version of the roads of the city map
+        """
+        if not check_roads:
+            return city_map.graph.get(CITY_MAP_VERSION, 0)
+
+        fingerprint = CityMap.get_fingerprint(city_map)
+        recorded_fingerprint = city_map.graph.get(CITY_MAP_FINGERPRINT)
+
+        if recorded_fingerprint != fingerprint:
+            if recorded_fingerprint is not None:
+                city_map.graph[CITY_MAP_VERSION] = city_map.graph.get(CITY_MAP_VERSION, 0) + 1
+
+            city_map.graph[CITY_MAP_FINGERPRINT] = fingerprint
+
+        return city_map.graph.get(CITY_MAP_VERSION, 0)
+
+    @staticmethod
+    def get_fingerprint(city_map: Graph) -> Tuple[int, int, float]:
+        # Number of locations and roads and total road length, which adding, removing or changing a road changes
+        return city_map.number_of_nodes(), city_map.number_of_edges(), float(city_map.size(weight='weight'))
+
+    @staticmethod
+    def _increment_version(city_map: Graph) -> None:
+        city_map.graph[CITY_MAP_VERSION] = city_map.graph.get(CITY_MAP_VERSION, 0) + 1
+        city_map.graph[CITY_MAP_FINGERPRINT] = CityMap.get_fingerprint(city_map)
+
+    @staticmethod
+    def get_csr_graph(city_map: Graph) -> CSRGraph:
+        version = CityMap.get_version(city_map)
+        csr_graph = city_map.graph.get(CSR_GRAPH)
+
+        if csr_graph is None or csr_graph.version != version:
+            csr_graph = CSRGraphFactory.create_csr_graph(city_map, version)
+            city_map.graph[CSR_GRAPH] = csr_graph
+
+        return csr_graph
+
+    @staticmethod
+    def create_landmark_index(city_map: Graph, number_of_landmarks: int = 16, seed: int = 1000) -> LandmarkIndex:
+        """
+        Preprocesses the city map for A* point-to-point queries by computing the shortest path lengths from a few
+        landmarks to every location.  The index directs every following A* search until a road is added.
+
+        Parameters:
+        city_map:               Network Graph representation of the city map
+        number_of_landmarks:    Number of landmarks, each one takes one Dijkstra search and 8 bytes per location
+        seed:                   Seed of the random generator picking the first landmark
+
+        Returns:
+        landmark_index: Shortest path lengths from each landmark to every location
+        """
+        landmark_index = LandmarkIndexFactory.create_landmark_index(CityMap.get_csr_graph(city_map),
+                                                                    number_of_landmarks,
+                                                                    seed)
+        city_map.graph[LANDMARK_INDEX] = landmark_index
+
+        return landmark_index
+
+    @staticmethod
+    def set_landmark_index(city_map: Graph, landmark_index: LandmarkIndex) -> None:
+        csr_graph = CityMap.get_csr_graph(city_map)
+
+        if not landmark_index.is_valid_for(csr_graph):
+            raise ValueError("Landmark index was computed for a different city map")
+
+        landmark_index.version = csr_graph.version
+        city_map.graph[LANDMARK_INDEX] = landmark_index
+
+    @staticmethod
+    def get_landmark_index(city_map: Graph) -> Optional[LandmarkIndex]:
+        landmark_index = city_map.graph.get(LANDMARK_INDEX)
+
+        # Adding a road shortens paths, so landmark distances of an earlier version may overestimate
+        if landmark_index is None or landmark_index.version != CityMap.get_version(city_map):
+            return None
+
+        return landmark_index
+
+    @staticmethod
+    def save_city_map(city_map: Graph, path: str) -> None:
+        """
+        Saves the locations and roads of the city map as node-link JSON.  A landmark index of the current version is
+        saved next to it, so load_city_map does not need to recompute it.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        path:       Path of the JSON file
+        """
+        city_map_data = CityMap.get_city_map_data(city_map)
+
+        with open(path, 'w') as city_map_file:
+            json.dump(city_map_data, city_map_file)
+
+        landmark_index = CityMap.get_landmark_index(city_map)
+
+        if landmark_index is not None:
+            LandmarkIndexFactory.save_landmark_index(landmark_index, LandmarkIndexFactory.get_landmark_index_path(path))
+
+    @staticmethod
+    def get_city_map_data(city_map: Graph) -> Dict[str, Any]:
+        """
+        Node-link data of the city map without the caches stored on its graph, so it can be dumped as JSON.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+
+        Returns:
+        city_map_data: Node-link data of the locations, roads and other graph attributes of the city map
+        """
+        city_map_data = json_graph.node_link_data(city_map)
+        city_map_data['graph'] = {key: value for key, value in city_map.graph.items() if key not in CITY_MAP_CACHES}
+
+        return city_map_data
+
+    @staticmethod
+    def load_city_map(path: str) -> Graph:
+        with open(path) as city_map_file:
+            city_map = json_graph.node_link_graph(json.load(city_map_file))
+
+        landmark_index = LandmarkIndexFactory.load_if_exists(LandmarkIndexFactory.get_landmark_index_path(path))
+
+        if landmark_index is not None:
+            CityMap.set_landmark_index(city_map, landmark_index)
+
+        return city_map
+
+    @staticmethod
+    def enable_shortest_path_cache(city_map: Graph, capacity: int = 128) -> ShortestPathCache:
+        """
+        Caches the single-source shortest path trees of the city map so that every point query from the same source
+        is answered from one search.  Once enabled get_shortest_path and get_shortest_path_length are answered from
+        the cached trees regardless of the backend.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        capacity:   Number of shortest path trees to keep before evicting the least recently used one
+
+        Returns:
+        shortest_path_cache: Shortest path cache of the city map
+        """
+        shortest_path_cache = ShortestPathCacheFactory.create_shortest_path_cache(capacity, city_map.graph)
+        city_map.graph[SHORTEST_PATH_CACHE] = shortest_path_cache
+
+        return shortest_path_cache
+
+    @staticmethod
+    def disable_shortest_path_cache(city_map: Graph) -> None:
+        city_map.graph.pop(SHORTEST_PATH_CACHE, None)
+
+    @staticmethod
+    def get_shortest_path_cache(city_map: Graph) -> Optional[ShortestPathCache]:
+        shortest_path_cache = city_map.graph.get(SHORTEST_PATH_CACHE)
+
+        # Copies of the city map share the attributes of its graph, so a copy gets a cache of its own on first use
+        # instead of reading the trees of a map whose version may match but whose roads differ
+        if shortest_path_cache is not None and shortest_path_cache.graph_attributes is not city_map.graph:
+            shortest_path_cache = ShortestPathCacheFactory.create_shortest_path_cache(shortest_path_cache.capacity,
+                                                                                      city_map.graph)
+            city_map.graph[SHORTEST_PATH_CACHE] = shortest_path_cache
+
+        return shortest_path_cache
+
+    @staticmethod
+    def get_shortest_path_cache_stats(city_map: Graph) -> Optional[ShortestPathCacheStats]:
+        shortest_path_cache = CityMap.get_shortest_path_cache(city_map)
+
+        return None if shortest_path_cache is None else shortest_path_cache.get_stats()
+
+    @staticmethod
+    def get_shortest_path_tree(city_map: Graph, source: int, shortest_path_algo=ShortestPathAlgo.DIJKSTRA) -> ShortestPathTree:
+        csr_graph = CityMap.get_csr_graph(city_map)
+        source_index = csr_graph.location_index[source]
+
+        # A single-source search has no destination to direct A* towards, so the tree is settled like Dijkstra's
+        # whatever the algorithm, and one tree per source serves them all
+        def create_tree() -> ShortestPathTree:
+            return csr_graph.dijkstra(source_index)
+
+        shortest_path_cache = CityMap.get_shortest_path_cache(city_map)
+
+        if shortest_path_cache is None:
+            return create_tree()
+
+        return shortest_path_cache.get_tree((csr_graph.version, source_index), create_tree)
+
+    @staticmethod
+    def get_contraction_hierarchy(city_map: Graph) -> ContractionHierarchy:
+        """
+        Returns the contraction hierarchy of the city map, which ShortestPathAlgo.CONTRACTION_HIERARCHY queries run
+        on.  Contracting the city map is expensive, so it is done on the first query and cached on the graph until
+        a road is added.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+
+        Returns:
+        contraction_hierarchy: Contraction hierarchy of the current version of the city map
+        """
+        version = CityMap.get_version(city_map)
+        contraction_hierarchy = city_map.graph.get(CONTRACTION_HIERARCHY)
+
+        if contraction_hierarchy is None or contraction_hierarchy.version != version:
+            contraction_hierarchy = ContractionHierarchyFactory.create_contraction_hierarchy(CityMap.get_csr_graph(city_map))
+            city_map.graph[CONTRACTION_HIERARCHY] = contraction_hierarchy
+
+        return contraction_hierarchy
+
+    @staticmethod
+    def get_distance_matrix(city_map: Graph, check_roads: bool = True) -> DistanceMatrix:
+        """
+        Returns the all-pairs shortest path lengths of the city map.  The matrix is computed once per version of the
+        city map and cached on the graph.  add_road_segment updates a cached matrix in place of recomputing it.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        check_roads:    Check the roads against the fingerprint of the version, see get_version
+
+        Returns:
+        distance_matrix: Dense all-pairs shortest path lengths of the current version of the city map
+        """
+        version = CityMap.get_version(city_map, check_roads)
+        distance_matrix = city_map.graph.get(DISTANCE_MATRIX)
+
+        if distance_matrix is None or distance_matrix.version != version:
+            distance_matrix = DistanceMatrixFactory.create_distance_matrix(city_map, version, CityMap.get_csr_graph(city_map))
+            city_map.graph[DISTANCE_MATRIX] = distance_matrix
+
+        return distance_matrix
 
     @staticmethod
     def get_city_map_statistics(city_map: Graph) ->None:
@@ -96,7 +543,10 @@ class CityMap:
     @staticmethod
     def visualize_city_map(city_map: Graph, location_size=1200, location_font_size=20, road_widths=4) -> None:
         links = [(u, v) for (u, v, d) in city_map.edges(data=True)]
-        pos = nx.nx_pydot.graphviz_layout(city_map)
+        pos = nx.get_node_attributes(city_map, 'pos')
+
+        if len(pos) < city_map.number_of_nodes():
+            pos = nx.nx_pydot.graphviz_layout(city_map)
         nx.draw_networkx_nodes(city_map, pos, node_size=location_size, node_color='lightblue', linewidths=0.25)  # draw nodes
         nx.draw_networkx_edges(city_map, pos, edgelist=links, width=road_widths)  # draw edges
 
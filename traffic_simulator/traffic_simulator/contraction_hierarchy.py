@@ -0,0 +1,339 @@
+from dataclasses import dataclass, field
+import heapq
+import numpy as np
+import time
+from typing import Dict, List, Optional, Tuple
+
+from traffic_simulator.csr_graph import INFINITY, CSRGraph
+
+# Witness searches give up after settling this many locations and add the shortcut, which is always correct
+MAX_WITNESS_SETTLED = 64
+
+# Estimating the shortcuts of a location for its priority only needs a rough count, so its searches stop earlier
+MAX_PRIORITY_WITNESS_SETTLED = 8
+
+
+@dataclass
+class ContractionHierarchyPath:
+    distance: float
+    path: List[int]
+    expanded_nodes: int
+
+
+@dataclass
+class ContractionHierarchyStats:
+    number_of_locations: int
+    number_of_roads: int
+    number_of_shortcuts: int
+    preprocessing_seconds: float
+    nbytes: int
+    queries: int
+    mean_query_seconds: float
+
+
+@dataclass
+class ContractionHierarchy:
+    """
+    Contraction hierarchy of an undirected city map.  Locations are contracted one at a time in rank order, adding a
+    shortcut between two neighbors of the contracted location whenever the path through it is the only shortest one.
+    The roads and shortcuts from the location at position i to locations of a higher rank are
+    indices[offsets[i]:offsets[i + 1]], and middles holds the location a shortcut skips, or -1 for a road.  Every
+    shortest path climbs the ranks up to one location and descends from there, so a bidirectional search that only
+    climbs settles a handful of locations.
+    """
+    version: int
+    locations: List[int]
+    location_index: Dict[int, int]
+    ranks: np.ndarray
+    offsets: np.ndarray
+    indices: np.ndarray
+    weights: np.ndarray
+    middles: np.ndarray
+    number_of_roads: int
+    preprocessing_seconds: float
+    queries: int = 0
+    query_seconds: float = 0.0
+    _upward: Optional[List[List[Tuple[int, float, int]]]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def number_of_shortcuts(self) -> int:
+        return int(np.count_nonzero(self.middles >= 0))
+
+    @property
+    def nbytes(self) -> int:
+        return self.ranks.nbytes + self.offsets.nbytes + self.indices.nbytes + self.weights.nbytes + self.middles.nbytes
+
+    def get_stats(self) -> ContractionHierarchyStats:
+        return ContractionHierarchyStats(number_of_locations=len(self.locations),
+                                         number_of_roads=self.number_of_roads,
+                                         number_of_shortcuts=self.number_of_shortcuts,
+                                         preprocessing_seconds=self.preprocessing_seconds,
+                                         nbytes=self.nbytes,
+                                         queries=self.queries,
+                                         mean_query_seconds=self.query_seconds / self.queries if self.queries else 0.0)
+
+    def get_shortest_path(self, source: int, destination: int) -> List[int]:
+        path = self.query(self.location_index[source], self.location_index[destination]).path
+
+        return [self.locations[position] for position in path]
+
+    def get_shortest_path_length(self, source: int, destination: int) -> float:
+        return self.query(self.location_index[source], self.location_index[destination]).distance
+
+    def query(self, source: int, destination: int) -> ContractionHierarchyPath:
+        """
+        Bidirectional Dijkstra search that only follows roads and shortcuts to locations of a higher rank.  A
+        direction stops once its next location is further than the shortest path found through a meeting location.
+
+        Parameters:
+        source:         Position of the source location
+        destination:    Position of the destination location
+
+        Returns:
+        contraction_hierarchy_path: Length of the shortest path, the positions on it and the locations expanded
+        """
+        start = time.perf_counter()
+        upward = self._get_upward()
+        distances = ({source: 0.0}, {destination: 0.0})
+        predecessors = ({source: (-1, -1)}, {destination: (-1, -1)})
+        queues = ([(0.0, source)], [(0.0, destination)])
+        best_distance = INFINITY
+        meeting_location = -1
+        expanded_nodes = 0
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+
+        while queues[0] or queues[1]:
+            # Expand the direction with the closer next location
+            direction = 0 if queues[0] and (not queues[1] or queues[0][0][0] <= queues[1][0][0]) else 1
+            queue = queues[direction]
+            distance, location = heappop(queue)
+
+            if distance > distances[direction][location]:
+                continue
+
+            if distance >= best_distance:
+                queue.clear()
+                continue
+
+            expanded_nodes += 1
+            other_distance = distances[1 - direction].get(location)
+
+            if other_distance is not None and distance + other_distance < best_distance:
+                best_distance = distance + other_distance
+                meeting_location = location
+
+            direction_distances = distances[direction]
+
+            for neighbor, road_weight, road in upward[location]:
+                neighbor_distance = distance + road_weight
+
+                if neighbor_distance < direction_distances.get(neighbor, INFINITY):
+                    direction_distances[neighbor] = neighbor_distance
+                    predecessors[direction][neighbor] = (location, road)
+                    heappush(queue, (neighbor_distance, neighbor))
+
+        path = [] if meeting_location < 0 else self._unpack_path(predecessors, source, destination, meeting_location)
+
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - start
+
+        return ContractionHierarchyPath(distance=best_distance, path=path, expanded_nodes=expanded_nodes)
+
+    def _unpack_path(self,
+                     predecessors: Tuple[Dict[int, Tuple[int, int]], Dict[int, Tuple[int, int]]],
+                     source: int,
+                     destination: int,
+                     meeting_location: int) -> List[int]:
+        # Both searches climbed up to the meeting location, so walk each one back down, unpacking every shortcut
+        source_path = [source]
+        destination_path = [destination]
+
+        for path, direction_predecessors in zip((source_path, destination_path), predecessors):
+            for lower_location, road in reversed(self._get_roads(direction_predecessors, meeting_location)):
+                path.extend(self._unpack_road(lower_location, road)[1:])
+
+        return source_path + destination_path[-2::-1]
+
+    @staticmethod
+    def _get_roads(predecessors: Dict[int, Tuple[int, int]], location: int) -> List[Tuple[int, int]]:
+        roads = []
+
+        while predecessors[location][0] >= 0:
+            roads.append(predecessors[location])
+            location = predecessors[location][0]
+
+        return roads
+
+    def _unpack_road(self, location: int, road: int) -> List[int]:
+        # Positions from the lower ranked end of a road or shortcut to its higher ranked end
+        middle = int(self.middles[road])
+        neighbor = int(self.indices[road])
+
+        if middle < 0:
+            return [location, neighbor]
+
+        # The skipped location was contracted before both ends, so both halves are stored at it
+        first_half = self._unpack_road(middle, self._find_road(middle, location))
+        second_half = self._unpack_road(middle, self._find_road(middle, neighbor))
+
+        return first_half[::-1] + second_half[1:]
+
+    def _find_road(self, location: int, neighbor: int) -> int:
+        for road in range(self.offsets[location], self.offsets[location + 1]):
+            if self.indices[road] == neighbor:
+                return road
+
+        raise KeyError(f"No road from position {location} to position {neighbor} in the contraction hierarchy")
+
+    def _get_upward(self) -> List[List[Tuple[int, float, int]]]:
+        if self._upward is None:
+            roads = list(zip(self.indices.tolist(), self.weights.tolist(), range(len(self.indices))))
+            offsets = self.offsets.tolist()
+            self._upward = [roads[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+        return self._upward
+
+
+class ContractionHierarchyFactory:
+    @staticmethod
+    def create_contraction_hierarchy(csr_graph: CSRGraph, max_witness_settled: int = MAX_WITNESS_SETTLED) -> ContractionHierarchy:
+        """
+        Contracts the locations of the city map in order of priority.  The priority of a location is twice the
+        number of shortcuts contracting it would add minus its number of roads, plus the number of its neighbors
+        already contracted and its level in the hierarchy, so the contraction spreads evenly over the city map and the
+        hierarchy stays shallow.  Priorities change as neighbors are contracted, so they are updated lazily when a
+        location reaches the top of the queue.
+
+        Parameters:
+        csr_graph:              Array representation of the city map
+        max_witness_settled:    Number of locations a witness search settles before giving up
+
+        Returns:
+        contraction_hierarchy: Roads and shortcuts to higher ranked locations of each location
+        """
+        start = time.perf_counter()
+        number_of_locations = csr_graph.number_of_locations
+        adjacency: List[Dict[int, float]] = [{} for _ in range(number_of_locations)]
+
+        for location, neighbors in enumerate(csr_graph._get_adjacency()):
+            for neighbor, road_weight in neighbors:
+                if neighbor != location and road_weight < adjacency[location].get(neighbor, INFINITY):
+                    adjacency[location][neighbor] = road_weight
+
+        middles: Dict[Tuple[int, int], int] = {}
+        contracted_neighbors = [0] * number_of_locations
+        levels = [0] * number_of_locations
+        ranks = [0] * number_of_locations
+        upward: List[List[Tuple[int, float]]] = [[] for _ in range(number_of_locations)]
+
+        def get_priority(location: int) -> int:
+            shortcuts = ContractionHierarchyFactory.get_shortcuts(adjacency, location, MAX_PRIORITY_WITNESS_SETTLED)
+
+            return 2 * (len(shortcuts) - len(adjacency[location])) + contracted_neighbors[location] + levels[location]
+
+        queue = [(get_priority(location), location) for location in range(number_of_locations)]
+        heapq.heapify(queue)
+
+        for rank in range(number_of_locations):
+            _, location = heapq.heappop(queue)
+            priority = get_priority(location)
+
+            while queue and priority > queue[0][0]:
+                _, location = heapq.heappushpop(queue, (priority, location))
+                priority = get_priority(location)
+
+            ranks[location] = rank
+            shortcuts = ContractionHierarchyFactory.get_shortcuts(adjacency, location, max_witness_settled)
+
+            for neighbor, road_weight in adjacency[location].items():
+                upward[location].append((neighbor, road_weight))
+                del adjacency[neighbor][location]
+                contracted_neighbors[neighbor] += 1
+                levels[neighbor] = max(levels[neighbor], levels[location] + 1)
+
+            for neighbor, other_neighbor, shortcut_weight in shortcuts:
+                if shortcut_weight < adjacency[neighbor].get(other_neighbor, INFINITY):
+                    adjacency[neighbor][other_neighbor] = shortcut_weight
+                    adjacency[other_neighbor][neighbor] = shortcut_weight
+                    middles[(min(neighbor, other_neighbor), max(neighbor, other_neighbor))] = location
+
+            adjacency[location] = {}
+
+        degrees = [len(roads) for roads in upward]
+        offsets = np.concatenate(([0], np.cumsum(degrees))).astype(np.int64)
+        roads = [(location, neighbor, road_weight)
+                 for location, location_roads in enumerate(upward)
+                 for neighbor, road_weight in location_roads]
+
+        return ContractionHierarchy(version=csr_graph.version,
+                                    locations=csr_graph.locations,
+                                    location_index=csr_graph.location_index,
+                                    ranks=np.asarray(ranks, dtype=np.int64),
+                                    offsets=offsets,
+                                    indices=np.fromiter((neighbor for _, neighbor, _ in roads), dtype=np.int64, count=len(roads)),
+                                    weights=np.fromiter((road_weight for _, _, road_weight in roads), dtype=np.float64, count=len(roads)),
+                                    middles=np.fromiter((middles.get((min(location, neighbor), max(location, neighbor)), -1)
+                                                         for location, neighbor, _ in roads), dtype=np.int64, count=len(roads)),
+                                    number_of_roads=len(csr_graph.indices) // 2,
+                                    preprocessing_seconds=time.perf_counter() - start)
+
+    @staticmethod
+    def get_shortcuts(adjacency: List[Dict[int, float]], location: int, max_witness_settled: int) -> List[Tuple[int, int, float]]:
+        neighbors = list(adjacency[location].items())
+        shortcuts = []
+
+        for i, (neighbor, road_weight) in enumerate(neighbors):
+            targets = {other_neighbor: road_weight + other_road_weight for other_neighbor, other_road_weight in neighbors[i + 1:]}
+
+            if not targets:
+                continue
+
+            witness_distances = ContractionHierarchyFactory.search_witnesses(adjacency,
+                                                                             neighbor,
+                                                                             location,
+                                                                             targets,
+                                                                             max_witness_settled)
+
+            for other_neighbor, shortcut_weight in targets.items():
+                if witness_distances.get(other_neighbor, INFINITY) > shortcut_weight:
+                    shortcuts.append((neighbor, other_neighbor, shortcut_weight))
+
+        return shortcuts
+
+    @staticmethod
+    def search_witnesses(adjacency: List[Dict[int, float]],
+                         source: int,
+                         excluded_location: int,
+                         targets: Dict[int, float],
+                         max_witness_settled: int) -> Dict[int, float]:
+        # Dijkstra search around the location being contracted, bounded by the longest shortcut it could add
+        max_distance = max(targets.values())
+        distances = {source: 0.0}
+        queue = [(0.0, source)]
+        settled = 0
+        unsettled_targets = len(targets)
+
+        while queue and settled < max_witness_settled and unsettled_targets > 0:
+            distance, location = heapq.heappop(queue)
+
+            if distance > distances[location]:
+                continue
+
+            if distance > max_distance:
+                break
+
+            settled += 1
+
+            if location in targets:
+                unsettled_targets -= 1
+
+            for neighbor, road_weight in adjacency[location].items():
+                neighbor_distance = distance + road_weight
+
+                if neighbor_distance <= max_distance and neighbor != excluded_location and \
+                        neighbor_distance < distances.get(neighbor, INFINITY):
+                    distances[neighbor] = neighbor_distance
+                    heapq.heappush(queue, (neighbor_distance, neighbor))
+
+        return distances
@@ -0,0 +1,309 @@
+from dataclasses import dataclass, field
+import heapq
+from networkx.classes.graph import Graph
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+from traffic_simulator.model import ShortestPathAlgo
+
+INFINITY = float("inf")
+
+# Shrinks the scale of the Euclidean heuristic, so rounding never makes it overestimate a road length
+HEURISTIC_TOLERANCE = 1e-9
+
+
+@dataclass
+class ShortestPathTree:
+    source: int
+    distances: np.ndarray
+    predecessors: np.ndarray
+    expanded_nodes: int
+
+    def get_path(self, destination: int) -> List[int]:
+        if not np.isfinite(self.distances[destination]):
+            return []
+
+        path = [destination]
+
+        while path[-1] != self.source:
+            path.append(int(self.predecessors[path[-1]]))
+
+        path.reverse()
+
+        return path
+
+
+@dataclass
+class CSRGraph:
+    """
+    Array representation of an undirected city map.  The roads from the location at position i are
+    indices[offsets[i]:offsets[i + 1]], with their lengths in weights and the id of the undirected road in road_ids.
+    If every location has coordinates, heuristic_scale is the smallest ratio of road length to straight line distance,
+    so the scaled straight line distance between two locations never overestimates the shortest path between them.
+    """
+    version: int
+    locations: List[int]
+    location_index: Dict[int, int]
+    offsets: np.ndarray
+    indices: np.ndarray
+    weights: np.ndarray
+    road_ids: np.ndarray
+    coordinates: Optional[np.ndarray] = None
+    heuristic_scale: float = 0.0
+    _adjacency: Optional[List[List[Tuple[int, float]]]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def number_of_locations(self) -> int:
+        return len(self.locations)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.indices.nbytes + self.weights.nbytes + self.road_ids.nbytes
+
+    def get_shortest_path(self,
+                          source: int,
+                          destination: int,
+                          shortest_path_algo: ShortestPathAlgo = ShortestPathAlgo.DIJKSTRA,
+                          heuristic: Optional[Callable[[int], float]] = None) -> List[int]:
+        tree = self.search(self.location_index[source], self.location_index[destination], shortest_path_algo, heuristic)
+
+        return [self.locations[position] for position in tree.get_path(self.location_index[destination])]
+
+    def get_shortest_path_length(self,
+                                 source: int,
+                                 destination: int,
+                                 shortest_path_algo: ShortestPathAlgo = ShortestPathAlgo.DIJKSTRA,
+                                 heuristic: Optional[Callable[[int], float]] = None) -> float:
+        tree = self.search(self.location_index[source], self.location_index[destination], shortest_path_algo, heuristic)
+
+        return float(tree.distances[self.location_index[destination]])
+
+    def search(self,
+               source: int,
+               destination: int,
+               shortest_path_algo: ShortestPathAlgo = ShortestPathAlgo.DIJKSTRA,
+               heuristic: Optional[Callable[[int], float]] = None) -> ShortestPathTree:
+        shortest_path_algo = ShortestPathAlgo(shortest_path_algo)
+
+        if shortest_path_algo == ShortestPathAlgo.A_STAR:
+            if heuristic is None:
+                heuristic = self.get_euclidean_heuristic(destination)
+
+            return self.astar(source, destination, heuristic)
+        elif shortest_path_algo == ShortestPathAlgo.DIJKSTRA:
+            return self.dijkstra(source, destination)
+        else:
+            raise ValueError(f"{shortest_path_algo} needs preprocessing, search it through CityMap")
+
+    def has_coordinates(self) -> bool:
+        return self.coordinates is not None and self.heuristic_scale > 0
+
+    def get_euclidean_lower_bounds(self, destination: int) -> Optional[np.ndarray]:
+        """
+        Lower bounds of the distance from every position to the destination, from the scaled straight line distance.
+
+        Parameters:
+        destination:    Position of the destination location
+
+        Returns:
+        lower_bounds: Lower bound of the distance from each position to the destination, or None without coordinates
+        """
+        if not self.has_coordinates():
+            return None
+
+        return self.heuristic_scale * np.hypot(*(self.coordinates - self.coordinates[destination]).T)
+
+    def get_euclidean_heuristic(self, destination: int) -> Optional[Callable[[int], float]]:
+        lower_bounds = self.get_euclidean_lower_bounds(destination)
+
+        return None if lower_bounds is None else lower_bounds.tolist().__getitem__
+
+    def dijkstra(self, source: int, destination: int = -1, weights: Optional[np.ndarray] = None) -> ShortestPathTree:
+        """
+        Dijkstra search over the positions of the locations.  Without a destination the whole shortest path tree
+        of the source is settled.
+
+        Parameters:
+        source:         Position of the source location
+        destination:    Position of the destination location, or -1 to settle every location
+        weights:        Road lengths to search with instead of the weights of the graph
+
+        Returns:
+        shortest_path_tree: Distances and predecessors of the settled locations
+        """
+        adjacency = self._get_adjacency(weights)
+        distances = [INFINITY] * self.number_of_locations
+        predecessors = [-1] * self.number_of_locations
+        expanded_nodes = 0
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+
+        distances[source] = 0.0
+        predecessors[source] = source
+        queue = [(0.0, source)]
+
+        while queue:
+            distance, location = heappop(queue)
+
+            # Skip locations that were queued again with a shorter distance and have already been settled
+            if distance > distances[location]:
+                continue
+
+            expanded_nodes += 1
+
+            if location == destination:
+                break
+
+            for neighbor, road_weight in adjacency[location]:
+                neighbor_distance = distance + road_weight
+
+                if neighbor_distance < distances[neighbor]:
+                    distances[neighbor] = neighbor_distance
+                    predecessors[neighbor] = location
+                    heappush(queue, (neighbor_distance, neighbor))
+
+        return ShortestPathTree(source=source,
+                                distances=np.array(distances),
+                                predecessors=np.array(predecessors),
+                                expanded_nodes=expanded_nodes)
+
+    def astar(self,
+              source: int,
+              destination: int,
+              heuristic: Optional[Callable[[int], float]] = None,
+              weights: Optional[np.ndarray] = None) -> ShortestPathTree:
+        """
+        A* search over the positions of the locations.  The heuristic estimates the distance from a position to the
+        destination and must never overestimate it, without a heuristic the search is Dijkstra's.
+
+        Parameters:
+        source:         Position of the source location
+        destination:    Position of the destination location
+        heuristic:      Lower bound of the distance from a position to the destination
+        weights:        Road lengths to search with instead of the weights of the graph
+
+        Returns:
+        shortest_path_tree: Distances and predecessors of the settled locations
+        """
+        if heuristic is None:
+            return self.dijkstra(source, destination, weights)
+
+        adjacency = self._get_adjacency(weights)
+        distances = [INFINITY] * self.number_of_locations
+        predecessors = [-1] * self.number_of_locations
+        settled = [False] * self.number_of_locations
+        expanded_nodes = 0
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+
+        distances[source] = 0.0
+        predecessors[source] = source
+        queue = [(heuristic(source), source)]
+
+        while queue:
+            _, location = heappop(queue)
+
+            if settled[location]:
+                continue
+
+            settled[location] = True
+            expanded_nodes += 1
+
+            if location == destination:
+                break
+
+            distance = distances[location]
+
+            for neighbor, road_weight in adjacency[location]:
+                neighbor_distance = distance + road_weight
+
+                if neighbor_distance < distances[neighbor]:
+                    distances[neighbor] = neighbor_distance
+                    predecessors[neighbor] = location
+                    heappush(queue, (neighbor_distance + heuristic(neighbor), neighbor))
+
+        return ShortestPathTree(source=source,
+                                distances=np.array(distances),
+                                predecessors=np.array(predecessors),
+                                expanded_nodes=expanded_nodes)
+
+    def _get_adjacency(self, weights: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        # Per location lists of (neighbor, road length) are much faster than NumPy arrays to walk one road at a time
+        if weights is not None:
+            return CSRGraph._create_adjacency(self.offsets, self.indices, weights)
+
+        if self._adjacency is None:
+            self._adjacency = CSRGraph._create_adjacency(self.offsets, self.indices, self.weights)
+
+        return self._adjacency
+
+    @staticmethod
+    def _create_adjacency(offsets: np.ndarray, indices: np.ndarray, weights: np.ndarray) -> List[List[Tuple[int, float]]]:
+        roads = list(zip(indices.tolist(), weights.tolist()))
+        offsets = offsets.tolist()
+
+        return [roads[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+class CSRGraphFactory:
+    @staticmethod
+    def create_csr_graph(city_map: Graph, version: int = 0, weight: str = 'weight') -> CSRGraph:
+        locations = list(city_map.nodes())
+        location_index = {location: i for i, location in enumerate(locations)}
+        road_index = {}
+
+        degrees = [len(city_map[location]) for location in locations]
+        offsets = np.concatenate(([0], np.cumsum(degrees))).astype(np.int64)
+        indices = np.empty(offsets[-1], dtype=np.int64)
+        weights = np.empty(offsets[-1], dtype=np.float64)
+        road_ids = np.empty(offsets[-1], dtype=np.int64)
+
+        road = 0
+
+        for location in locations:
+            for neighbor, road_data in city_map[location].items():
+                indices[road] = location_index[neighbor]
+                weights[road] = road_data.get(weight, 1)
+                road_ids[road] = road_index.setdefault(frozenset((location, neighbor)), len(road_index))
+                road += 1
+
+        coordinates = CSRGraphFactory.get_coordinates(city_map, locations)
+
+        return CSRGraph(version=version,
+                        locations=locations,
+                        location_index=location_index,
+                        offsets=offsets,
+                        indices=indices,
+                        weights=weights,
+                        road_ids=road_ids,
+                        coordinates=coordinates,
+                        heuristic_scale=CSRGraphFactory.get_heuristic_scale(coordinates, offsets, indices, weights))
+
+    @staticmethod
+    def get_coordinates(city_map: Graph, locations: List[int], pos: str = 'pos') -> Optional[np.ndarray]:
+        coordinates = [city_map.nodes[location].get(pos) for location in locations]
+
+        if not coordinates or any(coordinate is None for coordinate in coordinates):
+            return None
+
+        return np.asarray(coordinates, dtype=np.float64)
+
+    @staticmethod
+    def get_heuristic_scale(coordinates: Optional[np.ndarray],
+                            offsets: np.ndarray,
+                            indices: np.ndarray,
+                            weights: np.ndarray) -> float:
+        if coordinates is None or len(indices) == 0:
+            return 0.0
+
+        sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        straight_line_distances = np.hypot(*(coordinates[sources] - coordinates[indices]).T)
+        has_distance = straight_line_distances > 0
+
+        if not has_distance.any():
+            return 0.0
+
+        # A road shorter than the straight line between its locations would make the heuristic overestimate
+        scale = np.min(weights[has_distance] / straight_line_distances[has_distance])
+
+        return max(float(scale) * (1 - HEURISTIC_TOLERANCE), 0.0)
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from networkx.classes.graph import Graph
+import numpy as np
+from typing import Dict, List, Optional
+
+from traffic_simulator.csr_graph import CSRGraph, CSRGraphFactory
+
+
+@dataclass
+class DistanceMatrix:
+    version: int
+    locations: List[int]
+    location_index: Dict[int, int]
+    distances: np.ndarray
+    changed: Optional[np.ndarray] = None
+
+    def get_distance(self, source: int, destination: int) -> float:
+        return float(self.distances[self.location_index[source], self.location_index[destination]])
+
+    def get_positions(self, locations: np.ndarray) -> np.ndarray:
+        location_ids = np.asarray(self.locations)
+        positions = np.zeros(location_ids.max() + 1, dtype=np.intp)
+        positions[location_ids] = np.arange(len(location_ids))
+
+        return positions[locations]
+
+
+class DistanceMatrixFactory:
+    @staticmethod
+    def create_distance_matrix(city_map: Graph, version: int = 0, csr_graph: Optional[CSRGraph] = None) -> DistanceMatrix:
+        """
+        Computes the all-pairs shortest path lengths of the city map once and stores them in a dense matrix
+        indexed by the position of each location in the city map.  Unreachable locations are set to infinity.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        version:    Version of the city map the distances were computed for
+        csr_graph:  Array representation of the city map to run the Dijkstra search from each location on
+
+        Returns:
+        distance_matrix: Dense all-pairs shortest path lengths of the city map
+        """
+        if csr_graph is None:
+            csr_graph = CSRGraphFactory.create_csr_graph(city_map, version)
+
+        distances = np.empty((csr_graph.number_of_locations, csr_graph.number_of_locations))
+
+        for source in range(csr_graph.number_of_locations):
+            distances[source] = csr_graph.dijkstra(source).distances
+
+        return DistanceMatrix(version=version,
+                              locations=csr_graph.locations,
+                              location_index=csr_graph.location_index,
+                              distances=distances)
+
+    @staticmethod
+    def add_road_segment(distance_matrix: DistanceMatrix,
+                         source: int,
+                         destination: int,
+                         road_length: float,
+                         version: int) -> DistanceMatrix:
+        """
+        Updates the all-pairs shortest path lengths after a road has been added between source and destination
+        without recomputing them.  A shortest path either keeps its length or now runs through the new road, so
+        every distance is the minimum of its previous value and the detour through the new road in either direction.
+
+        Parameters:
+        distance_matrix:    All-pairs shortest path lengths before the road was added
+        source:             Location at one end of the new road
+        destination:        Location at the other end of the new road
+        road_length:        Length of the new road
+        version:            Version of the city map after the road was added
+
+        Returns:
+        distance_matrix: All-pairs shortest path lengths after the road was added, with the changed distances marked
+        """
+        distances = distance_matrix.distances
+        source_index = distance_matrix.location_index[source]
+        destination_index = distance_matrix.location_index[destination]
+
+        updated_distances = np.minimum(distances,
+                                       distances[:, [source_index]] + road_length + distances[[destination_index], :])
+        updated_distances = np.minimum(updated_distances,
+                                       distances[:, [destination_index]] + road_length + distances[[source_index], :])
+
+        return DistanceMatrix(version=version,
+                              locations=distance_matrix.locations,
+                              location_index=distance_matrix.location_index,
+                              distances=updated_distances,
+                              changed=updated_distances < distances)
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+import hashlib
+import numpy as np
+from typing import Callable, List, Optional
+
+from traffic_simulator.csr_graph import CSRGraph
+
+
+@dataclass
+class LandmarkIndex:
+    """
+    Shortest path lengths from a few landmark locations to every location of a city map.  By the triangle inequality
+    the shortest path between two locations is at least |d(L, v) - d(L, t)| for every landmark L, which lower bounds
+    the distance left to the destination t for A* (ALT).  The index is only valid for the roads it was computed on,
+    which the fingerprint records as a hash of the roads and their lengths.
+    """
+    version: int
+    locations: List[int]
+    landmarks: np.ndarray
+    distances: np.ndarray
+    fingerprint: str
+
+    @property
+    def number_of_landmarks(self) -> int:
+        return len(self.landmarks)
+
+    @property
+    def nbytes(self) -> int:
+        return self.landmarks.nbytes + self.distances.nbytes
+
+    def get_lower_bounds(self, destination: int) -> np.ndarray:
+        """
+        Lower bounds of the distance from every position to the destination from the landmark distances.
+
+        Parameters:
+        destination:    Position of the destination location
+
+        Returns:
+        lower_bounds: Lower bound of the distance from each position to the destination
+        """
+        differences = np.abs(self.distances - self.distances[:, [destination]])
+
+        # Locations a landmark cannot reach give no bound
+        differences[~np.isfinite(differences)] = 0.0
+
+        return differences.max(axis=0, initial=0.0)
+
+    def get_heuristic(self, destination: int) -> Callable[[int], float]:
+        return self.get_lower_bounds(destination).tolist().__getitem__
+
+    def is_valid_for(self, csr_graph: CSRGraph) -> bool:
+        return self.locations == csr_graph.locations and self.fingerprint == LandmarkIndexFactory.get_fingerprint(csr_graph)
+
+
+class LandmarkIndexFactory:
+    @staticmethod
+    def create_landmark_index(csr_graph: CSRGraph, number_of_landmarks: int = 16, seed: int = 1000) -> LandmarkIndex:
+        """
+        Selects landmarks by farthest point sampling: the first landmark is the location farthest from a random
+        location, and each next landmark is the location farthest from the landmarks selected so far.  Landmarks on
+        the edge of the city map give the tightest bounds, and each one takes a single Dijkstra search.
+
+        Parameters:
+        csr_graph:              Array representation of the city map
+        number_of_landmarks:    Number of landmarks to select, at most the number of locations
+        seed:                   Seed of the random generator picking the first location
+
+        Returns:
+        landmark_index: Shortest path lengths from each landmark to every location
+        """
+        number_of_landmarks = min(number_of_landmarks, csr_graph.number_of_locations)
+        landmarks = np.empty(number_of_landmarks, dtype=np.int64)
+        distances = np.empty((number_of_landmarks, csr_graph.number_of_locations))
+
+        start = int(np.random.default_rng(seed).integers(csr_graph.number_of_locations))
+        closest_landmark_distances = LandmarkIndexFactory.get_finite_distances(csr_graph.dijkstra(start).distances)
+
+        for i in range(number_of_landmarks):
+            landmarks[i] = np.argmax(closest_landmark_distances)
+            distances[i] = csr_graph.dijkstra(int(landmarks[i])).distances
+            closest_landmark_distances = np.minimum(closest_landmark_distances,
+                                                    LandmarkIndexFactory.get_finite_distances(distances[i]))
+
+        return LandmarkIndex(version=csr_graph.version,
+                             locations=csr_graph.locations,
+                             landmarks=landmarks,
+                             distances=distances,
+                             fingerprint=LandmarkIndexFactory.get_fingerprint(csr_graph))
+
+    @staticmethod
+    def save_landmark_index(landmark_index: LandmarkIndex, path: str) -> None:
+        with open(path, 'wb') as landmark_file:
+            np.savez(landmark_file,
+                     locations=np.asarray(landmark_index.locations, dtype=np.int64),
+                     landmarks=landmark_index.landmarks,
+                     distances=landmark_index.distances,
+                     fingerprint=landmark_index.fingerprint)
+
+    @staticmethod
+    def load_landmark_index(path: str, version: int = 0) -> LandmarkIndex:
+        with np.load(path) as landmark_file:
+            return LandmarkIndex(version=version,
+                                 locations=landmark_file['locations'].tolist(),
+                                 landmarks=landmark_file['landmarks'],
+                                 distances=landmark_file['distances'],
+                                 fingerprint=str(landmark_file['fingerprint']))
+
+    @staticmethod
+    def get_fingerprint(csr_graph: CSRGraph) -> str:
+        # Any other road or road length changes the hash, even with the same number of roads and total length.  The
+        # roads of each location are sorted first, since their order depends on the order the roads were added in
+        road_sources = np.repeat(np.arange(csr_graph.number_of_locations), np.diff(csr_graph.offsets))
+        order = np.lexsort((csr_graph.indices, road_sources))
+        fingerprint = hashlib.sha256()
+
+        for array in (csr_graph.offsets, csr_graph.indices[order], csr_graph.weights[order]):
+            fingerprint.update(np.ascontiguousarray(array).tobytes())
+
+        return fingerprint.hexdigest()
+
+    @staticmethod
+    def get_finite_distances(distances: np.ndarray) -> np.ndarray:
+        # Unreachable locations are never selected as landmarks for the component of the start location
+        return np.where(np.isfinite(distances), distances, -1.0)
+
+    @staticmethod
+    def get_landmark_index_path(city_map_path: str) -> str:
+        return f"{city_map_path}.landmarks.npz"
+
+    @staticmethod
+    def load_if_exists(path: str, version: int = 0) -> Optional[LandmarkIndex]:
+        try:
+            return LandmarkIndexFactory.load_landmark_index(path, version)
+        except FileNotFoundError:
+            return None
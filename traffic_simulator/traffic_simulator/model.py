@@ -1,10 +1,29 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, Optional
+from typing import Optional
 
 
 BENEFIT_MATRIX_COLUMNS = ["source", "destination", "benefit"]
 
+CITY_MAP = "city_map"
+CITY_MAP_FINGERPRINT = "fingerprint"
+CITY_MAP_VERSION = "version"
+CONTRACTION_HIERARCHY = "contraction_hierarchy"
+CSR_GRAPH = "csr_graph"
+DISTANCE_MATRIX = "distance_matrix"
+LANDMARK_INDEX = "landmark_index"
+SHORTEST_PATH_CACHE = "shortest_path_cache"
+TRIPS = "trips"
+
+# Attributes of a city map graph derived from its roads, which are not saved with it
+CITY_MAP_CACHES = [CITY_MAP_FINGERPRINT,
+                   CITY_MAP_VERSION,
+                   CONTRACTION_HIERARCHY,
+                   CSR_GRAPH,
+                   DISTANCE_MATRIX,
+                   LANDMARK_INDEX,
+                   SHORTEST_PATH_CACHE]
+
 BENEFIT_MATRIX_TRUTH_TABLE_COLUMNS = ["x",
                                       "y",
                                       "nx_neighbor",
@@ -22,12 +41,17 @@ BENEFIT_MATRIX_TRUTH_TABLE_COLUMNS = ["x",
 class ShortestPathAlgo(Enum):
     A_STAR = "astar"
     DIJKSTRA = "dijkstra"
+    CONTRACTION_HIERARCHY = "ch"
 
 
-@dataclass
-class Road:
-    metadata: Dict
-    next: Optional[object] = None
+class EquilibriumMethod(Enum):
+    MSA = "msa"
+    FRANK_WOLFE = "frank_wolfe"
+
+
+class GraphBackend(Enum):
+    NETWORKX = "networkx"
+    CSR = "csr"
 
 
 @dataclass
@@ -61,5 +85,8 @@ class TimeDeltaDiff(Enum):
     YEARS = "years"
 
 
-
-
+# NumPy units of the time deltas with a fixed length
+TIME_DELTA_UNITS = {TimeDeltaDiff.SECONDS: "s",
+                    TimeDeltaDiff.MINUTES: "m",
+                    TimeDeltaDiff.HOURS: "h",
+                    TimeDeltaDiff.DAYS: "D"}
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class PossibleTrips:
+    """
+    Every ordered pair of two different locations of a city map, without storing them.  Pair k is the trip from the
+    location at position k // (n - 1) to the (k % (n - 1))-th other location, so the n * (n - 1) trips are an
+    implicit range that can be iterated, sliced into position arrays, or sampled.
+    """
+    locations: List[int]
+    location_index: Dict[int, int]
+
+    def __len__(self) -> int:
+        return len(self.locations) * (len(self.locations) - 1)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for source in self.locations:
+            for destination in self.locations:
+                if source != destination:
+                    yield source, destination
+
+    def __contains__(self, trip: Tuple[int, int]) -> bool:
+        source, destination = trip
+
+        return source != destination and source in self.location_index and destination in self.location_index
+
+    def get_positions(self, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Positions of the source and destination locations of the trips in [start, stop).
+
+        Parameters:
+        start:  Index of the first trip
+        stop:   Index after the last trip, every trip if not given
+
+        Returns:
+        sources:        Position of the source location of each trip
+        destinations:   Position of the destination location of each trip
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+
+        return self.get_trip_positions(np.arange(start, stop, dtype=np.int64))
+
+    def get_trip_positions(self, trip_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        sources, destinations = np.divmod(trip_indices, len(self.locations) - 1)
+
+        # Skip the source itself among the destinations
+        destinations += destinations >= sources
+
+        return sources, destinations
+
+    def iterate_positions(self, chunk_size: int = 1_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        for start in range(0, len(self), chunk_size):
+            yield self.get_positions(start, start + chunk_size)
+
+    def sample(self, random_generator: np.random.Generator, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.get_trip_positions(random_generator.integers(0, len(self), size))
+
+
+class PossibleTripsFactory:
+    @staticmethod
+    def create_possible_trips(locations: List[int]) -> PossibleTrips:
+        return PossibleTrips(locations=locations,
+                             location_index={location: i for i, location in enumerate(locations)})
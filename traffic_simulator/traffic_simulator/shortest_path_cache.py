@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from traffic_simulator.csr_graph import ShortestPathTree
+
+ShortestPathTreeKey = Tuple[int, int]
+
+
+@dataclass
+class ShortestPathCacheStats:
+    capacity: int
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass
+class ShortestPathCache:
+    """
+    Least recently used cache of single-source shortest path trees keyed by (city map version, source).  A tree
+    holds the distances and predecessors of every location, so it takes 16 bytes per location.  graph_attributes
+    are the attributes of the city map the cache belongs to, which copies of the city map share the cache with.
+    """
+    capacity: int = 128
+    graph_attributes: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    trees: "OrderedDict[ShortestPathTreeKey, ShortestPathTree]" = field(default_factory=OrderedDict, repr=False)
+
+    def get_tree(self, key: ShortestPathTreeKey, create_tree: Callable[[], ShortestPathTree]) -> ShortestPathTree:
+        tree = self.trees.get(key)
+
+        if tree is not None:
+            self.hits += 1
+            self.trees.move_to_end(key)
+
+            return tree
+
+        self.misses += 1
+        tree = create_tree()
+
+        if self.capacity > 0:
+            self.trees[key] = tree
+
+            while len(self.trees) > self.capacity:
+                self.trees.popitem(last=False)
+                self.evictions += 1
+
+        return tree
+
+    def get_stats(self) -> ShortestPathCacheStats:
+        return ShortestPathCacheStats(capacity=self.capacity,
+                                      size=len(self.trees),
+                                      hits=self.hits,
+                                      misses=self.misses,
+                                      evictions=self.evictions)
+
+    def clear(self) -> None:
+        self.trees.clear()
+
+
+class ShortestPathCacheFactory:
+    @staticmethod
+    def create_shortest_path_cache(capacity: int = 128, graph_attributes: Optional[Dict[str, Any]] = None) -> ShortestPathCache:
+        if capacity < 0:
+            raise ValueError(f"Shortest path cache capacity must not be negative, got {capacity}")
+
+        return ShortestPathCache(capacity=capacity, graph_attributes=graph_attributes)
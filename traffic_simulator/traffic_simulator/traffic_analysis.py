@@ -1,17 +1,29 @@
+from concurrent.futures import ProcessPoolExecutor
+import heapq
 from networkx.classes.graph import Graph
+import numpy as np
 from pandas import DataFrame
-from typing import Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from traffic_simulator.city_map import CityMap
-from traffic_simulator.model import BENEFIT_MATRIX_COLUMNS, BENEFIT_MATRIX_TRUTH_TABLE_COLUMNS, Trip, TripFactory
+from traffic_simulator.model import BENEFIT_MATRIX_COLUMNS, BENEFIT_MATRIX_TRUTH_TABLE_COLUMNS, CITY_MAP, CITY_MAP_VERSION, TRIPS, \
+    Trip, TripFactory
+from traffic_simulator.trip_matrix import TripMatrix, TripMatrixFactory
+
+# City map and trips of a road benefit worker process, set once when the worker starts
+_road_benefit_worker: Dict[str, Any] = {}
 
 
 class TrafficAnalyzer:
     @staticmethod
     def get_road_recommendations(city_map: Graph,
-                                 trips: Dict[Trip, Trip],
+                                 trips: Union[Dict[Trip, Trip], TripMatrix],
                                  shrinkage_factor=0.6,
-                                 debug: bool = False) -> Union[DataFrame, Optional[Tuple[DataFrame, DataFrame, DataFrame, DataFrame]]]:
+                                 debug: bool = False,
+                                 batched: bool = False,
+                                 workers: int = 1,
+                                 top_k: Optional[int] = None,
+                                 chunk_size: int = 65536) -> Union[DataFrame, Optional[Tuple[DataFrame, DataFrame, DataFrame, DataFrame]]]:
         """
         Generates benefit matrix based on the city map or graph and the list of trips across each road segment
         The result of the matrix should look something like the following:
@@ -23,25 +35,57 @@ class TrafficAnalyzer:
 
         Parameters:
         city_map:   Network Graph representation of the city map
-        trips:      Dictionary representation of each trip across a particular road segment
+        trips:      Dictionary or trip matrix representation of each trip across a particular road segment
+        batched:    Score every road candidate at once from the distance and trip count matrices
+        workers:    Number of processes the road candidates are split across when they are not batched
+        top_k:      Only return the top k road benefits, without building or sorting the others
+        chunk_size: Number of road candidates scored at once when they are batched
 
         Returns:
-        benefit_matrix: Matrix representation of the benefit matrix showing each calculated road benefit
+        benefit_matrix: Matrix representation of the benefit matrix showing each calculated road benefit, with the
+                        version of the city map it was calculated for in its attrs
         """
+        if batched:
+            if debug:
+                raise ValueError("The n1 and n2 truth tables are only available when road candidates are not batched")
+
+            if top_k is not None:
+                benefit_matrix_data = TrafficAnalyzer.get_top_road_recommendations(city_map,
+                                                                                   trips,
+                                                                                   top_k,
+                                                                                   shrinkage_factor,
+                                                                                   chunk_size=chunk_size)
+            else:
+                benefit_matrix_data = TrafficAnalyzer.get_benefit_matrix(city_map,
+                                                                         CityMap.get_distance_matrix(city_map).distances,
+                                                                         TrafficAnalyzer.get_trip_count_matrix(city_map, trips),
+                                                                         shrinkage_factor,
+                                                                         chunk_size)
+
+            benefit_matrix_data.attrs[CITY_MAP_VERSION] = CityMap.get_version(city_map)
+
+            return benefit_matrix_data
+
+        if debug and workers > 1:
+            raise ValueError("The n1 and n2 truth tables are only available when road candidates are scored serially")
+
+        # The roads are checked against the distance matrix once here, and each candidate reads it without a check
+        CityMap.get_distance_matrix(city_map)
+
         road_candidates = CityMap.get_new_road_candidates(city_map)
         benefit_matrix_data = []
         n1_n2_truth_table: List[Tuple[int, int, Set, Set, int, int, int, int, str, str, str, str]] = []
 
-        for candidate in road_candidates:
-            x = candidate[0]
-            y = candidate[1]
-            n1 = set(city_map.neighbors(y))
-            n2 = set(city_map.neighbors(x))
+        if debug:
+            for candidate in road_candidates:
+                x = candidate[0]
+                y = candidate[1]
+                n1 = set(city_map.neighbors(y))
+                n2 = set(city_map.neighbors(x))
 
-            nx_indirect_benefits = set()
-            ny_indirect_benefits = set()
+                nx_indirect_benefits = set()
+                ny_indirect_benefits = set()
 
-            if debug:
                 n1, n2, n1_n2_truth_table = TrafficAnalyzer._calculate_all_road_benefits(city_map,
                                                                                          trips,
                                                                                          benefit_matrix_data,
@@ -54,21 +98,33 @@ class TrafficAnalyzer:
                                                                                          ny_indirect_benefits,
                                                                                          n1_n2_truth_table,
                                                                                          debug)
-            else:
-               TrafficAnalyzer._calculate_all_road_benefits(city_map,
-                                                            trips,
-                                                            benefit_matrix_data,
-                                                            shrinkage_factor,
-                                                            x,
-                                                            y,
-                                                            n1,
-                                                            n2,
-                                                            nx_indirect_benefits,
-                                                            ny_indirect_benefits,
-                                                            debug)
-
-        benefit_matrix_data = DataFrame(benefit_matrix_data, columns=BENEFIT_MATRIX_COLUMNS)
-        benefit_matrix_data.sort_values(by='benefit', ascending=False, inplace=True)
+        elif workers > 1:
+            benefit_matrix_data = TrafficAnalyzer._calculate_road_candidate_benefits_in_parallel(city_map,
+                                                                                               trips,
+                                                                                               list(road_candidates),
+                                                                                               shrinkage_factor,
+                                                                                               workers,
+                                                                                               top_k)
+        elif top_k is not None:
+            benefit_matrix_data = TrafficAnalyzer._calculate_top_road_candidate_benefits(city_map,
+                                                                                        trips,
+                                                                                        road_candidates,
+                                                                                        shrinkage_factor,
+                                                                                        top_k)
+        else:
+            benefit_matrix_data = TrafficAnalyzer._calculate_road_candidate_benefits(city_map,
+                                                                                    trips,
+                                                                                    list(road_candidates),
+                                                                                    shrinkage_factor)
+
+        if top_k is not None:
+            benefit_matrix_data = DataFrame(heapq.nlargest(top_k, benefit_matrix_data, key=lambda road: road[2]),
+                                            columns=BENEFIT_MATRIX_COLUMNS)
+        else:
+            benefit_matrix_data = DataFrame(benefit_matrix_data, columns=BENEFIT_MATRIX_COLUMNS)
+            benefit_matrix_data.sort_values(by='benefit', ascending=False, inplace=True)
+
+        benefit_matrix_data.attrs[CITY_MAP_VERSION] = CityMap.get_version(city_map)
 
         if debug:
             n1_n2_truth_table_data = DataFrame(n1_n2_truth_table, columns=BENEFIT_MATRIX_TRUTH_TABLE_COLUMNS)
@@ -77,9 +133,573 @@ class TrafficAnalyzer:
         else:
             return benefit_matrix_data
 
+    @staticmethod
+    def _calculate_road_candidate_benefits(city_map: Graph,
+                                           trips: Union[Dict[Trip, Trip], TripMatrix],
+                                           road_candidates: List[Tuple[int, int]],
+                                           shrinkage_factor: float) -> List[Tuple[int, int, float]]:
+        benefit_matrix_data = []
+
+        for x, y in road_candidates:
+            TrafficAnalyzer._calculate_all_road_benefits(city_map,
+                                                         trips,
+                                                         benefit_matrix_data,
+                                                         shrinkage_factor,
+                                                         x,
+                                                         y,
+                                                         set(city_map.neighbors(y)),
+                                                         set(city_map.neighbors(x)),
+                                                         set(),
+                                                         set(),
+                                                         [])
+
+        return benefit_matrix_data
+
+    @staticmethod
+    def _calculate_top_road_candidate_benefits(city_map: Graph,
+                                               trips: Union[Dict[Trip, Trip], TripMatrix],
+                                               road_candidates: Iterable[Tuple[int, int]],
+                                               shrinkage_factor: float,
+                                               top_k: int) -> List[Tuple[int, int, float]]:
+        # Only the top k benefits are kept, in a min-heap whose root is the smallest of them.  Of equal benefits the
+        # one scored first wins, as with heapq.nlargest
+        top_benefits: List[Tuple[float, int, Tuple[int, int, float]]] = []
+
+        for i, (x, y) in enumerate(road_candidates):
+            road_benefit = TrafficAnalyzer._calculate_road_candidate_benefits(city_map,
+                                                                             trips,
+                                                                             [(x, y)],
+                                                                             shrinkage_factor)[0]
+
+            if len(top_benefits) < top_k:
+                heapq.heappush(top_benefits, (road_benefit[2], -i, road_benefit))
+            else:
+                heapq.heappushpop(top_benefits, (road_benefit[2], -i, road_benefit))
+
+        return [road_benefit for _, _, road_benefit in sorted(top_benefits, reverse=True)]
+
+    @staticmethod
+    def _calculate_road_candidate_benefits_in_parallel(city_map: Graph,
+                                                       trips: Union[Dict[Trip, Trip], TripMatrix],
+                                                       road_candidates: List[Tuple[int, int]],
+                                                       shrinkage_factor: float,
+                                                       workers: int,
+                                                       top_k: Optional[int] = None) -> List[Tuple[int, int, float]]:
+        # The distance matrix is calculated once here and shipped to each worker with the city map and trips, which
+        # are sent once per worker when it starts instead of with every chunk of road candidates
+        CityMap.get_distance_matrix(city_map)
+
+        chunk_size = max(1, -(-len(road_candidates) // (workers * 4)))
+        chunks = [road_candidates[i:i + chunk_size] for i in range(0, len(road_candidates), chunk_size)]
+        benefit_matrix_data = []
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=TrafficAnalyzer._init_road_benefit_worker,
+                                 initargs=(city_map, trips)) as executor:
+            # With top_k each worker only sends back the top k benefits of its chunk
+            for chunk_benefit_matrix_data in executor.map(TrafficAnalyzer._calculate_road_benefit_worker_chunk,
+                                                          chunks,
+                                                          [shrinkage_factor] * len(chunks),
+                                                          [top_k] * len(chunks)):
+                benefit_matrix_data.extend(chunk_benefit_matrix_data)
+
+        return benefit_matrix_data
+
+    @staticmethod
+    def _init_road_benefit_worker(city_map: Graph, trips: Union[Dict[Trip, Trip], TripMatrix]) -> None:
+        _road_benefit_worker[CITY_MAP] = city_map
+        _road_benefit_worker[TRIPS] = trips
+
+    @staticmethod
+    def _calculate_road_benefit_worker_chunk(road_candidates: List[Tuple[int, int]],
+                                             shrinkage_factor: float,
+                                             top_k: Optional[int] = None) -> List[Tuple[int, int, float]]:
+        if top_k is not None:
+            return TrafficAnalyzer._calculate_top_road_candidate_benefits(_road_benefit_worker[CITY_MAP],
+                                                                          _road_benefit_worker[TRIPS],
+                                                                          road_candidates,
+                                                                          shrinkage_factor,
+                                                                          top_k)
+
+        return TrafficAnalyzer._calculate_road_candidate_benefits(_road_benefit_worker[CITY_MAP],
+                                                                  _road_benefit_worker[TRIPS],
+                                                                  road_candidates,
+                                                                  shrinkage_factor)
+
+    @staticmethod
+    def get_benefit_matrix(city_map: Graph,
+                           distances: np.ndarray,
+                           trip_counts: np.ndarray,
+                           shrinkage_factor=0.6,
+                           chunk_size: int = 65536,
+                           top_k: Optional[int] = None) -> DataFrame:
+        """
+        Generates the benefit matrix for every road candidate at once.  The distance and trip count matrices are
+        indexed by the position of each location in the city map, so the direct and indirect road benefits of a
+        chunk of candidates are calculated with NumPy broadcasting instead of one candidate at a time.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        distances:      All-pairs shortest path lengths of the city map
+        trip_counts:    Number of trips from each location (row) to each location (column)
+        chunk_size:     Number of road candidates scored at once, which bounds the memory used
+        top_k:          Only return the top k road benefits, found by get_top_road_recommendations
+
+        Returns:
+        benefit_matrix: Matrix representation of the benefit matrix showing each calculated road benefit
+        """
+        if top_k is not None:
+            return TrafficAnalyzer.get_top_road_recommendations(city_map,
+                                                                trip_counts,
+                                                                top_k,
+                                                                shrinkage_factor,
+                                                                chunk_size=chunk_size,
+                                                                distances=distances)
+
+        locations = np.array(list(city_map.nodes()))
+        indptr, indices, adjacency = TrafficAnalyzer._get_adjacency(city_map)
+        symmetric_trip_counts = TripMatrix.sum_round_trips(trip_counts)
+
+        sources, destinations = np.nonzero(np.triu(~adjacency, k=1))
+        benefits = np.empty(len(sources))
+
+        for start in range(0, len(sources), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            benefits[chunk] = TrafficAnalyzer._calculate_road_benefits(distances,
+                                                                       symmetric_trip_counts,
+                                                                       indptr,
+                                                                       indices,
+                                                                       adjacency,
+                                                                       sources[chunk],
+                                                                       destinations[chunk],
+                                                                       shrinkage_factor)
+
+        benefit_matrix_data = DataFrame({BENEFIT_MATRIX_COLUMNS[0]: locations[sources],
+                                         BENEFIT_MATRIX_COLUMNS[1]: locations[destinations],
+                                         BENEFIT_MATRIX_COLUMNS[2]: benefits})
+        benefit_matrix_data.sort_values(by='benefit', ascending=False, inplace=True)
+
+        return benefit_matrix_data
+
+    @staticmethod
+    def get_top_road_recommendations(city_map: Graph,
+                                     trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray],
+                                     top_k: int = 10,
+                                     shrinkage_factor=0.6,
+                                     max_hops: Optional[int] = None,
+                                     min_distance: Optional[float] = None,
+                                     with_trips: bool = False,
+                                     chunk_size: int = 65536,
+                                     distances: Optional[np.ndarray] = None) -> DataFrame:
+        """
+        Finds the top k road candidates by benefit without scoring most of them.  The candidates are streamed in
+        chunks, optionally only those within max_hops roads, further apart than min_distance, or with trips between
+        them.  By the triangle inequality no indirect benefit of (x, y) can exceed (1 - shrinkage_factor) * d(x, y)
+        per trip, so the benefit of a candidate is at most that times its trips and the trips between each end and
+        the neighbors of the other.  Candidates whose bound is below the k-th best benefit found so far are skipped.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        trips:          Dictionary or trip matrix representation of each trip across a particular road segment, or
+                        its trip count matrix from get_trip_count_matrix
+        top_k:          Number of road candidates to return
+        max_hops:       Only consider pairs of locations at most this many roads apart
+        min_distance:   Only consider pairs of locations whose shortest path is longer than this
+        with_trips:     Only consider pairs of locations with trips between them
+        chunk_size:     Number of road candidates bounded and scored at once
+        distances:      All-pairs shortest path lengths to score with, those of the city map if not given
+
+        Returns:
+        benefit_matrix: Matrix representation of the top k road benefits, highest first
+        """
+        if top_k < 1:
+            raise ValueError("top_k must be at least 1")
+
+        locations = np.array(list(city_map.nodes()))
+        distances = CityMap.get_distance_matrix(city_map).distances if distances is None else distances
+        trip_counts = TrafficAnalyzer.get_trip_count_matrix(city_map, trips)
+        symmetric_trip_counts = TripMatrix.sum_round_trips(trip_counts)
+        indptr, indices, adjacency = TrafficAnalyzer._get_adjacency(city_map)
+        neighbor_trip_counts = TrafficAnalyzer._get_neighbor_trip_counts(indptr, indices, symmetric_trip_counts)
+
+        top_sources = np.empty(0, dtype=np.intp)
+        top_destinations = np.empty(0, dtype=np.intp)
+        top_benefits = np.empty(0)
+
+        for x, y in CityMap.get_new_road_candidate_chunks(city_map,
+                                                          max_hops,
+                                                          min_distance,
+                                                          trip_counts if with_trips else None,
+                                                          chunk_size):
+            if len(top_benefits) == top_k:
+                upper_bounds = TrafficAnalyzer._get_road_benefit_upper_bounds(distances,
+                                                                              symmetric_trip_counts,
+                                                                              neighbor_trip_counts,
+                                                                              indptr,
+                                                                              x,
+                                                                              y,
+                                                                              shrinkage_factor)
+                is_kept = upper_bounds >= top_benefits.min()
+                x = x[is_kept]
+                y = y[is_kept]
+
+            benefits = TrafficAnalyzer._calculate_road_benefits(distances,
+                                                                symmetric_trip_counts,
+                                                                indptr,
+                                                                indices,
+                                                                adjacency,
+                                                                x,
+                                                                y,
+                                                                shrinkage_factor)
+
+            top = TrafficAnalyzer._get_top_k(np.concatenate((top_benefits, benefits)), top_k)
+            top_sources = np.concatenate((top_sources, x))[top]
+            top_destinations = np.concatenate((top_destinations, y))[top]
+            top_benefits = np.concatenate((top_benefits, benefits))[top]
+
+        order = np.argsort(-top_benefits, kind='stable')
+
+        return DataFrame({BENEFIT_MATRIX_COLUMNS[0]: locations[top_sources[order]],
+                          BENEFIT_MATRIX_COLUMNS[1]: locations[top_destinations[order]],
+                          BENEFIT_MATRIX_COLUMNS[2]: top_benefits[order]})
+
+    @staticmethod
+    def _get_top_k(benefits: np.ndarray, top_k: int) -> np.ndarray:
+        if len(benefits) <= top_k:
+            return np.arange(len(benefits))
+
+        return np.argpartition(-benefits, top_k - 1)[:top_k]
+
+    @staticmethod
+    def _get_neighbor_trip_counts(indptr: np.ndarray, indices: np.ndarray, symmetric_trip_counts: np.ndarray) -> np.ndarray:
+        # Row y holds the trips between each location and the neighbors of y
+        neighbor_trip_counts = np.zeros(symmetric_trip_counts.shape)
+
+        for location in range(len(indptr) - 1):
+            neighbor_trip_counts[location] = symmetric_trip_counts[indices[indptr[location]:indptr[location + 1]]].sum(axis=0)
+
+        return neighbor_trip_counts
+
+    @staticmethod
+    def _get_road_benefit_upper_bounds(distances: np.ndarray,
+                                       symmetric_trip_counts: np.ndarray,
+                                       neighbor_trip_counts: np.ndarray,
+                                       indptr: np.ndarray,
+                                       x: np.ndarray,
+                                       y: np.ndarray,
+                                       shrinkage_factor: float) -> np.ndarray:
+        trips = symmetric_trip_counts[x, y] + neighbor_trip_counts[y, x] + neighbor_trip_counts[x, y]
+
+        # Each indirect benefit is rounded to 5 decimals, which can round it up by half of the last decimal
+        rounding = 5e-6 * (indptr[x + 1] - indptr[x] + indptr[y + 1] - indptr[y])
+
+        return (1 - shrinkage_factor) * distances[x, y] * trips + rounding
+
+    @staticmethod
+    def update_road_recommendations(city_map: Graph,
+                                    trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray],
+                                    benefit_matrix: DataFrame,
+                                    source: int,
+                                    destination: int,
+                                    shrinkage_factor=0.6) -> DataFrame:
+        """
+        Updates the benefit matrix after the road between source and destination has been added to the city map
+        through CityMap.add_road_segment.  Only the road candidates whose benefit depends on a shortest path that
+        dropped through the new road, or on the neighbors of source and destination, are recalculated.  The shortest
+        paths that dropped are only known for the last road added, so the benefit matrix is recalculated in full
+        when it is not from the version of the city map just before it.  A benefit matrix without a version in its
+        attrs is taken to be from that version.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map, including the new road
+        trips:          Dictionary or trip matrix representation of each trip across a particular road segment,
+                        or its trip count matrix from get_trip_count_matrix
+        benefit_matrix: Benefit matrix calculated before the new road was added
+        source:         Location at one end of the new road
+        destination:    Location at the other end of the new road
+
+        Returns:
+        benefit_matrix: Matrix representation of the benefit matrix showing each calculated road benefit
+        """
+        distance_matrix = CityMap.get_distance_matrix(city_map)
+        benefit_matrix_version = benefit_matrix.attrs.get(CITY_MAP_VERSION, distance_matrix.version - 1)
+
+        if distance_matrix.changed is None or benefit_matrix_version != distance_matrix.version - 1:
+            return TrafficAnalyzer.get_road_recommendations(city_map, trips, shrinkage_factor, batched=True)
+
+        benefit_matrix = benefit_matrix.drop(TrafficAnalyzer.get_benefit(benefit_matrix, source, destination).index)
+
+        location_index = distance_matrix.location_index
+        x = distance_matrix.get_positions(benefit_matrix[BENEFIT_MATRIX_COLUMNS[0]].to_numpy())
+        y = distance_matrix.get_positions(benefit_matrix[BENEFIT_MATRIX_COLUMNS[1]].to_numpy())
+
+        indptr, indices, adjacency = TrafficAnalyzer._get_adjacency(city_map)
+        is_changed = TrafficAnalyzer._is_road_benefit_changed(distance_matrix.changed,
+                                                              indptr,
+                                                              indices,
+                                                              x,
+                                                              y,
+                                                              [location_index[source], location_index[destination]])
+
+        benefits = benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]].to_numpy(dtype=float, copy=True)
+        trip_counts = TrafficAnalyzer.get_trip_count_matrix(city_map, trips)
+        benefits[is_changed] = TrafficAnalyzer._calculate_road_benefits(distance_matrix.distances,
+                                                                        TripMatrix.sum_round_trips(trip_counts),
+                                                                        indptr,
+                                                                        indices,
+                                                                        adjacency,
+                                                                        x[is_changed],
+                                                                        y[is_changed],
+                                                                        shrinkage_factor)
+
+        benefit_matrix = benefit_matrix.assign(**{BENEFIT_MATRIX_COLUMNS[2]: benefits})
+        benefit_matrix.sort_values(by='benefit', ascending=False, inplace=True)
+        benefit_matrix.attrs[CITY_MAP_VERSION] = distance_matrix.version
+
+        return benefit_matrix
+
+    @staticmethod
+    def _is_road_benefit_changed(changed: np.ndarray,
+                                 indptr: np.ndarray,
+                                 indices: np.ndarray,
+                                 x: np.ndarray,
+                                 y: np.ndarray,
+                                 new_road: List[int]) -> np.ndarray:
+        # The benefit of (x, y) reads the shortest paths from x and y to each other and to their neighbors, and the
+        # neighbors themselves, which only changed for the two ends of the new road
+        is_changed = np.isin(x, new_road) | np.isin(y, new_road) | changed[x, y]
+
+        is_touched = changed.any(axis=1)
+        candidates = np.flatnonzero(~is_changed & (is_touched[x] | is_touched[y]))
+
+        for locations in (x, y):
+            owners, neighbors = TrafficAnalyzer._get_neighbors(indptr, indices, locations[candidates])
+            is_neighbor_changed = changed[x[candidates][owners], neighbors] | changed[y[candidates][owners], neighbors]
+            is_changed[candidates[np.bincount(owners, weights=is_neighbor_changed, minlength=len(candidates)) > 0]] = True
+
+        return is_changed
+
+    @staticmethod
+    def plan_roads(city_map: Graph,
+                   trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray],
+                   k: int = 3,
+                   shrinkage_factor=0.6,
+                   lazy: bool = True) -> DataFrame:
+        """
+        Plans k new roads in sequence, where each road is the one with the maximum benefit after the earlier roads
+        have been added to the city map.  The city map itself is not changed.
+
+        With lazy evaluation the road candidates are kept in a max-heap keyed by their benefit instead of a sorted
+        benefit matrix.  Adding a road can raise the benefit of another candidate as well as lower it, since a
+        shorter path between x and y shortens every detour through a new road between them, so the top of the heap
+        cannot be trusted on its own (as CELF would).  After a road is added every candidate whose benefit can
+        change is rescored and pushed again, and the entries it replaces are skipped when they reach the top.  The
+        roads planned are the same as with lazy=False, which updates and sorts the whole benefit matrix instead.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        trips:      Dictionary or trip matrix representation of each trip across a particular road segment, or
+                    its trip count matrix from get_trip_count_matrix
+        k:          Number of new roads to plan
+        lazy:       Keep the road candidates in a heap and only push the rescored ones again
+
+        Returns:
+        planned_roads: Matrix representation of the planned roads and their benefit, in the order they are built
+        """
+        planned_city_map = city_map.copy()
+        trip_counts = TrafficAnalyzer.get_trip_count_matrix(planned_city_map, trips)
+        benefit_matrix = TrafficAnalyzer.get_road_recommendations(planned_city_map,
+                                                                  trip_counts,
+                                                                  shrinkage_factor,
+                                                                  batched=True)
+        planned_roads = []
+
+        if not lazy:
+            for _ in range(min(k, len(benefit_matrix))):
+                source, destination, benefit = TrafficAnalyzer.get_max_road_benefit(benefit_matrix).iloc[0]
+                source = int(source)
+                destination = int(destination)
+
+                CityMap.add_road_segment(planned_city_map, source, destination, shrinkage_factor)
+                benefit_matrix = TrafficAnalyzer.update_road_recommendations(planned_city_map,
+                                                                             trip_counts,
+                                                                             benefit_matrix,
+                                                                             source,
+                                                                             destination,
+                                                                             shrinkage_factor)
+                planned_roads.append((source, destination, benefit))
+
+            return DataFrame(planned_roads, columns=BENEFIT_MATRIX_COLUMNS)
+
+        symmetric_trip_counts = TripMatrix.sum_round_trips(trip_counts)
+        distance_matrix = CityMap.get_distance_matrix(planned_city_map)
+        sources = benefit_matrix[BENEFIT_MATRIX_COLUMNS[0]].tolist()
+        destinations = benefit_matrix[BENEFIT_MATRIX_COLUMNS[1]].tolist()
+        x = distance_matrix.get_positions(np.array(sources))
+        y = distance_matrix.get_positions(np.array(destinations))
+
+        # An entry of the heap is current while its evaluation is the last one of its candidate
+        evaluations = np.zeros(len(benefit_matrix), dtype=np.int64)
+        is_planned = np.zeros(len(benefit_matrix), dtype=bool)
+        road_candidates = list(zip((-benefit_matrix[BENEFIT_MATRIX_COLUMNS[2]]).tolist(),
+                                   sources,
+                                   destinations,
+                                   range(len(benefit_matrix)),
+                                   [0] * len(benefit_matrix)))
+        heapq.heapify(road_candidates)
+        number_of_roads = min(k, len(road_candidates))
+
+        for road in range(number_of_roads):
+            while True:
+                benefit, source, destination, candidate, evaluation = heapq.heappop(road_candidates)
+
+                if evaluation == evaluations[candidate]:
+                    break
+
+            is_planned[candidate] = True
+            CityMap.add_road_segment(planned_city_map, source, destination, shrinkage_factor)
+            planned_roads.append((source, destination, -benefit))
+
+            if road + 1 == number_of_roads:
+                break
+
+            distance_matrix = CityMap.get_distance_matrix(planned_city_map)
+            indptr, indices, adjacency = TrafficAnalyzer._get_adjacency(planned_city_map)
+            remaining = np.flatnonzero(~is_planned)
+
+            if distance_matrix.changed is None:
+                rescored = remaining
+            else:
+                rescored = remaining[TrafficAnalyzer._is_road_benefit_changed(distance_matrix.changed,
+                                                                              indptr,
+                                                                              indices,
+                                                                              x[remaining],
+                                                                              y[remaining],
+                                                                              [distance_matrix.location_index[source],
+                                                                               distance_matrix.location_index[destination]])]
+
+            benefits = TrafficAnalyzer._calculate_road_benefits(distance_matrix.distances,
+                                                                symmetric_trip_counts,
+                                                                indptr,
+                                                                indices,
+                                                                adjacency,
+                                                                x[rescored],
+                                                                y[rescored],
+                                                                shrinkage_factor)
+            evaluations[rescored] += 1
+
+            for candidate, benefit in zip(rescored.tolist(), benefits.tolist()):
+                heapq.heappush(road_candidates, (-benefit,
+                                                 sources[candidate],
+                                                 destinations[candidate],
+                                                 candidate,
+                                                 int(evaluations[candidate])))
+
+        return DataFrame(planned_roads, columns=BENEFIT_MATRIX_COLUMNS)
+
+    @staticmethod
+    def get_trip_count_matrix(city_map: Graph, trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray]) -> np.ndarray:
+        if isinstance(trips, np.ndarray):
+            return trips
+        elif isinstance(trips, TripMatrix):
+            return trips.to_dense(list(city_map.nodes()))
+        else:
+            return TripMatrixFactory.create_trip_matrix_from_trips(city_map, trips).to_dense()
+
+    @staticmethod
+    def _get_round_trips(trips: Union[Dict[Trip, Trip], TripMatrix], source: int, destination: int) -> int:
+        if isinstance(trips, TripMatrix):
+            return trips.get_round_trips(source, destination)
+        else:
+            return trips[TripFactory.create_trip(source, destination)].numer_of_trips + \
+                trips[TripFactory.create_trip(destination, source)].numer_of_trips
+
+    @staticmethod
+    def _get_adjacency(city_map: Graph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        location_index = {location: i for i, location in enumerate(city_map.nodes())}
+        degrees = [len(city_map[location]) for location in city_map.nodes()]
+
+        indptr = np.concatenate(([0], np.cumsum(degrees))).astype(np.intp)
+        indices = np.fromiter((location_index[neighbor] for location in city_map.nodes() for neighbor in city_map[location]),
+                              dtype=np.intp,
+                              count=indptr[-1])
+
+        adjacency = np.zeros((len(location_index), len(location_index)), dtype=bool)
+        adjacency[np.repeat(np.arange(len(location_index)), degrees), indices] = True
+
+        return indptr, indices, adjacency
+
+    @staticmethod
+    def _get_neighbors(indptr: np.ndarray,
+                       indices: np.ndarray,
+                       locations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        degrees = indptr[locations + 1] - indptr[locations]
+        owners = np.repeat(np.arange(len(locations)), degrees)
+        offsets = np.arange(len(owners)) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+
+        return owners, indices[indptr[locations][owners] + offsets]
+
+    @staticmethod
+    def _calculate_road_benefits(distances: np.ndarray,
+                                 symmetric_trip_counts: np.ndarray,
+                                 indptr: np.ndarray,
+                                 indices: np.ndarray,
+                                 adjacency: np.ndarray,
+                                 x: np.ndarray,
+                                 y: np.ndarray,
+                                 shrinkage_factor: float) -> np.ndarray:
+        shortest_path = distances[x, y]
+        new_road = shortest_path * shrinkage_factor
+        direct_road_benefits = (shortest_path - new_road) * symmetric_trip_counts[x, y]
+
+        # Indirect road benefits across the neighbors of y (n1) and the neighbors of x (n2)
+        indirect_road_benefits = TrafficAnalyzer._calculate_indirect_road_benefits(distances,
+                                                                                   symmetric_trip_counts,
+                                                                                   indptr,
+                                                                                   indices,
+                                                                                   adjacency,
+                                                                                   x,
+                                                                                   y,
+                                                                                   new_road)
+        indirect_road_benefits += TrafficAnalyzer._calculate_indirect_road_benefits(distances,
+                                                                                    symmetric_trip_counts,
+                                                                                    indptr,
+                                                                                    indices,
+                                                                                    adjacency,
+                                                                                    y,
+                                                                                    x,
+                                                                                    new_road)
+
+        return direct_road_benefits + indirect_road_benefits
+
+    @staticmethod
+    def _calculate_indirect_road_benefits(distances: np.ndarray,
+                                          symmetric_trip_counts: np.ndarray,
+                                          indptr: np.ndarray,
+                                          indices: np.ndarray,
+                                          adjacency: np.ndarray,
+                                          x: np.ndarray,
+                                          y: np.ndarray,
+                                          new_road: np.ndarray) -> np.ndarray:
+        # Trips between x and a neighbor of y that is not already connected to x are rerouted through the new road
+        candidates, neighbors = TrafficAnalyzer._get_neighbors(indptr, indices, y)
+        is_indirect = ~adjacency[x[candidates], neighbors]
+        candidates = candidates[is_indirect]
+        neighbors = neighbors[is_indirect]
+        x = x[candidates]
+        y = y[candidates]
+
+        indirect_road_benefits = np.maximum(distances[neighbors, x] - (new_road[candidates] + distances[y, neighbors]), 0) * \
+            symmetric_trip_counts[neighbors, x]
+
+        # Without any candidate bincount returns integers, which the direct road benefits cannot be added to
+        return np.bincount(candidates,
+                           weights=np.round(indirect_road_benefits, 5),
+                           minlength=len(new_road)).astype(np.float64, copy=False)
+
     @staticmethod
     def _calculate_all_road_benefits(city_map: Graph,
-                                     trips: Dict[Trip, Trip],
+                                     trips: Union[Dict[Trip, Trip], TripMatrix],
                                      benefit_matrix_data: List[Tuple[int, int, float]],
                                      shrinkage_factor,
                                      x: int,
@@ -113,11 +733,14 @@ class TrafficAnalyzer:
 
                 if forward_trip not in indirect_road_benefit_tracker.keys() or \
                    reverse_trip not in indirect_road_benefit_tracker.keys():
+                    # Trips between the neighbor and x are rerouted through the new road, independent of the
+                    # order the pair was first seen in
+                    neighbor_location = indirect_y if indirect_x == x else indirect_x
                     indirect_road_benefits += TrafficAnalyzer._calculate_indirect_road_benefit(city_map,
                                                                                                trips,
                                                                                                y,
-                                                                                               indirect_x,
-                                                                                               indirect_y,
+                                                                                               neighbor_location,
+                                                                                               x,
                                                                                                shrinkage_factor)
                     indirect_road_benefit_tracker[forward_trip] = forward_trip
                     indirect_road_benefit_tracker[reverse_trip] = reverse_trip
@@ -157,11 +780,14 @@ class TrafficAnalyzer:
 
                 if forward_trip not in indirect_road_benefit_tracker.keys() or \
                         reverse_trip not in indirect_road_benefit_tracker.keys():
+                    # Trips between the neighbor and y are rerouted through the new road, independent of the
+                    # order the pair was first seen in
+                    neighbor_location = indirect_y if indirect_x == y else indirect_x
                     indirect_road_benefits += TrafficAnalyzer._calculate_indirect_road_benefit(city_map,
                                                                                                trips,
                                                                                                x,
-                                                                                               indirect_x,
-                                                                                               indirect_y,
+                                                                                               neighbor_location,
+                                                                                               y,
                                                                                                shrinkage_factor)
                     indirect_road_benefit_tracker[forward_trip] = forward_trip
                     indirect_road_benefit_tracker[reverse_trip] = reverse_trip
@@ -231,36 +857,36 @@ class TrafficAnalyzer:
 
     @staticmethod
     def _calculate_direct_road_benefit(city_map: Graph,
-                                       trips: Dict[Trip, Trip],
+                                       trips: Union[Dict[Trip, Trip], TripMatrix],
                                        source: int,
                                        destination: int,
                                        shrinkage_factor: float) -> float:
-        source_to_destination_trips = trips[TripFactory.create_trip(source, destination)].numer_of_trips
-        destination_to_source_trips = trips[TripFactory.create_trip(destination, source)].numer_of_trips
+        round_trips = TrafficAnalyzer._get_round_trips(trips, source, destination)
 
-        shortest_path = CityMap.get_shortest_path_length(city_map, source, destination)
+        shortest_path = CityMap.get_distance_matrix(city_map, check_roads=False).get_distance(source, destination)
 
         return (shortest_path - (shortest_path * shrinkage_factor)) * \
-            (source_to_destination_trips + destination_to_source_trips)
+            round_trips
 
     @staticmethod
     def _calculate_indirect_road_benefit(city_map: Graph,
-                                         trips: Dict[Trip, Trip],
+                                         trips: Union[Dict[Trip, Trip], TripMatrix],
                                          neighbor: int,
                                          source: int,
                                          destination: int,
                                          shrinkage_factor: float):
 
-        source_to_destination_trips = trips[TripFactory.create_trip(source, destination)].numer_of_trips
-        destination_to_source_trips = trips[TripFactory.create_trip(destination, source)].numer_of_trips
+        round_trips = TrafficAnalyzer._get_round_trips(trips, source, destination)
+
+        distance_matrix = CityMap.get_distance_matrix(city_map, check_roads=False)
 
-        existing_road_shortest_path = CityMap.get_shortest_path_length(city_map, neighbor, destination)
-        new_road_shortest_path = CityMap.get_shortest_path_length(city_map, source, destination)
-        neighbor_shortest_path = CityMap.get_shortest_path_length(city_map, neighbor, source)
+        existing_road_shortest_path = distance_matrix.get_distance(neighbor, destination)
+        new_road_shortest_path = distance_matrix.get_distance(source, destination)
+        neighbor_shortest_path = distance_matrix.get_distance(neighbor, source)
 
         return round(max((new_road_shortest_path -
                           (existing_road_shortest_path * shrinkage_factor + neighbor_shortest_path)), 0) *
-                     (source_to_destination_trips + destination_to_source_trips), 5)
+                     round_trips, 5)
 
     @staticmethod
     def get_benefit(benefit_matrix: DataFrame,
@@ -0,0 +1,246 @@
+from dataclasses import dataclass, field
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from traffic_simulator.csr_graph import CSRGraph
+
+
+@dataclass
+class ShortestPathForest:
+    """
+    Shortest path trees of a batch of sources, one column per source.  predecessor_roads holds the directed road of
+    the CSR graph each location is reached by, or -1 for the sources and the locations they cannot reach.
+    """
+    sources: np.ndarray
+    distances: np.ndarray
+    predecessor_roads: np.ndarray
+
+
+@dataclass
+class TrafficAssignment:
+    """
+    Number of trips on each road of a city map when every trip follows a shortest path, indexed by the undirected
+    road ids of the CSR graph.
+    """
+    version: int
+    locations: List[int]
+    road_sources: np.ndarray
+    road_destinations: np.ndarray
+    road_volumes: np.ndarray
+    unassigned_trips: int
+    _road_index: Optional[Dict[Tuple[int, int], int]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def total_volume(self) -> float:
+        return float(self.road_volumes.sum())
+
+    def get_traffic_volume(self, source: int, destination: int) -> float:
+        if self._road_index is None:
+            self._road_index = {}
+
+            for road, (road_source, road_destination) in enumerate(zip(self.road_sources.tolist(),
+                                                                       self.road_destinations.tolist())):
+                self._road_index[(road_source, road_destination)] = road
+                self._road_index[(road_destination, road_source)] = road
+
+        return float(self.road_volumes[self._road_index[(source, destination)]])
+
+    def to_road_volumes(self) -> Dict[Tuple[int, int], float]:
+        return {(self.locations[road_source], self.locations[road_destination]): road_volume
+                for road_source, road_destination, road_volume in zip(self.road_sources.tolist(),
+                                                                      self.road_destinations.tolist(),
+                                                                      self.road_volumes.tolist())}
+
+
+class TrafficAssignmentFactory:
+    @staticmethod
+    def create_traffic_assignment(csr_graph: CSRGraph,
+                                  trip_counts: np.ndarray,
+                                  weights: Optional[np.ndarray] = None,
+                                  chunk_size: int = 256) -> TrafficAssignment:
+        """
+        Assigns every trip to a shortest path between its source and destination at once.  The trips are grouped by
+        source, the shortest path trees of a chunk of sources are computed together, and the trips to each location
+        are pushed up its tree from the furthest locations to the source, so each road carries the trips of every
+        location below it.  No path is ever built for a single trip.
+
+        Parameters:
+        csr_graph:      Array representation of the city map
+        trip_counts:    Number of trips between each pair of locations, indexed by position
+        weights:        Road lengths to route with instead of the weights of the graph, one for each directed road
+        chunk_size:     Number of sources whose shortest path trees are computed together
+
+        Returns:
+        traffic_assignment: Number of trips on each road
+        """
+        number_of_roads = int(csr_graph.road_ids.max()) + 1 if len(csr_graph.road_ids) else 0
+        road_volumes = np.zeros(number_of_roads)
+        unassigned_trips = 0
+        sources = np.flatnonzero(trip_counts.any(axis=1))
+
+        for start in range(0, len(sources), chunk_size):
+            forest = TrafficAssignmentFactory.get_shortest_path_forest(csr_graph, sources[start:start + chunk_size], weights)
+            flows = trip_counts[forest.sources].T.astype(np.float64)
+            reached = forest.predecessor_roads >= 0
+
+            unassigned_trips += int(flows[~reached & ~np.isfinite(forest.distances)].sum())
+            TrafficAssignmentFactory.accumulate_flows(csr_graph, forest, flows)
+
+            road_volumes += np.bincount(csr_graph.road_ids[forest.predecessor_roads[reached]],
+                                        weights=flows[reached],
+                                        minlength=number_of_roads)
+
+        road_sources, road_destinations = TrafficAssignmentFactory.get_road_locations(csr_graph, number_of_roads)
+
+        return TrafficAssignment(version=csr_graph.version,
+                                 locations=csr_graph.locations,
+                                 road_sources=road_sources,
+                                 road_destinations=road_destinations,
+                                 road_volumes=road_volumes,
+                                 unassigned_trips=unassigned_trips)
+
+    @staticmethod
+    def get_shortest_path_forest(csr_graph: CSRGraph,
+                                 sources: np.ndarray,
+                                 weights: Optional[np.ndarray] = None) -> ShortestPathForest:
+        """
+        Computes the shortest path trees of a batch of sources together with NumPy.  Every round relaxes all roads
+        into the locations next to a location whose distance from some source dropped in the previous round, for
+        every source at once, until no distance drops.  The number of rounds is the largest number of roads on a
+        shortest path.  Locations are visited in order of decreasing number of roads, so the k-th road of every
+        location with more than k roads is relaxed with a single gather.
+
+        Parameters:
+        csr_graph:  Array representation of the city map
+        sources:    Positions of the source locations
+        weights:    Road lengths to route with instead of the weights of the graph, one for each directed road
+
+        Returns:
+        shortest_path_forest: Distances and predecessor roads of every location from each source
+        """
+        weights = csr_graph.weights if weights is None else weights
+        sources = np.asarray(sources, dtype=np.int64)
+        number_of_locations = csr_graph.number_of_locations
+        columns = np.arange(len(sources))
+
+        degrees = np.diff(csr_graph.offsets)
+        order = np.argsort(-degrees, kind='stable')
+        positions = np.empty(number_of_locations, dtype=np.int64)
+        positions[order] = np.arange(number_of_locations)
+        sorted_degrees = degrees[order]
+        sorted_offsets = csr_graph.offsets[order]
+        neighbors = positions[csr_graph.indices]
+        counts = [int(np.count_nonzero(sorted_degrees > k)) for k in range(int(sorted_degrees.max(initial=0)))]
+
+        # Roads of the locations in sorted order, so the locations next to a changed location are found with one pass
+        sorted_road_rows = np.repeat(np.arange(number_of_locations), sorted_degrees)
+        sorted_roads = np.arange(len(sorted_road_rows)) - np.repeat(np.cumsum(sorted_degrees) - sorted_degrees, sorted_degrees) + \
+            sorted_offsets[sorted_road_rows]
+        sorted_road_neighbors = neighbors[sorted_roads]
+
+        distances = np.full((number_of_locations, len(sources)), np.inf)
+        distances[positions[sources], columns] = 0.0
+        changed = np.zeros(number_of_locations, dtype=bool)
+        changed[positions[sources]] = True
+
+        while changed.any():
+            rows = np.flatnonzero(np.bincount(sorted_road_rows,
+                                              weights=changed[sorted_road_neighbors],
+                                              minlength=number_of_locations))
+            candidates = TrafficAssignmentFactory.get_candidate_distances(distances,
+                                                                          rows,
+                                                                          counts,
+                                                                          sorted_offsets,
+                                                                          neighbors,
+                                                                          weights)
+            current_distances = distances[rows]
+            improved = (candidates < current_distances).any(axis=1)
+
+            changed[:] = False
+            changed[rows[improved]] = True
+            distances[rows[improved]] = np.minimum(current_distances[improved], candidates[improved])
+
+        predecessor_roads = TrafficAssignmentFactory.get_predecessor_roads(distances,
+                                                                           counts,
+                                                                           sorted_offsets,
+                                                                           neighbors,
+                                                                           weights)
+        predecessor_roads[positions[sources], columns] = -1
+
+        return ShortestPathForest(sources=sources,
+                                  distances=distances[positions],
+                                  predecessor_roads=predecessor_roads[positions])
+
+    @staticmethod
+    def get_candidate_distances(distances: np.ndarray,
+                                rows: np.ndarray,
+                                counts: List[int],
+                                sorted_offsets: np.ndarray,
+                                neighbors: np.ndarray,
+                                weights: np.ndarray) -> np.ndarray:
+        candidates = np.full((len(rows), distances.shape[1]), np.inf)
+
+        for k, count in enumerate(counts):
+            # Rows are sorted, so the rows of locations with more than k roads come first
+            number_of_rows = int(np.searchsorted(rows, count))
+
+            if number_of_rows == 0:
+                break
+
+            roads = sorted_offsets[rows[:number_of_rows]] + k
+            road_candidates = distances[neighbors[roads]]
+            road_candidates += weights[roads][:, None]
+            np.minimum(candidates[:number_of_rows], road_candidates, out=candidates[:number_of_rows])
+
+        return candidates
+
+    @staticmethod
+    def get_predecessor_roads(distances: np.ndarray,
+                              counts: List[int],
+                              sorted_offsets: np.ndarray,
+                              neighbors: np.ndarray,
+                              weights: np.ndarray) -> np.ndarray:
+        # The first road whose relaxation gives the distance of a location is the last road of its shortest path
+        predecessor_roads = np.full(distances.shape, -1, dtype=np.int64)
+
+        for k, count in enumerate(counts):
+            roads = sorted_offsets[:count] + k
+            is_tight = (distances[neighbors[roads]] + weights[roads][:, None] == distances[:count]) & \
+                       (predecessor_roads[:count] < 0)
+            predecessor_roads[:count][is_tight] = np.broadcast_to(roads[:, None], is_tight.shape)[is_tight]
+
+        return predecessor_roads
+
+    @staticmethod
+    def accumulate_flows(csr_graph: CSRGraph, forest: ShortestPathForest, flows: np.ndarray) -> None:
+        """
+        Adds the flow of every location to its predecessor in the shortest path tree of each source, from the
+        furthest location to the source.  Afterwards the flow of a location is the number of trips on the road it is
+        reached by.  Each step moves one location of every tree, so the loop runs once per location.
+
+        Parameters:
+        csr_graph:  Array representation of the city map
+        forest:     Shortest path trees of a batch of sources
+        flows:      Number of trips from each source to each location, updated in place
+        """
+        columns = np.arange(len(forest.sources))
+
+        # A location is reached from the other end of its predecessor road
+        predecessors = np.where(forest.predecessor_roads >= 0, csr_graph.indices[forest.predecessor_roads], -1)
+        reached = predecessors >= 0
+
+        # Locations a source cannot reach sort last and carry no flow
+        order = np.argsort(np.where(reached, -forest.distances, np.inf), axis=0, kind='stable')
+        number_of_reached = int(reached.sum(axis=0).max(initial=0))
+
+        for locations in order[:number_of_reached]:
+            location_predecessors = predecessors[locations, columns]
+            is_reached = location_predecessors >= 0
+            flows[location_predecessors[is_reached], columns[is_reached]] += flows[locations[is_reached], columns[is_reached]]
+
+    @staticmethod
+    def get_road_locations(csr_graph: CSRGraph, number_of_roads: int) -> Tuple[np.ndarray, np.ndarray]:
+        road_sources = np.repeat(np.arange(csr_graph.number_of_locations), np.diff(csr_graph.offsets))
+        _, first_roads = np.unique(csr_graph.road_ids, return_index=True)
+
+        return road_sources[first_roads][:number_of_roads], csr_graph.indices[first_roads][:number_of_roads]
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+import numpy as np
+from typing import List
+
+from traffic_simulator.csr_graph import CSRGraph
+from traffic_simulator.model import EquilibriumMethod
+from traffic_simulator.traffic_assignment import TrafficAssignment, TrafficAssignmentFactory
+
+LINE_SEARCH_STEPS = 32
+
+
+@dataclass
+class TrafficEquilibrium:
+    """
+    Traffic volumes at user equilibrium, where no trip can reach its destination faster on another path, with the
+    travel time of each road at those volumes and the relative gap after each iteration of the solver.
+    """
+    traffic_assignment: TrafficAssignment
+    road_times: np.ndarray
+    relative_gaps: List[float]
+    converged: bool
+
+    @property
+    def iterations(self) -> int:
+        return len(self.relative_gaps)
+
+
+class TrafficEquilibriumFactory:
+    @staticmethod
+    def create_traffic_equilibrium(csr_graph: CSRGraph,
+                                   trip_counts: np.ndarray,
+                                   road_capacities: np.ndarray,
+                                   method: EquilibriumMethod = EquilibriumMethod.FRANK_WOLFE,
+                                   alpha: float = 0.15,
+                                   beta: float = 4.0,
+                                   max_iterations: int = 50,
+                                   tolerance: float = 1e-4,
+                                   chunk_size: int = 256) -> TrafficEquilibrium:
+        """
+        Solves the user equilibrium of the trips with congestion.  The travel time of a road grows with its volume
+        by the BPR function t = t0 * (1 + alpha * (v / c) ^ beta), where t0 is the road weight and c its capacity.
+        Each iteration assigns every trip to a shortest path at the current travel times (all or nothing) and moves
+        the volumes towards that assignment, by 1 / (k + 1) for MSA or by the step minimizing the Beckmann
+        objective for Frank-Wolfe.  The relative gap is the share of the total travel time that trips would save by
+        all switching to their current shortest paths, and is 0 at equilibrium.
+
+        Parameters:
+        csr_graph:          Array representation of the city map
+        trip_counts:        Number of trips between each pair of locations, indexed by position
+        road_capacities:    Capacity of each road, indexed by the undirected road ids of the CSR graph
+        method:             Method moving the volumes towards the all or nothing assignment
+        alpha:              Scale of the BPR function
+        beta:               Power of the BPR function
+        max_iterations:     Maximum number of all or nothing assignments after the first
+        tolerance:          Relative gap under which the volumes are at equilibrium
+        chunk_size:         Number of sources whose shortest path trees are computed together
+
+        Returns:
+        traffic_equilibrium: Traffic volumes and travel times of each road at equilibrium
+        """
+        road_capacities = np.asarray(road_capacities, dtype=np.float64)
+
+        if np.any(road_capacities <= 0):
+            raise ValueError("Road capacities must be positive")
+
+        free_flow_times = np.zeros(len(road_capacities))
+        free_flow_times[csr_graph.road_ids] = csr_graph.weights
+
+        traffic_assignment = TrafficAssignmentFactory.create_traffic_assignment(csr_graph, trip_counts, chunk_size=chunk_size)
+        road_volumes = traffic_assignment.road_volumes
+        relative_gaps = []
+
+        for iteration in range(1, max_iterations + 1):
+            road_times = TrafficEquilibriumFactory.get_road_times(free_flow_times, road_volumes, road_capacities, alpha, beta)
+            target_volumes = TrafficAssignmentFactory.create_traffic_assignment(csr_graph,
+                                                                                trip_counts,
+                                                                                road_times[csr_graph.road_ids],
+                                                                                chunk_size).road_volumes
+
+            total_time = float(road_times @ road_volumes)
+            relative_gaps.append((total_time - float(road_times @ target_volumes)) / total_time if total_time > 0 else 0.0)
+
+            if relative_gaps[-1] < tolerance:
+                break
+
+            if method == EquilibriumMethod.FRANK_WOLFE:
+                step = TrafficEquilibriumFactory.get_line_search_step(free_flow_times,
+                                                                      road_volumes,
+                                                                      target_volumes,
+                                                                      road_capacities,
+                                                                      alpha,
+                                                                      beta)
+            else:
+                step = 1 / (iteration + 1)
+
+            road_volumes = road_volumes + step * (target_volumes - road_volumes)
+
+        traffic_assignment.road_volumes = road_volumes
+
+        return TrafficEquilibrium(traffic_assignment=traffic_assignment,
+                                  road_times=TrafficEquilibriumFactory.get_road_times(free_flow_times,
+                                                                                      road_volumes,
+                                                                                      road_capacities,
+                                                                                      alpha,
+                                                                                      beta),
+                                  relative_gaps=relative_gaps,
+                                  converged=bool(relative_gaps) and relative_gaps[-1] < tolerance)
+
+    @staticmethod
+    def get_road_times(free_flow_times: np.ndarray,
+                       road_volumes: np.ndarray,
+                       road_capacities: np.ndarray,
+                       alpha: float,
+                       beta: float) -> np.ndarray:
+        return free_flow_times * (1 + alpha * (road_volumes / road_capacities) ** beta)
+
+    @staticmethod
+    def get_line_search_step(free_flow_times: np.ndarray,
+                             road_volumes: np.ndarray,
+                             target_volumes: np.ndarray,
+                             road_capacities: np.ndarray,
+                             alpha: float,
+                             beta: float) -> float:
+        # The Beckmann objective is convex along the direction, so bisect on the sign of its derivative
+        direction = target_volumes - road_volumes
+        low, high = 0.0, 1.0
+
+        for _ in range(LINE_SEARCH_STEPS):
+            step = (low + high) / 2
+            road_times = TrafficEquilibriumFactory.get_road_times(free_flow_times,
+                                                                  road_volumes + step * direction,
+                                                                  road_capacities,
+                                                                  alpha,
+                                                                  beta)
+
+            if road_times @ direction > 0:
+                high = step
+            else:
+                low = step
+
+        return (low + high) / 2
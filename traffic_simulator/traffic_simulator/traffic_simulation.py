@@ -2,98 +2,422 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import networkx as nx
 from networkx.classes.graph import Graph
-from random import randint
-from typing import Dict, Tuple
+import numpy as np
+from random import getrandbits, randint
+from typing import Dict, Iterator, Optional, Tuple, Union
+import warnings
 
 
 from traffic_simulator.city_map import CityMap
-from traffic_simulator.model import ShortestPathAlgo, TimeDeltaDiff, Trip, TripFactory
+from traffic_simulator.model import EquilibriumMethod, ShortestPathAlgo, TIME_DELTA_UNITS, TimeDeltaDiff, Trip
+from traffic_simulator.traffic_assignment import TrafficAssignment, TrafficAssignmentFactory
+from traffic_simulator.traffic_equilibrium import TrafficEquilibrium, TrafficEquilibriumFactory
+from traffic_simulator.trip_matrix import TripBatch, TripMatrix, TripMatrixFactory
 
 
 class Simulator:
     @staticmethod
     def generate_map(locations=60,
                      connectedness=0.05,
-                     step_connectedness=0.01,
+                     step_connectedness=None,
                      seed=1000,
                      min_road_weight=5,
                      max_road_weight=25) -> Graph:
+        # The city map is connected by construction, so connectedness no longer needs to be stepped up
+        if step_connectedness is not None:
+            warnings.warn("step_connectedness is deprecated and ignored, the city map is connected by construction",
+                          DeprecationWarning,
+                          stacklevel=2)
 
-        city_map = Simulator.generate_city_map(locations, connectedness, seed)
+        return Simulator.generate_connected_map(locations, connectedness, seed, min_road_weight, max_road_weight)
 
-        while not Simulator.is_connected(city_map):
-            connectedness += step_connectedness
-            city_map = Simulator.generate_city_map(locations, connectedness, seed)
+    @staticmethod
+    def generate_connected_map(locations=60,
+                               connectedness=0.05,
+                               seed=1000,
+                               min_road_weight=5,
+                               max_road_weight=25) -> Graph:
+        """
+        Generates a connected city map.  A random spanning tree connects every location, then random roads are
+        added until connectedness (the fraction of all possible roads that exist) is reached.  The road weights
+        are drawn at once from a seeded NumPy random generator.
+
+        Parameters:
+        locations:          Number of locations in the city map
+        connectedness:      Fraction of all possible roads between two locations that exist
+        seed:               Seed of the random generator, so the city map can be reproduced
+        min_road_weight:    Minimum length of a road
+        max_road_weight:    Maximum length of a road
+
+        Returns:
+        city_map: Network Graph representation of the city map
+        """
+        random_generator = np.random.default_rng(seed)
+        max_roads = locations * (locations - 1) // 2
+        number_of_roads = min(max(locations - 1, round(connectedness * max_roads)), max_roads)
+
+        # Attach every location to a random location earlier in a random order
+        order = random_generator.permutation(locations)
+        parents = (random_generator.random(locations - 1) * np.arange(1, locations)).astype(np.int64)
+        road_keys = Simulator.get_road_keys(locations, order[1:], order[parents])
+
+        while len(road_keys) < number_of_roads:
+            missing_roads = number_of_roads - len(road_keys)
+            sources, destinations = Simulator.get_random_trips(random_generator, locations, 2 * missing_roads + 16)
+            keys = Simulator.get_road_keys(locations, sources, destinations)
+
+            # Keep the first draw of each new road, in the order the roads were drawn
+            keys, first_draws = np.unique(keys, return_index=True)
+            keys = keys[np.argsort(first_draws)]
+            keys = keys[~np.isin(keys, road_keys)]
+
+            road_keys = np.concatenate((road_keys, keys[:missing_roads]))
+
+        sources, destinations = np.divmod(road_keys, locations)
+        road_weights = random_generator.integers(min_road_weight, max_road_weight + 1, len(road_keys))
+
+        city_map = nx.Graph()
+        city_map.add_nodes_from(range(locations))
+        city_map.add_weighted_edges_from(zip(sources.tolist(), destinations.tolist(), road_weights.tolist()))
+
+        return city_map
+
+    @staticmethod
+    def generate_city_map(locations: int, connectedness: float, seed: int) -> Graph:
+        warnings.warn("generate_city_map is deprecated, use generate_connected_map, which connects the city map by "
+                      "construction",
+                      DeprecationWarning,
+                      stacklevel=2)
+
+        return Simulator.generate_connected_map(locations, connectedness, seed)
+
+    @staticmethod
+    def is_connected(city_map: Graph) -> bool:
+        warnings.warn("is_connected is deprecated, the city maps of generate_map are connected by construction",
+                      DeprecationWarning,
+                      stacklevel=2)
 
-        for x, y, attr in city_map.edges(data=True):
-            attr['weight'] = randint(min_road_weight, max_road_weight)
+        return nx.is_connected(city_map)
+
+    @staticmethod
+    def generate_grid_map(rows=8,
+                          columns=8,
+                          seed=1000,
+                          min_road_weight=5,
+                          max_road_weight=25,
+                          max_detour=1.25) -> Graph:
+        """
+        Generates a connected city map laid out like a street grid.  Each location is placed near its grid point and
+        stored with its coordinates under 'pos', and roads join neighboring locations on the grid.  The length of a
+        road is its straight line length, scaled so a grid step is the average road weight, times a random detour,
+        so A* can be directed by the straight line distance to the destination.
+
+        Parameters:
+        rows:               Number of rows of locations
+        columns:            Number of columns of locations
+        seed:               Seed of the random generator, so the city map can be reproduced
+        min_road_weight:    Minimum length of a road
+        max_road_weight:    Maximum length of a road
+        max_detour:         Maximum ratio of the length of a road to the straight line between its locations
+
+        Returns:
+        city_map: Network Graph representation of the city map
+        """
+        random_generator = np.random.default_rng(seed)
+        locations = np.arange(rows * columns).reshape(rows, columns)
+        row_positions, column_positions = np.divmod(locations.ravel(), columns)
+        coordinates = np.column_stack((column_positions, row_positions)) + random_generator.uniform(-0.3, 0.3, (rows * columns, 2))
+
+        sources = np.concatenate((locations[:, :-1].ravel(), locations[:-1, :].ravel()))
+        destinations = np.concatenate((locations[:, 1:].ravel(), locations[1:, :].ravel()))
+        straight_line_lengths = np.hypot(*(coordinates[sources] - coordinates[destinations]).T)
+        detours = random_generator.uniform(1, max_detour, len(sources))
+        road_weights = np.clip(np.rint(straight_line_lengths * detours * (min_road_weight + max_road_weight) / 2),
+                               min_road_weight,
+                               max_road_weight)
+
+        city_map = nx.Graph()
+        city_map.add_nodes_from((location, {'pos': tuple(coordinate)})
+                                for location, coordinate in zip(locations.ravel().tolist(), coordinates.tolist()))
+        city_map.add_weighted_edges_from(zip(sources.tolist(), destinations.tolist(), road_weights.tolist()))
 
         return city_map
 
+    @staticmethod
+    def get_road_keys(locations: int, sources: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        return np.minimum(sources, destinations) * locations + np.maximum(sources, destinations)
+
     @staticmethod
     def generate_trips(city_map: Graph,
                        traffic_start_date: datetime,
                        traffic_end_date: datetime,
-                       traffic_time_delta_difference: TimeDeltaDiff
+                       traffic_time_delta_difference: TimeDeltaDiff,
+                       seed: Optional[int] = None,
+                       random_generator: Optional[np.random.Generator] = None
                        ) -> Dict[Trip, Trip]:
-        trips = {}
+        return Simulator.generate_trip_matrix(city_map,
+                                              traffic_start_date,
+                                              traffic_end_date,
+                                              traffic_time_delta_difference,
+                                              seed,
+                                              random_generator=random_generator).to_trips()
 
-        for _ in range(Simulator.get_number_trips_to_generate(traffic_start_date,
-                                                        traffic_end_date,
-                                                        traffic_time_delta_difference)):
-            source, destination = Simulator.get_random_locations(city_map)
-            trip = TripFactory.create_trip(source, destination)
+    @staticmethod
+    def generate_trip_matrix(city_map: Graph,
+                             traffic_start_date: datetime,
+                             traffic_end_date: datetime,
+                             traffic_time_delta_difference: TimeDeltaDiff,
+                             seed: Optional[int] = None,
+                             chunk_size: int = 1_000_000,
+                             sparse: bool = False,
+                             random_generator: Optional[np.random.Generator] = None) -> TripMatrix:
+        """
+        Generates one trip between two random locations for each time delta between the traffic start and end
+        dates.  The trips are drawn in chunks from a NumPy random generator and counted per pair of locations, so
+        the memory used is bounded by the chunk size and the trip matrix.
+
+        Parameters:
+        city_map:                       Network Graph representation of the city map
+        traffic_start_date:             Start of the traffic window
+        traffic_end_date:               End of the traffic window
+        traffic_time_delta_difference:  Time delta at which a trip is generated
+        seed:                           Seed of the random generator, so the trips can be reproduced, drawn from
+                                        the random module if not given
+        chunk_size:                     Number of trips drawn at once
+        sparse:                         Only store the pairs of locations with trips
+        random_generator:               Random generator to draw the trips from instead of seeding one
+
+        Returns:
+        trip_matrix: Number of trips between each pair of locations
+        """
+        locations = list(city_map.nodes())
+        number_of_locations = len(locations)
+        number_of_trips = Simulator.get_number_trips_to_generate(traffic_start_date,
+                                                                 traffic_end_date,
+                                                                 traffic_time_delta_difference)
+        random_generator = Simulator.get_random_generator(seed, random_generator)
+
+        trip_keys = np.empty(0, dtype=np.int64)
+        trip_counts = np.zeros(0 if sparse else number_of_locations * number_of_locations, dtype=np.int64)
+
+        for start in range(0, number_of_trips, chunk_size):
+            sources, destinations = Simulator.get_random_trips(random_generator,
+                                                               number_of_locations,
+                                                               min(chunk_size, number_of_trips - start))
+            keys = sources * number_of_locations + destinations
+
+            if sparse:
+                keys, counts = np.unique(keys, return_counts=True)
+                trip_keys, inverse = np.unique(np.concatenate((trip_keys, keys)), return_inverse=True)
+                trip_counts = np.bincount(inverse.ravel(),
+                                          weights=np.concatenate((trip_counts, counts)),
+                                          minlength=len(trip_keys)).astype(np.int64)
+            else:
+                trip_counts += np.bincount(keys, minlength=number_of_locations * number_of_locations)
 
-            if trip not in trips:
-                trips[trip] = trip
+        if sparse:
+            return TripMatrix(locations=locations,
+                              location_index={location: i for i, location in enumerate(locations)},
+                              trip_keys=trip_keys,
+                              trip_values=trip_counts.astype(np.int32))
 
-            trips[trip].numer_of_trips += 1
+        return TripMatrix(locations=locations,
+                          location_index={location: i for i, location in enumerate(locations)},
+                          trip_counts=trip_counts.astype(np.int32).reshape(number_of_locations, number_of_locations))
 
-        return trips
+    @staticmethod
+    def generate_trip_batches(city_map: Graph,
+                              traffic_start_date: datetime,
+                              traffic_end_date: datetime,
+                              traffic_time_delta_difference: TimeDeltaDiff,
+                              slice_time_delta_difference: TimeDeltaDiff = TimeDeltaDiff.HOURS,
+                              seed: Optional[int] = None,
+                              random_generator: Optional[np.random.Generator] = None) -> Iterator[TripBatch]:
+        """
+        Generates one trip between two random locations for each time delta between the traffic start and end
+        dates, one time slice at a time.  Each batch holds the trips starting in its slice with their timestamps,
+        so only one slice is in memory at once however long the traffic window is.
+
+        Parameters:
+        city_map:                       Network Graph representation of the city map
+        traffic_start_date:             Start of the traffic window
+        traffic_end_date:               End of the traffic window
+        traffic_time_delta_difference:  Time delta at which a trip is generated
+        slice_time_delta_difference:    Length of each time slice, at least the time delta of the trips
+        seed:                           Seed of the random generator, so the trips can be reproduced, drawn from
+                                        the random module if not given
+        random_generator:               Random generator to draw the trips from instead of seeding one
+
+        Returns:
+        trip_batches: Trips of each time slice, in time order
+        """
+        time_delta_differences = list(TimeDeltaDiff)
+
+        if time_delta_differences.index(slice_time_delta_difference) < time_delta_differences.index(traffic_time_delta_difference):
+            raise ValueError(f"Time slices of {slice_time_delta_difference.value} are shorter than the time delta "
+                             f"of the trips, {traffic_time_delta_difference.value}")
+
+        locations = list(city_map.nodes())
+        random_generator = Simulator.get_random_generator(seed, random_generator)
+        slice_start_date = traffic_start_date
+        number_of_slices = 0
+
+        while slice_start_date < traffic_end_date:
+            number_of_slices += 1
+            slice_end_date = min(traffic_start_date + relativedelta(**{slice_time_delta_difference.value: number_of_slices}),
+                                 traffic_end_date)
+            timestamps = Simulator.get_trip_timestamps(slice_start_date, slice_end_date, traffic_time_delta_difference)
+            sources, destinations = Simulator.get_random_trips(random_generator, len(locations), len(timestamps))
+
+            yield TripBatch(start_date=slice_start_date,
+                            end_date=slice_end_date,
+                            locations=locations,
+                            sources=sources,
+                            destinations=destinations,
+                            timestamps=timestamps)
+
+            slice_start_date = slice_end_date
 
     @staticmethod
-    def generate_city_map(locations: int, connectedness: float, seed: int):
-        return nx.gnm_random_graph(locations, connectedness, seed)
+    def get_trip_timestamps(start_date: datetime, end_date: datetime, time_delta_difference: TimeDeltaDiff) -> np.ndarray:
+        if time_delta_difference in TIME_DELTA_UNITS:
+            return np.arange(np.datetime64(start_date, 's'),
+                             np.datetime64(end_date, 's'),
+                             np.timedelta64(1, TIME_DELTA_UNITS[time_delta_difference]))
+
+        timestamps = []
+
+        while start_date + relativedelta(**{time_delta_difference.value: len(timestamps)}) < end_date:
+            timestamps.append(start_date + relativedelta(**{time_delta_difference.value: len(timestamps)}))
+
+        return np.array(timestamps, dtype='datetime64[s]')
 
     @staticmethod
-    def is_connected(city_map: Graph) -> bool:
-        return nx.is_connected(city_map)
+    def get_random_generator(seed: Optional[int] = None,
+                             random_generator: Optional[np.random.Generator] = None) -> np.random.Generator:
+        if random_generator is not None:
+            return random_generator
+
+        # Without a seed the generator is seeded from the random module, so random.seed still reproduces the trips
+        return np.random.default_rng(getrandbits(64) if seed is None else seed)
+
+    @staticmethod
+    def get_random_trips(random_generator: np.random.Generator,
+                         number_of_locations: int,
+                         number_of_trips: int) -> Tuple[np.ndarray, np.ndarray]:
+        sources = random_generator.integers(0, number_of_locations, number_of_trips)
+
+        # Draw the destination from the other locations, so no trip starts and ends at the same location
+        destinations = random_generator.integers(0, number_of_locations - 1, number_of_trips)
+        destinations += destinations >= sources
+
+        return sources, destinations
 
     @staticmethod
     def get_number_trips_to_generate(traffic_start_date: datetime,
                                      traffic_end_date: datetime,
-                                     traffic_time_delta_difference):
-        difference = relativedelta(traffic_end_date, traffic_start_date)
-
-        if traffic_time_delta_difference == TimeDeltaDiff.SECONDS:
-            return int((traffic_end_date - traffic_start_date).total_seconds())
-        elif traffic_time_delta_difference == TimeDeltaDiff.MINUTES:
-            return int(difference.minutes)
-        elif traffic_time_delta_difference == TimeDeltaDiff.HOURS:
-            return int(difference.hours)
-        elif traffic_time_delta_difference == TimeDeltaDiff.DAYS:
-            return int(difference.days)
-        elif traffic_time_delta_difference == TimeDeltaDiff.DAYS:
-            return int(relativedelta(traffic_start_date - traffic_end_date).months)
-        elif traffic_time_delta_difference == TimeDeltaDiff.YEARS:
-            return int(difference.years)
+                                     traffic_time_delta_difference: TimeDeltaDiff) -> int:
+        # One trip starts every time delta from the start of the traffic window until its end, as get_trip_timestamps
+        # lays them out, so a trip matrix and the trip batches of the same window hold the same number of trips
+        if traffic_time_delta_difference in TIME_DELTA_UNITS:
+            window = np.datetime64(traffic_end_date, 's') - np.datetime64(traffic_start_date, 's')
+            time_delta = np.timedelta64(1, TIME_DELTA_UNITS[traffic_time_delta_difference])
+
+            return max(0, -int(-window // time_delta))
+
+        return len(Simulator.get_trip_timestamps(traffic_start_date, traffic_end_date, traffic_time_delta_difference))
 
     @staticmethod
     def generate_traffic(city_map: Graph, source: int, destination: int, shortest_path_algo: ShortestPathAlgo) -> None:
         road_ids = CityMap.get_shortest_path(city_map, source, destination, shortest_path_algo)
-        i = 0
 
-        while i < len(road_ids):
-            current_location = road_ids[i]
-            next_location = road_ids[i]
+        for current_location, next_location in zip(road_ids, road_ids[1:]):
             metadata = city_map.edges[current_location, next_location]
+            metadata['traffic_volume'] = metadata.get('traffic_volume', 0) + 1
 
-            if not metadata['traffic_volume']:
-                metadata['traffic_volume'] = 0
-            else:
-                metadata['traffic_volume'] += 1
+    @staticmethod
+    def assign_traffic(city_map: Graph,
+                       trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray],
+                       chunk_size: int = 256) -> TrafficAssignment:
+        """
+        Routes every trip along a shortest path and stores the number of trips on each road as its 'traffic_volume'.
+        Unlike calling generate_traffic once per trip, the trips are grouped by source and assigned in bulk from the
+        shortest path trees of the sources, so a year of trips takes one tree per location.
+
+        Parameters:
+        city_map:   Network Graph representation of the city map
+        trips:      Trips, trip matrix, or number of trips between each pair of locations in node order
+        chunk_size: Number of sources whose shortest path trees are computed together
+
+        Returns:
+        traffic_assignment: Number of trips on each road
+        """
+        traffic_assignment = TrafficAssignmentFactory.create_traffic_assignment(CityMap.get_csr_graph(city_map),
+                                                                                Simulator.get_trip_counts(city_map, trips),
+                                                                                chunk_size=chunk_size)
+
+        for (source, destination), traffic_volume in traffic_assignment.to_road_volumes().items():
+            city_map.edges[source, destination]['traffic_volume'] = traffic_volume
+
+        return traffic_assignment
+
+    @staticmethod
+    def assign_equilibrium_traffic(city_map: Graph,
+                                   trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray],
+                                   road_capacity: float = 1000.0,
+                                   method: EquilibriumMethod = EquilibriumMethod.FRANK_WOLFE,
+                                   max_iterations: int = 50,
+                                   tolerance: float = 1e-4,
+                                   chunk_size: int = 256) -> TrafficEquilibrium:
+        """
+        Routes the trips at user equilibrium, where congested roads are slower, and stores the number of trips on
+        each road as its 'traffic_volume' and its congested travel time as its 'travel_time'.  The capacity of a road
+        is its 'capacity' if it has one.
+
+        Parameters:
+        city_map:       Network Graph representation of the city map
+        trips:          Trips, trip matrix, or number of trips between each pair of locations in node order
+        road_capacity:  Capacity of the roads without a 'capacity'
+        method:         Method moving the volumes towards the all or nothing assignment of each iteration
+        max_iterations: Maximum number of iterations of the solver
+        tolerance:      Relative gap under which the volumes are at equilibrium
+        chunk_size:     Number of sources whose shortest path trees are computed together
+
+        Returns:
+        traffic_equilibrium: Traffic volumes and travel times of each road, and the relative gap of each iteration
+        """
+        csr_graph = CityMap.get_csr_graph(city_map)
+        road_sources, road_destinations = TrafficAssignmentFactory.get_road_locations(csr_graph,
+                                                                                      int(csr_graph.road_ids.max(initial=-1)) + 1)
+        road_capacities = np.array([city_map.edges[csr_graph.locations[road_source],
+                                                   csr_graph.locations[road_destination]].get('capacity', road_capacity)
+                                    for road_source, road_destination in zip(road_sources.tolist(), road_destinations.tolist())],
+                                   dtype=np.float64)
+
+        traffic_equilibrium = TrafficEquilibriumFactory.create_traffic_equilibrium(csr_graph,
+                                                                                   Simulator.get_trip_counts(city_map, trips),
+                                                                                   road_capacities,
+                                                                                   method,
+                                                                                   max_iterations=max_iterations,
+                                                                                   tolerance=tolerance,
+                                                                                   chunk_size=chunk_size)
+
+        for road_source, road_destination, traffic_volume, travel_time in zip(road_sources.tolist(),
+                                                                             road_destinations.tolist(),
+                                                                             traffic_equilibrium.traffic_assignment.road_volumes.tolist(),
+                                                                             traffic_equilibrium.road_times.tolist()):
+            metadata = city_map.edges[csr_graph.locations[road_source], csr_graph.locations[road_destination]]
+            metadata['traffic_volume'] = traffic_volume
+            metadata['travel_time'] = travel_time
+
+        return traffic_equilibrium
+
+    @staticmethod
+    def get_trip_counts(city_map: Graph, trips: Union[Dict[Trip, Trip], TripMatrix, np.ndarray]) -> np.ndarray:
+        if isinstance(trips, dict):
+            trips = TripMatrixFactory.create_trip_matrix_from_trips(city_map, trips)
 
-            i = +1
+        return trips.to_dense(list(city_map.nodes())) if isinstance(trips, TripMatrix) else np.asarray(trips)
 
     @staticmethod
     def get_random_locations(city_map: Graph) -> Tuple[int, int]:
@@ -0,0 +1,210 @@
+from collections.abc import MutableMapping
+import numpy as np
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+ID = "id"
+INITIAL_CAPACITY = 8
+
+
+class RoadMetadata(MutableMapping):
+    """
+    Metadata of one road of a trip linked list.  It reads from and writes through to the arrays of the trip, so
+    changing it changes the road, as changing the metadata dict of a linked list node did.
+    """
+    __slots__ = ("trip", "index")
+
+    def __init__(self, trip: "TripLinkedList", index: int):
+        self.trip = trip
+        self.index = index
+
+    def __getitem__(self, key: str) -> Any:
+        if not self.trip.has_value(self.index, key):
+            raise KeyError(key)
+
+        return self.trip.get_value(self.index, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.trip.set_value(self.index, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if not self.trip.has_value(self.index, key):
+            raise KeyError(key)
+
+        self.trip.delete_value(self.index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in list(self.trip.keys) if self.trip.has_value(self.index, key))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class RoadView:
+    """
+    One road of a trip linked list, read from its arrays when accessed.  It has the metadata and next of a linked
+    list node, so a trip can still be walked from its head.
+    """
+    __slots__ = ("trip", "index")
+
+    def __init__(self, trip: "TripLinkedList", index: int):
+        self.trip = trip
+        self.index = index
+
+    @property
+    def node_id(self) -> Any:
+        return self.trip.get_value(self.index, ID) if self.trip.has_value(self.index, ID) else -1
+
+    @property
+    def metadata(self) -> RoadMetadata:
+        return RoadMetadata(self.trip, self.index)
+
+    @property
+    def next(self) -> Optional["RoadView"]:
+        return RoadView(self.trip, self.index + 1) if self.index + 1 < len(self.trip) else None
+
+
+class TripLinkedList:
+    """
+    Roads of a trip in order, stored as one NumPy array per metadata key, so appending a road is amortized O(1) and a
+    trip of n roads takes a few arrays instead of n linked nodes.  The node id of a road is its 'id'.  A metadata key
+    missing from some roads is masked out for them.
+    """
+    __slots__ = ("size", "capacity", "_columns", "_masks")
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.size = 0
+        self.capacity = max(capacity, 1)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[RoadView]:
+        return (RoadView(self, index) for index in range(self.size))
+
+    @property
+    def head(self) -> Optional[RoadView]:
+        return RoadView(self, 0) if self.size else None
+
+    @property
+    def keys(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    @property
+    def node_ids(self) -> np.ndarray:
+        # Roads without an id have node id -1
+        if ID not in self._columns:
+            return np.full(self.size, -1, dtype=np.int64)
+
+        node_ids, has_node_ids = self.get_column(ID)
+
+        return np.where(has_node_ids, node_ids, -1)
+
+    def get_column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self._columns[key][:self.size], self._masks[key][:self.size]
+
+    def has_value(self, index: int, key: str) -> bool:
+        return key in self._masks and index < self.size and bool(self._masks[key][index])
+
+    def get_value(self, index: int, key: str) -> Any:
+        value = self._columns[key][index]
+
+        return value.item() if isinstance(value, np.generic) else value
+
+    def set_value(self, index: int, key: str, value: Any) -> None:
+        # Tuples, lists and other values that are not a single number or string are kept as Python objects
+        self._prepare_column(key, np.asarray(value).dtype if np.isscalar(value) else np.dtype(object))
+        self._columns[key][index] = value
+        self._masks[key][index] = True
+
+    def delete_value(self, index: int, key: str) -> None:
+        self._masks[key][index] = False
+
+    def get_metadata(self, index: int) -> Dict[str, Any]:
+        return dict(RoadMetadata(self, index))
+
+    def insert(self, metadata: Dict[str, Any]) -> None:
+        self._add_road(metadata)
+
+    def append(self, node_id: int, **attributes: Any) -> None:
+        self._add_road({ID: node_id, **attributes})
+
+    def extend(self, node_ids: Sequence[int], **columns: Sequence[Any]) -> None:
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+
+        if self.size + len(node_ids) > self.capacity:
+            self._grow(max(2 * self.size, self.size + len(node_ids)))
+
+        for key, values in {ID: node_ids, **columns}.items():
+            values = TripLinkedList._get_column_values(values)
+            self._prepare_column(key, values.dtype)
+            self._columns[key][self.size:self.size + len(node_ids)] = values
+            self._masks[key][self.size:self.size + len(node_ids)] = True
+
+        self.size += len(node_ids)
+
+    @staticmethod
+    def _get_column_values(values: Sequence[Any]) -> np.ndarray:
+        try:
+            column_values = np.asarray(values)
+        except ValueError:
+            column_values = None
+
+        if column_values is not None and column_values.ndim == 1:
+            return column_values
+
+        # Each road has a sequence of its own, so the values go in a one dimensional object array
+        column_values = np.empty(len(values), dtype=object)
+
+        for i, value in enumerate(values):
+            column_values[i] = value
+
+        return column_values
+
+    def _add_road(self, metadata: Dict[str, Any]) -> None:
+        if self.size == self.capacity:
+            self._grow(2 * self.size)
+
+        for key, value in metadata.items():
+            self.set_value(self.size, key, value)
+
+        self.size += 1
+
+    def _prepare_column(self, key: str, dtype: np.dtype) -> None:
+        if key in self._columns:
+            if np.can_cast(dtype, self._columns[key].dtype):
+                return
+
+            # Promote the column, so an int column holding a float does not truncate it
+            dtype = np.result_type(self._columns[key].dtype, dtype) if dtype.kind in "biuf" else np.dtype(object)
+
+        # Strings and other Python objects keep their values as they are
+        if dtype.kind not in "biuf":
+            dtype = np.dtype(object)
+
+        if key in self._columns:
+            self._columns[key] = self._columns[key].astype(dtype)
+        else:
+            self._columns[key] = np.empty(self.capacity, dtype=dtype)
+            self._masks[key] = np.zeros(self.capacity, dtype=bool)
+
+    def _grow(self, capacity: int) -> None:
+        self.capacity = capacity
+
+        for key in self._columns:
+            self._columns[key] = np.resize(self._columns[key], capacity)
+            self._masks[key] = np.resize(self._masks[key], capacity)
+            self._masks[key][self.size:] = False
+
+
+class TripLinkedListFactory:
+    @staticmethod
+    def create_trip_linked_list(node_ids: Sequence[int], **columns: Sequence[Any]) -> TripLinkedList:
+        trip = TripLinkedList(capacity=len(node_ids))
+        trip.extend(node_ids, **columns)
+
+        return trip
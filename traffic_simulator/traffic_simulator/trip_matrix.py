@@ -0,0 +1,193 @@
+from dataclasses import dataclass
+from datetime import datetime
+from networkx.classes.graph import Graph
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+from traffic_simulator.model import Trip, TripFactory
+
+
+@dataclass
+class TripMatrix:
+    """
+    Number of trips between each pair of locations, indexed by the position of each location in the city map.
+    Dense trip matrices store an int32 origin-destination matrix, which takes 4 * n^2 bytes for n locations.
+    Sparse trip matrices only store the pairs with trips as sorted row-major keys (row * n + column) and their
+    int32 counts, which takes 12 bytes for each pair with trips.
+    """
+    locations: List[int]
+    location_index: Dict[int, int]
+    trip_counts: Optional[np.ndarray] = None
+    trip_keys: Optional[np.ndarray] = None
+    trip_values: Optional[np.ndarray] = None
+
+    @property
+    def is_sparse(self) -> bool:
+        return self.trip_counts is None
+
+    @property
+    def nbytes(self) -> int:
+        if self.is_sparse:
+            return self.trip_keys.nbytes + self.trip_values.nbytes
+        else:
+            return self.trip_counts.nbytes
+
+    def get_trips(self, source: int, destination: int) -> int:
+        source_index = self.location_index[source]
+        destination_index = self.location_index[destination]
+
+        if self.is_sparse:
+            key = source_index * len(self.locations) + destination_index
+            position = np.searchsorted(self.trip_keys, key)
+
+            if position < len(self.trip_keys) and self.trip_keys[position] == key:
+                return int(self.trip_values[position])
+
+            return 0
+        else:
+            return int(self.trip_counts[source_index, destination_index])
+
+    def get_round_trips(self, source: int, destination: int) -> int:
+        return self.get_trips(source, destination) + self.get_trips(destination, source)
+
+    def to_dense(self, locations: Optional[List[int]] = None) -> np.ndarray:
+        if self.is_sparse:
+            trip_counts = np.zeros(len(self.locations) * len(self.locations), dtype=np.int32)
+            trip_counts[self.trip_keys] = self.trip_values
+            trip_counts = trip_counts.reshape(len(self.locations), len(self.locations))
+        else:
+            trip_counts = self.trip_counts
+
+        if locations is None or locations == self.locations:
+            return trip_counts
+
+        positions = [self.location_index[location] for location in locations]
+
+        return trip_counts[np.ix_(positions, positions)]
+
+    def get_symmetric_trip_counts(self) -> np.ndarray:
+        return TripMatrix.sum_round_trips(self.to_dense())
+
+    @staticmethod
+    def sum_round_trips(trip_counts: np.ndarray) -> np.ndarray:
+        # The counts of both directions are summed in int64, since their sum can overflow the int32 counts
+        trip_counts = trip_counts.astype(np.int64, copy=False)
+
+        return trip_counts + trip_counts.T
+
+    def to_trips(self) -> Dict[Trip, Trip]:
+        trips = {}
+
+        if self.is_sparse:
+            source_indices, destination_indices = np.divmod(self.trip_keys, len(self.locations))
+            numbers_of_trips = self.trip_values
+        else:
+            source_indices, destination_indices = np.nonzero(self.trip_counts)
+            numbers_of_trips = self.trip_counts[source_indices, destination_indices]
+
+        for source_index, destination_index, number_of_trips in zip(source_indices.tolist(),
+                                                                    destination_indices.tolist(),
+                                                                    numbers_of_trips.tolist()):
+            trip = TripFactory.create_trip(self.locations[source_index],
+                                           self.locations[destination_index],
+                                           number_of_trips)
+            trips[trip] = trip
+
+        return trips
+
+
+@dataclass
+class TripBatch:
+    """
+    Trips of one time slice of a traffic window, one entry per trip with the positions of its source and
+    destination locations and the time it starts.  A slice covers [start_date, end_date).
+    """
+    start_date: datetime
+    end_date: datetime
+    locations: List[int]
+    sources: np.ndarray
+    destinations: np.ndarray
+    timestamps: np.ndarray
+
+    @property
+    def number_of_trips(self) -> int:
+        return len(self.sources)
+
+    def to_trip_matrix(self, sparse: bool = False) -> TripMatrix:
+        return TripMatrixFactory.create_trip_matrix(self.locations, self.sources, self.destinations, sparse=sparse)
+
+    def to_trips(self) -> Dict[Trip, Trip]:
+        return self.to_trip_matrix(sparse=True).to_trips()
+
+
+class TripMatrixFactory:
+    @staticmethod
+    def create_trip_matrix(locations: List[int],
+                           sources: np.ndarray,
+                           destinations: np.ndarray,
+                           numbers_of_trips: Optional[np.ndarray] = None,
+                           sparse: bool = False) -> TripMatrix:
+        """
+        Creates a trip matrix from the positions of the source and destination of each trip.
+
+        Parameters:
+        locations:          Locations of the city map
+        sources:            Position of the source location of each trip
+        destinations:       Position of the destination location of each trip
+        numbers_of_trips:   Number of trips between each source and destination, one trip each if not given
+        sparse:             Only store the pairs of locations with trips
+
+        Returns:
+        trip_matrix: Number of trips between each pair of locations
+        """
+        location_index = {location: i for i, location in enumerate(locations)}
+        keys = np.asarray(sources, dtype=np.int64) * len(locations) + np.asarray(destinations, dtype=np.int64)
+
+        if sparse:
+            trip_keys, inverse = np.unique(keys, return_inverse=True)
+            trip_values = np.bincount(inverse.ravel(), weights=numbers_of_trips, minlength=len(trip_keys))
+            has_trips = trip_values > 0
+
+            return TripMatrix(locations=locations,
+                              location_index=location_index,
+                              trip_keys=trip_keys[has_trips],
+                              trip_values=trip_values[has_trips].astype(np.int32))
+
+        trip_counts = np.bincount(keys, weights=numbers_of_trips, minlength=len(locations) * len(locations))
+
+        return TripMatrix(locations=locations,
+                          location_index=location_index,
+                          trip_counts=trip_counts.astype(np.int32).reshape(len(locations), len(locations)))
+
+    @staticmethod
+    def create_trip_matrix_from_trips(city_map: Graph, trips: Dict[Trip, Trip], sparse: bool = False) -> TripMatrix:
+        locations = list(city_map.nodes())
+        location_index = {location: i for i, location in enumerate(locations)}
+
+        sources = np.fromiter((location_index[trip.source] for trip in trips.values()), dtype=np.int64, count=len(trips))
+        destinations = np.fromiter((location_index[trip.destination] for trip in trips.values()), dtype=np.int64, count=len(trips))
+        numbers_of_trips = np.fromiter((trip.numer_of_trips for trip in trips.values()), dtype=np.int64, count=len(trips))
+
+        return TripMatrixFactory.create_trip_matrix(locations, sources, destinations, numbers_of_trips, sparse)
+
+    @staticmethod
+    def create_trip_matrix_from_batches(locations: List[int], trip_batches: Iterable[TripBatch]) -> TripMatrix:
+        """
+        Counts the trips of a stream of trip batches, so only one batch and the trip matrix are in memory at once.
+
+        Parameters:
+        locations:      Locations of the city map
+        trip_batches:   Trips of each time slice
+
+        Returns:
+        trip_matrix: Number of trips between each pair of locations
+        """
+        trip_counts = np.zeros(len(locations) * len(locations), dtype=np.int64)
+
+        for trip_batch in trip_batches:
+            trip_counts += np.bincount(trip_batch.sources * len(locations) + trip_batch.destinations,
+                                       minlength=len(trip_counts))
+
+        return TripMatrix(locations=locations,
+                          location_index={location: i for i, location in enumerate(locations)},
+                          trip_counts=trip_counts.astype(np.int32).reshape(len(locations), len(locations)))